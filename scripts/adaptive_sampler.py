@@ -0,0 +1,174 @@
+import logging
+import math
+import os
+import queue
+import random
+import threading
+from pathlib import Path
+from typing import Dict
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from instance_generator import FlatZincInstanceGenerator
+from minizinc_wrapper import ResourceLimits
+from schemas import Constants, Schemas
+from testdriver import Testdriver
+
+"""
+Samples variable orderings per model in rounds and runs them through the Testdriver workers.
+A model stops receiving new samples once the confidence intervals of its failures and solveTime are narrow enough,
+so solver time is only spent on models whose statistics are still uncertain.
+"""
+class AdaptiveSampler:
+
+    z_scores = {0.90: 1.645, 0.95: 1.960, 0.99: 2.576}
+    converged_metrics = [Constants.FAILURES, Constants.SOLVE_TIME]
+
+    def __init__(self, feature_vector_parquet: Path, instances_parquet_output: Path, output_folder: Path, log_path: Path,
+                 max_perms: int, round_size: int = 50, min_samples: int = 30, target_width: float = 0.1,
+                 confidence: float = 0.95, strategy: str = "stratified", seed: int = None, limits: ResourceLimits = None):
+        """
+        :param max_perms: upper bound of orderings per model, reached only if the statistics never converge
+        :param round_size: orderings solved per model and round
+        :param min_samples: orderings a model needs before convergence is checked
+        :param target_width: width of the confidence interval relative to the mean at which a model is converged
+        :param confidence: confidence level of the interval, one of z_scores
+        :param strategy: "uniform" or "stratified", see FlatZincInstanceGenerator.sample_permutation_ranks
+        """
+        if confidence not in AdaptiveSampler.z_scores:
+            raise ValueError(f"Confidence must be one of {list(AdaptiveSampler.z_scores)}")
+
+        self.feature_vector_parquet = feature_vector_parquet
+        self.instances_output = instances_parquet_output
+        self.output_folder = output_folder
+        self.log_path = log_path
+        self.max_permutations = max_perms
+        self.round_size = round_size
+        self.min_samples = min_samples
+        self.target_width = target_width
+        self.z = AdaptiveSampler.z_scores[confidence]
+        self.strategy = strategy
+        self.rng = random.Random(seed)
+        self.limits = limits
+        self.num_workers = max(1, Testdriver.num_workers)
+
+        os.makedirs(self.output_folder, exist_ok=True)
+        os.makedirs(self.log_path, exist_ok=True)
+
+    @staticmethod
+    def relative_ci_width(values: list[float], z: float) -> float:
+        """
+        Width of the normal approximation confidence interval of the mean, relative to the mean.
+        Returns 0 for constant samples and infinity if the width can not be related to the mean.
+        """
+        n = len(values)
+        if n < 2:
+            return math.inf
+        mean = sum(values) / n
+        variance = sum((v - mean) ** 2 for v in values) / (n - 1)
+        if variance == 0:
+            return 0.0
+        if mean == 0:
+            return math.inf
+        return 2 * z * math.sqrt(variance / n) / abs(mean)
+
+    def is_converged(self, results: list[Dict]) -> bool:
+        if len(results) < self.min_samples:
+            return False
+        return all(
+            AdaptiveSampler.relative_ci_width([r[metric] for r in results], self.z) <= self.target_width
+            for metric in AdaptiveSampler.converged_metrics
+        )
+
+    def solve_round(self, jobs: list[Dict], feature_vectors: dict[str, Dict], logger: Testdriver.JobLogger) -> (list[Dict], list[int]):
+        """
+        Solves one round of jobs with the Testdriver workers.
+        :return: the results and the ids of the failed jobs
+        """
+        job_queue = queue.Queue()
+        result_queue = queue.Queue()
+        batch_size = max(1, min(Testdriver.job_batch_size, len(jobs) // self.num_workers))    # keeps all workers busy on small rounds
+        for i in range(0, len(jobs), batch_size):
+            job_queue.put_nowait(jobs[i:i + batch_size])
+
+        threads = []
+        for _ in range(min(self.num_workers, job_queue.qsize())):
+            t = threading.Thread(target=Testdriver.worker, args=(job_queue, result_queue, feature_vectors, logger, 0, self.limits))
+            t.start()
+            threads.append(t)
+        for t in threads:
+            t.join()
+
+        results, failed = [], []
+        while not result_queue.empty():
+            batch = result_queue.get_nowait()
+            results.extend(batch.results.to_pylist())
+            failed.extend(batch.failed)
+        return results, failed
+
+    def existing_results(self) -> dict[str, list[Dict]]:
+        """Results of earlier runs into the output folder per model, with the metrics convergence is checked on."""
+        if not self.output_folder.exists() or not any(self.output_folder.glob("**/*.parquet")):
+            return {}
+        table = pq.ParquetDataset(self.output_folder, schema=Schemas.Parquet.instance_results).read(
+            columns=[Constants.MODEL_NAME] + AdaptiveSampler.converged_metrics)
+        results = {}
+        for row in table.to_pylist():
+            results.setdefault(row[Constants.MODEL_NAME], []).append(row)
+        return results
+
+    def write_parquet(self, buffer: list[Dict], root_path: Path, schema: pa.Schema):
+        table = pa.Table.from_pylist(buffer, schema=schema)
+        pq.write_to_dataset(table, root_path=root_path, use_threads=True, schema=schema,
+                            partition_cols=[Constants.MODEL_NAME], existing_data_behavior="overwrite_or_ignore")
+
+    def run(self):
+        feature_vectors = Testdriver.load_feature_vectors(self.feature_vector_parquet)
+        logger = Testdriver.JobLogger(len(feature_vectors) * self.max_permutations, self.log_path)
+
+        # a rerun into the same folders continues after the ids, orderings and results of earlier runs
+        id, existing = FlatZincInstanceGenerator.existing_instances_in(self.instances_output)
+        existing_results = self.existing_results()
+        for model_name, vector in feature_vectors.items():
+            variables = FlatZincInstanceGenerator.extract_variables(vector[Constants.FLAT_ZINC])
+            if len(variables) == 0:
+                raise Exception(f"No variables could be extracted from {model_name}")
+            variables.sort()
+            perm_count = FlatZincInstanceGenerator.factorial(len(variables))
+            budget = min(self.max_permutations, perm_count)
+
+            drawn = {int(perm_id) for perm_id in existing.get(model_name, ())}
+            results = existing_results.get(model_name, [])
+            while len(drawn) < budget and not self.is_converged(results):
+                count = min(self.round_size, budget - len(drawn))
+                ranks = FlatZincInstanceGenerator.sample_permutation_ranks(perm_count, count, self.rng, self.strategy, drawn)
+                drawn.update(ranks)
+
+                jobs = []
+                for rank in ranks:
+                    jobs.append({
+                        Constants.MODEL_NAME: model_name,
+                        Constants.ID: id,
+                        Constants.PERMUTATION_ID: str(rank),
+                        Constants.INSTANCE_PERMUTATION: FlatZincInstanceGenerator.generate_nth_permutation(variables, rank),
+                    })
+                    id += 1
+                self.write_parquet(jobs, self.instances_output, Schemas.Parquet.instances)
+
+                round_results, failed = self.solve_round(jobs, feature_vectors, logger)
+                if len(round_results) > 0:
+                    self.write_parquet(round_results, self.output_folder, Schemas.Parquet.instance_results)
+                results.extend(round_results)
+
+                widths = {m: AdaptiveSampler.relative_ci_width([r[m] for r in results], self.z) for m in AdaptiveSampler.converged_metrics}
+                logger.log(logging.INFO, id, f"Round done: {len(results)} solved, {len(failed)} failed, relative CI widths {widths}", model_name)
+
+            state = "converged" if self.is_converged(results) else "budget exhausted"
+            logger.log(logging.INFO, id, f"Stopped after {len(drawn)} of {budget} orderings ({state}).", model_name)
+
+
+if __name__ == "__main__":
+    sampler = AdaptiveSampler(Path("temp/vectors_big_10.parquet").resolve(), Path("instances.adaptive").resolve(),
+                              Path("result.adaptive").resolve(), Path("backups").resolve(), 10000)
+    sampler.run()
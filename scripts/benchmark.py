@@ -0,0 +1,232 @@
+import datetime
+import json
+import os
+import queue
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from flatzinc_index import FlatZincIndex
+from instance_generator import FlatZincInstanceGenerator
+from schemas import Constants, Helpers, Schemas
+from synthetic import ModelSpec, SyntheticModel
+from testdriver import Testdriver
+
+"""
+Micro benchmarks of the hot paths of the pipeline, run on synthetic models of increasing size.
+Every run is appended to a Parquet history. Against a stored JSON baseline each timing is reported as a ratio,
+ratios above regression_threshold are regressions.
+"""
+class Benchmark:
+
+    default_sizes = [10, 100, 1000]
+    repeat = 5
+    min_round_time = 0.2        # seconds, the calls per round are doubled until a round takes at least this long
+    regression_threshold = 1.25
+    max_perms = 1000            # permutations per generate_permutations call
+
+    class NullLogger:
+        def log(self, level, job: int, message: str, job_name: str = ""): pass
+
+    def __init__(self, output_folder: Path, sizes: list[int] = None, cases: list[str] = None, baseline_file: Path = None,
+                 save_baseline: bool = False, seed: int = 0):
+        """
+        :param cases: names of the cases to run, all if None
+        :param save_baseline: store the timings of this run as the new baseline
+        """
+        self.output_folder = output_folder
+        self.history_folder = output_folder / "history"
+        self.baseline_file = baseline_file if baseline_file is not None else output_folder / "baseline.json"
+        self.save_baseline = save_baseline
+        self.sizes = sizes if sizes is not None else Benchmark.default_sizes
+        self.seed = seed
+        self.cases = {
+            "extract_variables": self.extract_variables_case,
+            "substitute_variables": self.substitute_variables_case,
+            "ensure_input_order_annotation": self.ensure_input_order_annotation_case,
+            "generate_nth_permutation": self.generate_nth_permutation_case,
+            "generate_permutations": self.generate_permutations_case,
+            "json_to_solution_statistics_dict": self.json_to_solution_statistics_dict_case,
+            "write_parquet": self.write_parquet_case,
+            "load_next_job_batch": self.load_next_job_batch_case,
+        }
+        if cases is not None:
+            unknown = set(cases) - set(self.cases)
+            if unknown:
+                raise ValueError(f"Unknown benchmark cases {sorted(unknown)}, available are {list(self.cases)}")
+            self.cases = {name: case for name, case in self.cases.items() if name in cases}
+        self.regressions: list[Dict] = []
+
+        os.makedirs(self.history_folder, exist_ok=True)
+
+    @staticmethod
+    def baseline_key(case: str, size: int) -> str:
+        return f"{case}[{size}]"
+
+    @staticmethod
+    def time_calls(func, number: int) -> float:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        return time.perf_counter() - start
+
+    @staticmethod
+    def measure(func, repeat: int = None, min_round_time: float = None) -> (float, int):
+        """
+        Best seconds per call over repeat rounds, like timeit. The minimum is the least disturbed measurement.
+        :return: seconds per call and calls per round
+        """
+        repeat = repeat if repeat is not None else Benchmark.repeat
+        min_round_time = min_round_time if min_round_time is not None else Benchmark.min_round_time
+        number = 1
+        elapsed = Benchmark.time_calls(func, number)
+        while elapsed < min_round_time:
+            number *= 2
+            elapsed = Benchmark.time_calls(func, number)
+        best = elapsed / number
+        for _ in range(repeat - 1):
+            best = min(best, Benchmark.time_calls(func, number) / number)
+        return best, number
+
+    # Every case prepares its inputs and returns the function that is timed.
+    # The FlatZincIndex cache is cleared where the Testdriver would see a model for the first time.
+
+    def extract_variables_case(self, size: int, workdir: Path):
+        fzn = SyntheticModel(ModelSpec(size)).flat_zinc
+        def call():
+            FlatZincIndex.of.cache_clear()
+            FlatZincInstanceGenerator.extract_variables(fzn)
+        return call
+
+    def substitute_variables_case(self, size: int, workdir: Path):
+        # the Testdriver substitutes into the same, already indexed, model for every job
+        model = SyntheticModel(ModelSpec(size))
+        fzn = model.flat_zinc
+        permutation = model.variables.copy()
+        random.Random(self.seed).shuffle(permutation)
+        return lambda: FlatZincInstanceGenerator.substitute_variables(fzn, permutation)
+
+    def ensure_input_order_annotation_case(self, size: int, workdir: Path):
+        fzn = SyntheticModel(ModelSpec(size)).flat_zinc
+        def call():
+            FlatZincIndex.of.cache_clear()
+            FlatZincInstanceGenerator.ensure_input_order_annotation(fzn)
+        return call
+
+    def generate_nth_permutation_case(self, size: int, workdir: Path):
+        variables = SyntheticModel.variable_names(size)
+        rank = FlatZincInstanceGenerator.factorial(size) // 3
+        return lambda: FlatZincInstanceGenerator.generate_nth_permutation(variables, rank)
+
+    def generate_permutations_case(self, size: int, workdir: Path):
+        feature_vectors = self.write_feature_vectors(size, workdir)
+        generator = FlatZincInstanceGenerator(feature_vectors, workdir / "generated", Benchmark.max_perms)
+        variables = SyntheticModel.variable_names(size)
+        return lambda: generator.generate_permutations(variables)
+
+    def json_to_solution_statistics_dict_case(self, size: int, workdir: Path):
+        rng = random.Random(self.seed)
+        result = SyntheticModel.results(SyntheticModel(ModelSpec(size)).instances(1, rng), rng)[0]
+        line = json.dumps({
+            Constants.OUTPUT_TYPE: Constants.SOLVER_STATISTICS,
+            Constants.SOLVER_STATISTICS: {f.name: result[f.name] for f in Schemas.Parquet.instance_results
+                                          if f.name not in Schemas.Parquet.instances.names},
+        })
+        return lambda: Helpers.json_to_solution_statistics_dict(line)
+
+    def write_parquet_case(self, size: int, workdir: Path):
+        testdriver = self.testdriver(size, workdir)
+        rng = random.Random(self.seed)
+        buffer = SyntheticModel.results(SyntheticModel(ModelSpec(size)).instances(Testdriver.result_parquet_chunksize, rng), rng)
+        return lambda: testdriver.write_parquet(buffer, 0, Benchmark.NullLogger())
+
+    def load_next_job_batch_case(self, size: int, workdir: Path):
+        # like the unit tests, an in process queue keeps pickling for worker processes out of the measurement
+        testdriver = self.testdriver(size, workdir)
+        def call():
+            testdriver.job_counter = 0
+            testdriver.job_queue = queue.Queue()
+            testdriver.load_next_job_batch(Benchmark.NullLogger())
+        return call
+
+    def write_feature_vectors(self, size: int, workdir: Path) -> Path:
+        path = workdir / "feature_vectors.parquet"
+        if not path.exists():
+            os.makedirs(workdir, exist_ok=True)
+            table = pa.Table.from_pylist([SyntheticModel(ModelSpec(size)).feature_vector()], schema=Schemas.Parquet.feature_vector)
+            pq.write_table(table, path)
+        return path
+
+    def testdriver(self, size: int, workdir: Path) -> Testdriver:
+        """A Testdriver on one synthetic model with a full job batch of instances."""
+        instances = workdir / "instances"
+        if not instances.exists():
+            rows = SyntheticModel(ModelSpec(size)).instances(Testdriver.job_loading_threshold, random.Random(self.seed))
+            pq.write_to_dataset(pa.Table.from_pylist(rows, schema=Schemas.Parquet.instances), root_path=instances,
+                                partition_cols=[Constants.MODEL_NAME])
+        return Testdriver(feature_vector_parquet=self.write_feature_vectors(size, workdir),
+                          workload_parquet_folder=instances,
+                          output_folder=workdir / "results",
+                          log_path=workdir,
+                          backup_path=workdir / "backups")
+
+    def load_baseline(self) -> dict[str, float]:
+        if not self.baseline_file.exists():
+            return {}
+        with open(self.baseline_file) as f:
+            return json.load(f)
+
+    def write_baseline(self, rows: list[Dict]):
+        baseline = {Benchmark.baseline_key(r[Constants.BENCHMARK_CASE], r[Constants.BENCHMARK_SIZE]): r[Constants.SECONDS_PER_CALL]
+                    for r in rows}
+        tmp_file = self.baseline_file.with_suffix(".tmp")
+        with open(tmp_file, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        os.replace(tmp_file, self.baseline_file)
+
+    def run(self) -> list[Dict]:
+        run_id = datetime.datetime.now().isoformat(timespec="microseconds")
+        baseline = self.load_baseline()
+        rows = []
+        self.regressions = []
+
+        print(f"{'case':<34} {'size':>6} {'per call':>14} {'calls':>8} {'vs baseline':>12}")
+        with tempfile.TemporaryDirectory() as workdir:
+            for size in self.sizes:
+                for case, prepare in self.cases.items():
+                    seconds, calls = Benchmark.measure(prepare(size, Path(workdir) / str(size) / case))
+                    row = {
+                        Constants.BENCHMARK_RUN: run_id,
+                        Constants.BENCHMARK_CASE: case,
+                        Constants.BENCHMARK_SIZE: size,
+                        Constants.SECONDS_PER_CALL: seconds,
+                        Constants.CALLS: calls,
+                    }
+                    rows.append(row)
+
+                    ratio = ""
+                    reference = baseline.get(Benchmark.baseline_key(case, size))
+                    if reference:
+                        ratio = f"{seconds / reference:.2f}x"
+                        if seconds / reference > Benchmark.regression_threshold:
+                            ratio += " !"
+                            self.regressions.append(row | {"ratio": seconds / reference})
+                    print(f"{case:<34} {size:>6} {seconds * 1e6:>11.1f} us {calls:>8} {ratio:>12}")
+
+        table = pa.Table.from_pylist(rows, schema=Schemas.Parquet.benchmark_results)
+        pq.write_table(table, self.history_folder / f"bench_{run_id.replace(':', '-')}.parquet")
+        if self.save_baseline:
+            self.write_baseline(rows)
+
+        if baseline:
+            print(f"{len(self.regressions)} regressions slower than {Benchmark.regression_threshold}x the baseline.")
+        return rows
+
+
+if __name__ == "__main__":
+    Benchmark(Path("bench").resolve()).run()
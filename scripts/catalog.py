@@ -0,0 +1,134 @@
+from pathlib import Path
+
+import duckdb
+
+from manifest import WorkloadManifest
+from schemas import Constants
+
+"""
+Persistent DuckDB catalog of the workload and result datasets, so a run does not glob and scan every Parquet file.
+Per file it keeps the models, id ranges and row counts of the workload, and the ids of all results in an indexed table.
+A refresh only lists the folders and reads the files that are new or changed since the last run.
+Loads then read only the files whose id range overlaps the requested ids.
+Assumes results only hold ids of this workload, as the Testdriver writes them.
+"""
+class WorkloadCatalog:
+
+    workload_files = "workload_files"
+    result_files = "result_files"
+    done_table = "done_ids"
+    models_view = "models"
+
+    def __init__(self, con: duckdb.DuckDBPyConnection, workload_folder: Path, results_folder: Path):
+        """
+        :param con: connection to the database file the catalog is kept in
+        """
+        self.con = con
+        self.workload_folder = workload_folder
+        self.results_folder = results_folder
+        self.con.execute(f"""
+            CREATE TABLE IF NOT EXISTS {WorkloadCatalog.workload_files} (
+                path VARCHAR, size BIGINT, mtime DOUBLE, {Constants.MODEL_NAME} VARCHAR,
+                min_id BIGINT, max_id BIGINT, jobs BIGINT)
+            """)
+        self.con.execute(f"CREATE TABLE IF NOT EXISTS {WorkloadCatalog.result_files} (path VARCHAR PRIMARY KEY, size BIGINT, mtime DOUBLE)")
+        self.con.execute(f"CREATE TABLE IF NOT EXISTS {WorkloadCatalog.done_table} ({Constants.ID} BIGINT PRIMARY KEY)")
+        self.con.execute(f"""
+            CREATE OR REPLACE VIEW {WorkloadCatalog.models_view} AS
+            SELECT {Constants.MODEL_NAME}, MIN(min_id) AS min_id, MAX(max_id) AS max_id, SUM(jobs) AS jobs
+            FROM {WorkloadCatalog.workload_files}
+            GROUP BY {Constants.MODEL_NAME}
+            """)
+
+    def changes(self, table: str, files: dict[str, tuple[int, float]]) -> (list[str], list[str]):
+        """:return: the new or changed files, the changed or removed files"""
+        known = {path: (size, mtime) for path, size, mtime in self.con.execute(f"SELECT DISTINCT path, size, mtime FROM {table}").fetchall()}
+        added = [path for path, stat in files.items() if known.get(path) != stat]
+        gone = [path for path, stat in known.items() if files.get(path) != stat]
+        return added, gone
+
+    def refresh(self) -> (int, int):
+        """
+        Brings the catalog up to date with the folders.
+        :return: the amount of workload and result files that were read
+        """
+        workload_on_disk = WorkloadManifest.list_files(self.workload_folder)
+        workload, gone = self.changes(WorkloadCatalog.workload_files, workload_on_disk)
+        self.con.execute("BEGIN TRANSACTION")
+        if gone:
+            self.con.execute(f"DELETE FROM {WorkloadCatalog.workload_files} WHERE path IN (SELECT unnest(?))", [gone])
+        if workload:
+            self.con.execute(f"""
+                INSERT INTO {WorkloadCatalog.workload_files}
+                SELECT s.filename, f.size, f.mtime, s.{Constants.MODEL_NAME}, s.min_id, s.max_id, s.jobs
+                FROM (
+                    SELECT filename, {Constants.MODEL_NAME}, MIN({Constants.ID}) AS min_id, MAX({Constants.ID}) AS max_id, COUNT(*) AS jobs
+                    FROM read_parquet(?, hive_partitioning = true, filename = true)
+                    GROUP BY filename, {Constants.MODEL_NAME}
+                ) s
+                JOIN (SELECT unnest(?) AS path, unnest(?) AS size, unnest(?) AS mtime) f
+                ON s.filename = f.path
+                """, [workload, workload, [workload_on_disk[p][0] for p in workload], [workload_on_disk[p][1] for p in workload]])
+        self.con.execute("COMMIT")
+
+        results_on_disk = WorkloadManifest.list_files(self.results_folder)
+        results, gone = self.changes(WorkloadCatalog.result_files, results_on_disk)
+        self.con.execute("BEGIN TRANSACTION")
+        if any(path not in results_on_disk for path in gone):
+            # results were deleted, the ids can only be rebuilt from the remaining files
+            self.con.execute(f"DELETE FROM {WorkloadCatalog.result_files}")
+            self.con.execute(f"DELETE FROM {WorkloadCatalog.done_table}")
+            results = list(results_on_disk)
+        if results:
+            self.con.execute(f"""
+                INSERT OR IGNORE INTO {WorkloadCatalog.done_table}
+                SELECT DISTINCT {Constants.ID} FROM read_parquet(?, union_by_name = true)
+                """, [results])
+            self.con.execute(f"""
+                INSERT OR REPLACE INTO {WorkloadCatalog.result_files}
+                SELECT unnest(?), unnest(?), unnest(?)
+                """, [results, [results_on_disk[p][0] for p in results], [results_on_disk[p][1] for p in results]])
+        self.con.execute("COMMIT")
+        return len(workload), len(results)
+
+    def source(self, low: int = None, high: int = None) -> str | None:
+        """
+        SQL table expression over the workload files that hold ids in [low, high), all files without a range.
+        :return: None if no file overlaps the range
+        """
+        where = f"WHERE max_id >= {low} AND min_id < {high}" if low is not None else ""
+        files = [row[0] for row in self.con.execute(
+            f"SELECT DISTINCT path FROM {WorkloadCatalog.workload_files} {where} ORDER BY path").fetchall()]
+        if len(files) == 0:
+            return None
+        return f"read_parquet({files!r}, hive_partitioning = true)"
+
+    def id_range(self) -> (int | None, int | None):
+        return self.con.execute(f"SELECT MIN(min_id), MAX(max_id) FROM {WorkloadCatalog.workload_files}").fetchone()
+
+    def remaining_jobs(self) -> dict[str, int]:
+        """
+        Jobs without a result per model. Finished ids are counted per file range, appended instances give a model
+        several files whose ids may enclose those of other models.
+        """
+        rows = self.con.execute(f"""
+            WITH done AS (
+                SELECT f.{Constants.MODEL_NAME}, COUNT(*) AS done
+                FROM {WorkloadCatalog.workload_files} f
+                JOIN {WorkloadCatalog.done_table} d
+                ON d.{Constants.ID} BETWEEN f.min_id AND f.max_id
+                GROUP BY f.{Constants.MODEL_NAME}
+            )
+            SELECT m.{Constants.MODEL_NAME}, m.jobs - coalesce(done.done, 0)
+            FROM {WorkloadCatalog.models_view} m
+            LEFT JOIN done USING ({Constants.MODEL_NAME})
+            """).fetchall()
+        return {model: int(jobs) for model, jobs in rows}
+
+    def id_ranges(self) -> list[tuple[str, int, int]]:
+        """(model name, min id, max id) of every workload file, a model has a range per file"""
+        return self.con.execute(f"SELECT {Constants.MODEL_NAME}, min_id, max_id FROM {WorkloadCatalog.workload_files} ORDER BY min_id").fetchall()
+
+    def models(self) -> list[tuple[str, int, int, int]]:
+        """(model name, min id, max id, jobs) of every model, min and max span all files of the model"""
+        return self.con.execute(f"SELECT {Constants.MODEL_NAME}, min_id, max_id, jobs FROM {WorkloadCatalog.models_view} ORDER BY min_id").fetchall()
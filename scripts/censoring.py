@@ -0,0 +1,96 @@
+import bisect
+import math
+import random
+import threading
+from typing import Dict
+
+from schemas import Constants
+
+"""
+Cuts off the long tail of heavy tailed models. Every solve gets a fail (or node) limit of multiple times the running
+quantile of that model, orderings that reach the limit are recorded as right censored with the limit value.
+The quantile is taken over a bounded random reservoir of the observations per model. Censored runs enter the reservoir
+with their limit, which is a lower bound of the true value and keeps the quantile exact as long as it is below the limit.
+No limit is set until a model has warmup observations.
+A satisfaction run that found its solution is complete. An optimisation run usually reaches the limit after it found
+solutions, before it proved the last one optimal, so there any run at the limit is censored.
+"""
+class CensoringPolicy:
+
+    limit_types = {"fail": (Constants.FAILURES, Constants.FAIL_LIMIT), "node": (Constants.NODES, Constants.NODE_LIMIT)}
+    reservoir_size = 1024
+
+    def __init__(self, multiple: float = 10.0, quantile: float = 0.5, limit_type: str = "fail", warmup: int = 20,
+                 min_limit: int = 1000, seed: int = None):
+        """
+        :param multiple: the limit is this multiple of the quantile
+        :param limit_type: fail limits failures (backtracks), node limits search nodes, both are gecode options
+        :param min_limit: lower bound of every limit, keeps easy models from being cut at a handful of failures
+        """
+        if limit_type not in CensoringPolicy.limit_types:
+            raise ValueError(f"Limit type must be one of {list(CensoringPolicy.limit_types)}")
+        if not 0 < quantile < 1:
+            raise ValueError("Quantile must be in (0, 1)")
+        if multiple <= 1:
+            raise ValueError("The limit multiple must be greater than 1")
+        self.multiple = multiple
+        self.quantile = quantile
+        self.limit_type = limit_type
+        self.metric, self.limit_column = CensoringPolicy.limit_types[limit_type]
+        self.warmup = warmup
+        self.min_limit = min_limit
+        self.rng = random.Random(seed)
+        self.reservoirs: dict[str, list[int]] = {}  # sorted observations per model
+        self.observed: dict[str, int] = {}          # observations per model, including those not kept
+        self.censored = 0
+        self.lock = threading.Lock()                # workers are threads sharing one policy
+
+    def observe(self, model: str, value: int):
+        with self.lock:
+            reservoir = self.reservoirs.setdefault(model, [])
+            seen = self.observed.get(model, 0) + 1
+            self.observed[model] = seen
+            if len(reservoir) < CensoringPolicy.reservoir_size:
+                bisect.insort(reservoir, value)
+            elif self.rng.randrange(seen) < CensoringPolicy.reservoir_size:
+                # reservoir sampling, the replaced observation is a random one
+                del reservoir[self.rng.randrange(len(reservoir))]
+                bisect.insort(reservoir, value)
+
+    def running_quantile(self, model: str) -> int | None:
+        with self.lock:
+            reservoir = self.reservoirs.get(model)
+            if reservoir is None or self.observed[model] < self.warmup:
+                return None
+            return reservoir[int(self.quantile * (len(reservoir) - 1))]
+
+    def limit(self, model: str) -> int | None:
+        """Limit of the next solve of model, None while the model is warming up."""
+        quantile = self.running_quantile(model)
+        if quantile is None:
+            return None
+        return max(self.min_limit, math.ceil(self.multiple * quantile))
+
+    def solver_flag(self, limit: int | None) -> str:
+        return f" --{self.limit_type} {limit}" if limit is not None else ""
+
+    def record(self, model: str, statistics: Dict, limit: int | None, optimisation: bool = False) -> Dict:
+        """
+        Observes the statistics of a solve run under limit.
+        :param optimisation: the model minimizes or maximizes, found solutions do not end the search
+        :return: the censoring columns of the result row
+        """
+        value = statistics[self.metric]
+        censored = limit is not None and value >= limit and (optimisation or statistics[Constants.SOLUTIONS] == 0)
+        self.observe(model, limit if censored else value)
+        if censored:
+            self.censored += 1
+        return {
+            Constants.CENSORED: censored,
+            Constants.FAIL_LIMIT: limit if self.limit_column == Constants.FAIL_LIMIT else None,
+            Constants.NODE_LIMIT: limit if self.limit_column == Constants.NODE_LIMIT else None,
+        }
+
+    def report(self) -> str:
+        limits = ", ".join(f"{model}: {self.limit(model)}" for model in sorted(self.reservoirs))
+        return f"{self.censored} runs censored, {self.limit_type} limits {limits}"
@@ -0,0 +1,63 @@
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+"""
+On disk cache for MiniZinc compilations of the feature extraction.
+An entry holds the feature vector JSON output and the FlatZinc of one compilation. It is keyed by everything that
+influences the compilation result: the model text, the data file text, the command template (solver flag) and
+the version of the MiniZinc binary.
+"""
+class CompileCache:
+
+    def __init__(self, cache_dir: Path):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(command_template: str, minizinc_version: str, mzn_content: str, dzn_content: str = "") -> str:
+        digest = hashlib.sha256()
+        for part in [command_template, minizinc_version, mzn_content, dzn_content]:
+            encoded = part.encode()
+            digest.update(len(encoded).to_bytes(8, "little"))  # length prefix, so parts can not shift into each other
+            digest.update(encoded)
+        return digest.hexdigest()
+
+    def entry_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / key
+
+    def get(self, key: str) -> tuple[list[str], str] | None:
+        """
+        :return: the output lines and the FlatZinc of a cached compilation, None on a miss
+        """
+        entry = self.entry_path(key)
+        try:
+            with open(entry.with_suffix(".json"), 'r') as f:
+                output_lines = f.read().split("\n")
+            with open(entry.with_suffix(".fzn"), 'r') as f:
+                fzn_content = f.read()
+        except FileNotFoundError:
+            with self.lock:
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.hits += 1
+        return output_lines, fzn_content
+
+    def put(self, key: str, output_lines: list[str], fzn_content: str):
+        entry = self.entry_path(key)
+        os.makedirs(entry.parent, exist_ok=True)
+        # the FlatZinc is written first and the JSON last, a readable JSON therefore marks a complete entry
+        for suffix, content in [(".fzn", fzn_content), (".json", "\n".join(output_lines))]:
+            temp_file = entry.with_suffix(f"{suffix}.{threading.get_ident()}.tmp")
+            with open(temp_file, 'w') as f:
+                f.write(content)
+            os.replace(temp_file, entry.with_suffix(suffix))
+
+    def report(self) -> str:
+        return f"Compile cache: {self.hits} hits, {self.misses} misses"
@@ -0,0 +1,158 @@
+import json
+import math
+import os
+from pathlib import Path
+from typing import Dict
+
+import duckdb
+import numpy as np
+import pyarrow.parquet as pq
+
+from schemas import Constants
+from summary import ResultSummary
+
+"""
+Predicts the cost of solving a model from its feature vector, before any job of it has run.
+Two ridge regressions are trained on per model aggregates of earlier results: the log of the mean seconds per job
+(initTime + solveTime, for ETAs and budgets) and the mean log of the failures (the typical ordering).
+Features are log scaled numeric fields of the feature vector, the method and the counts of the constraints
+that appear in at least min_models training models. The model is stored as JSON.
+"""
+class CostModel:
+
+    numeric_features = [
+        Constants.FLAT_BOOL_VARS,
+        Constants.FLAT_INT_VARS,
+        Constants.FLAT_SET_VARS,
+        Constants.STD_DEVIATION_DOMAIN,
+        Constants.AVERAGE_DOMAIN_SIZE,
+        Constants.MEDIAN_DOMAIN_SIZE,
+        Constants.AVERAGE_DOMAIN_OVERLAP,
+        Constants.NUMBER_OF_DISJOINT_PAIRS,
+        Constants.META_CONSTRAINTS,
+        Constants.TOTAL_CONSTRAINTS,
+        Constants.AVG_DECISION_VARS_IN_CONSTRAINTS,
+    ]
+    methods = ["satisfy", "minimize", "maximize"]
+    targets = ["seconds", Constants.FAILURES]
+    max_vocabulary = 32     # constraint histogram entries used as features
+    min_models = 2
+
+    def __init__(self, vocabulary: list[str], mean: list[float], scale: list[float], weights: dict[str, list[float]],
+                 intercepts: dict[str, float], alpha: float, trained_models: int):
+        self.vocabulary = vocabulary
+        self.mean = np.array(mean)
+        self.scale = np.array(scale)
+        self.weights = {target: np.array(w) for target, w in weights.items()}
+        self.intercepts = intercepts
+        self.alpha = alpha
+        self.trained_models = trained_models
+
+    @staticmethod
+    def features(vector: Dict, vocabulary: list[str]) -> list[float]:
+        """The raw feature row of a feature vector, before standardisation."""
+        row = [math.log1p(max(0.0, float(vector[name]))) for name in CostModel.numeric_features]
+        row.append(math.log1p(len(vector[Constants.DOMAIN_WIDTHS])))
+        row.extend(1.0 if vector[Constants.METHOD] == method else 0.0 for method in CostModel.methods)
+        histogram = dict(vector[Constants.CONSTRAINT_HISTOGRAM])    # pyarrow reads maps as lists of pairs
+        row.extend(math.log1p(histogram.get(name, 0)) for name in vocabulary)
+        return row
+
+    @staticmethod
+    def load_feature_vectors(feature_vector_parquet: Path) -> dict[str, Dict]:
+        """Feature vectors by model name, without the large FlatZinc and MiniZinc columns."""
+        columns = [Constants.MODEL_NAME, Constants.DOMAIN_WIDTHS, Constants.METHOD, Constants.CONSTRAINT_HISTOGRAM] \
+                  + CostModel.numeric_features
+        rows = pq.read_table(feature_vector_parquet, columns=columns).to_pylist()
+        return {row[Constants.MODEL_NAME]: row for row in rows}
+
+    @staticmethod
+    def aggregate_results(results_folder: Path) -> dict[str, Dict]:
+        """
+        Per model targets of the results dataset. Censored runs are left out, their cost is unknown.
+        Files written without censoring have no censored column, their rows count as uncensored.
+        """
+        source = f"read_parquet('{ResultSummary.results_pattern(results_folder)}', hive_partitioning = true, union_by_name = true)"
+        con = duckdb.connect(database=':memory:')
+        columns = [row[0] for row in con.execute(f"DESCRIBE SELECT * FROM {source}").fetchall()]
+        where = f"WHERE NOT coalesce({Constants.CENSORED}, false)" if Constants.CENSORED in columns else ""
+        rows = con.execute(f"""
+            SELECT {Constants.MODEL_NAME},
+                   LN(AVG({Constants.INIT_TIME} + {Constants.SOLVE_TIME}) + 1e-6),
+                   AVG(LN(1 + {Constants.FAILURES})),
+                   COUNT(*)
+            FROM {source}
+            {where}
+            GROUP BY {Constants.MODEL_NAME}
+            """).fetchall()
+        con.close()
+        return {model: {"seconds": seconds, Constants.FAILURES: failures, "jobs": jobs} for model, seconds, failures, jobs in rows}
+
+    @staticmethod
+    def train(feature_vector_parquet: Path, results_folder: Path, alpha: float = 1.0) -> "CostModel":
+        vectors = CostModel.load_feature_vectors(feature_vector_parquet)
+        aggregates = CostModel.aggregate_results(results_folder)
+        models = sorted(set(vectors) & set(aggregates))
+        if len(models) < 2:
+            raise ValueError(f"Training needs results of at least 2 models with feature vectors, found {len(models)}")
+
+        counts = {}
+        for model in models:
+            for name in dict(vectors[model][Constants.CONSTRAINT_HISTOGRAM]):
+                counts[name] = counts.get(name, 0) + 1
+        vocabulary = sorted((name for name, count in counts.items() if count >= CostModel.min_models),
+                            key=lambda name: (-counts[name], name))[:CostModel.max_vocabulary]
+
+        x = np.array([CostModel.features(vectors[model], vocabulary) for model in models])
+        mean = x.mean(axis=0)
+        scale = x.std(axis=0)
+        scale[scale == 0] = 1.0     # constant features get no weight
+        x = (x - mean) / scale
+
+        weights, intercepts = {}, {}
+        for target in CostModel.targets:
+            y = np.array([aggregates[model][target] for model in models])
+            intercepts[target] = float(y.mean())
+            weights[target] = np.linalg.solve(x.T @ x + alpha * np.eye(x.shape[1]), x.T @ (y - y.mean())).tolist()
+
+        cost_model = CostModel(vocabulary, mean.tolist(), scale.tolist(), weights, intercepts, alpha, len(models))
+        for target in CostModel.targets:
+            predicted = np.array([cost_model.predict_log(vectors[model])[target] for model in models])
+            actual = np.array([aggregates[model][target] for model in models])
+            print(f"INF: {target} model, training RMSE {np.sqrt(np.mean((predicted - actual) ** 2)):.3f} in log space over {len(models)} models.")
+        return cost_model
+
+    def predict_log(self, vector: Dict) -> dict[str, float]:
+        x = (np.array(CostModel.features(vector, self.vocabulary)) - self.mean) / self.scale
+        return {target: float(self.intercepts[target] + x @ self.weights[target]) for target in CostModel.targets}
+
+    def predict(self, vector: Dict) -> dict[str, float]:
+        """
+        :return: the expected seconds per job and the typical failures of an ordering
+        """
+        log = self.predict_log(vector)
+        return {"seconds": math.exp(log["seconds"]), Constants.FAILURES: math.expm1(log[Constants.FAILURES])}
+
+    def save(self, path: Path):
+        tmp_file = Path(f"{path}.tmp")
+        with open(tmp_file, "w") as f:
+            json.dump({
+                "vocabulary": self.vocabulary,
+                "mean": self.mean.tolist(),
+                "scale": self.scale.tolist(),
+                "weights": {target: w.tolist() for target, w in self.weights.items()},
+                "intercepts": self.intercepts,
+                "alpha": self.alpha,
+                "trained_models": self.trained_models,
+            }, f, indent=2)
+        os.replace(tmp_file, path)
+
+    @staticmethod
+    def load(path: Path) -> "CostModel":
+        with open(path) as f:
+            return CostModel(**json.load(f))
+
+
+if __name__ == "__main__":
+    cost_model = CostModel.train(Path("temp/vectors_big_10.parquet"), Path("result.10000_vm").resolve())
+    cost_model.save(Path("cost_model.json"))
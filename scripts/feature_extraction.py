@@ -1,87 +1,252 @@
+import datetime
 import multiprocessing
 import os
+import queue
 import re
+import shutil
 import tempfile
-import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
 
-from minizinc_wrapper import MinizincWrapper
+from compile_cache import CompileCache
+from minizinc_wrapper import MinizincWrapper, ResourceLimits
 from schemas import Schemas, Helpers, Constants
+from tracing import Tracer
 import pyarrow.parquet as pq
 import pyarrow as pa
 
 """
 Uses MiniZinc to extract the feature vector of a .mzn files. And outputs the parsed feature vector into
 a parquet file. 
+Finished vectors are flushed as complete part files into a .parts folder next to the output, which are merged into
+the output once the run is done. A run that is killed keeps its parts, and a resumed run skips the models in them.
 """
 class FeatureVectorExtractor:
 
-    semaphore = threading.Semaphore(multiprocessing.cpu_count())
-    command_template = ' --solver cp --two-pass --feature-vector --no-output-ozn --output-fzn-to-file {fznfile} "{mzn}" --json-stream --compile'
-    # command_template = ' --solver api --two-pass --feature-vector --no-output-ozn --output-fzn-to-file {fznfile} "{mzn}" --json-stream --compile'
-    # command_template = ' --solver gecode --two-pass --feature-vector --no-output-ozn --output-fzn-to-file {fznfile} "{mzn}" --json-stream --compile'
+    num_workers = multiprocessing.cpu_count()
+    row_group_size = 64     # finished vectors are flushed in part files of this size, which become the row groups of the output
+    default_backend = "cp"  # other backends in use: api, gecode
+    command_template = ' --solver {solver} --two-pass --feature-vector --no-output-ozn --output-fzn-to-file {fznfile} "{mzn}" --json-stream --compile'
 
-    def __init__(self, input_files: (str, list[Path]), parquet_output_file: Path):
-        self.input_files = input_files
+    def __init__(self, input_files: (str, list[Path]), parquet_output_file: Path, resume: bool = False, cache_dir: Path = None,
+                 backends: list[str] = None, limits: ResourceLimits = None, sink: queue.Queue = None):
+        """
+        :param input_files: (problem_id, mzn) tuples, or (problem_id, mzn, dzn) tuples as returned by
+            input_matrix_helper. With data files the output uses the feature_vector_with_dzn schema.
+        :param backends: solvers every model is compiled for in the same run. If given, rows are tagged with
+            their backend. Defaults to the untagged default_backend.
+        :param sink: every vector is put here once it is on disk, rows of a resumed run included.
+            Vectors are then written one per part file, so the consumer does not wait for a full batch
+        """
+        self.input_files = [entry if len(entry) == 3 else (*entry, None) for entry in input_files]
+        self.with_data_files = any(len(entry) == 3 for entry in input_files)
+        self.backends = backends
+        self.limits = limits    # resource limits of every compilation
+        self.schema = Schemas.Parquet.feature_vector_with_dzn if self.with_data_files else Schemas.Parquet.feature_vector
+        if self.backends is not None:
+            self.schema = self.schema.append(Schemas.Parquet.backend_field)
         self.parquet_output = parquet_output_file
-        self.writer = pq.ParquetWriter(parquet_output_file, schema=Schemas.Parquet.feature_vector)
+        self.resume = resume    # skip models that are already present in the output file or the parts of a killed run
+        self.cache = CompileCache(cache_dir) if cache_dir is not None else None
+        self.run_id = None
+        self.part_num = 0
+        self.sink = sink
+        self.flush_size = 1 if sink is not None else FeatureVectorExtractor.row_group_size
 
     @staticmethod
-    def worker(queue, tempfolder, problem_id: str, mzn_fqn: Path):
-        with FeatureVectorExtractor.semaphore:
-            mzn_filename = mzn_fqn.as_posix().split("/")[-1]
-            raw_filename = mzn_filename.rstrip(".mzn")
-            fznfile_fqn = f"{tempfolder.name}/{raw_filename}.fzn"
+    def instance_name(mzn_fqn: Path, dzn_fqn: Path | None) -> str:
+        """Model name of a row, models compiled with a data file are named after both files."""
+        if dzn_fqn is None:
+            return mzn_fqn.name
+        return f"{mzn_fqn.name}_{dzn_fqn.name}"
 
-            print(f"starting work on {raw_filename}")
-            args = FeatureVectorExtractor.command_template.format(fznfile=fznfile_fqn, mzn=mzn_fqn)
-            ret_code, output_lines = MinizincWrapper.run(args)
+    @staticmethod
+    def worker(tempfolder: str, problem_id: str, mzn_fqn: Path, dzn_fqn: Path | None = None, backend: str | None = None,
+               cache: CompileCache = None, limits: ResourceLimits = None) -> dict:
+        raw_filename = mzn_fqn.stem if dzn_fqn is None else f"{mzn_fqn.stem}_{dzn_fqn.stem}"
+        solver = backend if backend is not None else FeatureVectorExtractor.default_backend
+        command_template = FeatureVectorExtractor.command_template.replace("{solver}", solver)
 
-            if ret_code != 0:
-                raise Exception(f"Feature Extraction failed for file {fznfile_fqn}.")
+        with Tracer.span("extract", "extraction", model=raw_filename, solver=solver):
+            with open(mzn_fqn, 'r') as f:
+                mzn_content = f.read()
+            dzn_content = ""
+            if dzn_fqn is not None:
+                with open(dzn_fqn, 'r') as f:
+                    dzn_content = f.read()
 
-            data = Helpers.json_to_normalized_feature_vector_dict("\n".join(output_lines))
+            cache_key, cached = None, None
+            if cache is not None:
+                cache_key = CompileCache.key(command_template, MinizincWrapper.version(), mzn_content, dzn_content)
+                cached = cache.get(cache_key)
 
-            with open(mzn_fqn, 'r') as f:
-                data[Constants.MINI_ZINC] = f.read()
+            if cached is not None:
+                print(f"{raw_filename} is cached.")
+                output_lines, fzn_content = cached
+            else:
+                fd, fznfile_fqn = tempfile.mkstemp(suffix=".fzn", prefix=f"{raw_filename}_", dir=tempfolder)  # models may share names
+                os.close(fd)
+
+                print(f"starting work on {raw_filename}")
+                args = command_template.format(fznfile=fznfile_fqn, mzn=mzn_fqn)
+                if dzn_fqn is not None:
+                    args += f' "{dzn_fqn}"'
+                with Tracer.span("compile", "extraction", solver=solver):
+                    result = MinizincWrapper.run(args, limits=limits)
+
+                if result.status != MinizincWrapper.STATUS_OK:
+                    raise Exception(f"Feature Extraction failed ({result.status}) for file {fznfile_fqn}.")
+                output_lines = result.output
+
+                with open(fznfile_fqn, 'r') as f:
+                    fzn_content = f.read()
+                os.remove(fznfile_fqn)
 
-            with open(fznfile_fqn, 'r') as f:
-                data[Constants.PROBLEM_ID] = problem_id
-                data[Constants.MODEL_NAME] = mzn_filename
-                data[Constants.FLAT_ZINC] = f.read()
+                if cache is not None:
+                    cache.put(cache_key, output_lines, fzn_content)
+
+            with Tracer.span("parse", "extraction"):
+                data = Helpers.json_to_normalized_feature_vector_dict("\n".join(output_lines))
+            data[Constants.MINI_ZINC] = mzn_content
+            data[Constants.PROBLEM_ID] = problem_id
+            data[Constants.MODEL_NAME] = FeatureVectorExtractor.instance_name(mzn_fqn, dzn_fqn)
+            data[Constants.FLAT_ZINC] = fzn_content
+            if dzn_fqn is not None:
+                data[Constants.DATA_FILE] = dzn_fqn.name
+            if backend is not None:
+                data[Constants.BACKEND] = backend
 
-            queue.put(data)
             print(f"{raw_filename} feature extraction is done.")
+        return data
 
-    def run(self):
-        queue = multiprocessing.Queue()
-        temp_folder = tempfile.TemporaryDirectory()
+    def parts_folder(self) -> Path:
+        return self.parquet_output.with_name(self.parquet_output.name + ".parts")
 
-        threads = []
-        for problem_id, data in self.input_files:
-            t = threading.Thread(target=FeatureVectorExtractor.worker, args=(queue, temp_folder, problem_id, data))
-            t.start()
-            threads.append(t)
+    def existing_files(self) -> list[Path]:
+        """
+        Files holding the vectors of earlier runs: the output of the last finished run and the parts of a run that
+        was killed before it could merge them. Without resume, parts of an earlier run are discarded.
+        """
+        parts = self.parts_folder()
+        if not self.resume:
+            shutil.rmtree(parts, ignore_errors=True)
+            return []
+        files = []
+        if self.parquet_output.exists():
+            try:
+                pq.read_metadata(self.parquet_output)
+                files.append(self.parquet_output)
+            except Exception as e:
+                print(f"WARN {self.parquet_output} is not readable and will be replaced: {e}")
+        return files + sorted(parts.glob("*.parquet"))
 
-        chunk = []
-        processed = 0
-        while processed < len(self.input_files):
-            processed += 1
-            chunk.append(queue.get())
+    def read_existing(self, files: list[Path]) -> set[tuple[str, str, str | None]]:
+        """
+        Passes the vectors of earlier runs to the sink.
+        :return: the (problem id, model name, backend) keys that are already done
+        """
+        done = set()
+        for path in files:
+            existing = pq.ParquetFile(path)
+            for i in range(existing.num_row_groups):
+                columns = [Constants.PROBLEM_ID, Constants.MODEL_NAME] + ([Constants.BACKEND] if self.backends is not None else [])
+                table = existing.read_row_group(i, columns=columns if self.sink is None else None)
+                backends = table[Constants.BACKEND].to_pylist() if self.backends is not None else [None] * table.num_rows
+                done.update(zip(table[Constants.PROBLEM_ID].to_pylist(), table[Constants.MODEL_NAME].to_pylist(), backends))
+                if self.sink is not None:
+                    for vector in table.cast(self.schema).to_pylist():
+                        self.sink.put(vector)
+            existing.close()
+        return done
 
-        for t in threads:
-            t.join()
+    def write_batch(self, batch: list[dict]):
+        """Writes the batch as a complete part file, so a killed run keeps every flushed vector."""
+        if len(batch) == 0:
+            return
 
         def sort_by_problem_id(vektor):
             return int(vektor[Constants.PROBLEM_ID])
 
-        chunk.sort(key=sort_by_problem_id)
+        batch.sort(key=sort_by_problem_id)
+        if self.with_data_files:
+            for vector in batch:
+                vector.setdefault(Constants.DATA_FILE, "")  # models of the matrix that need no data
+        table = pa.Table.from_pylist(mapping=batch, schema=self.schema)
+        part = self.parts_folder() / f"part_{self.run_id}_{self.part_num:06}.parquet"
+        temp_file = part.with_suffix(".tmp")
+        pq.write_table(table, temp_file)
+        os.replace(temp_file, part)
+        self.part_num += 1
+        print(f"Flushed {len(batch)} feature vectors.")
+        if self.sink is not None:
+            for vector in table.to_pylist():
+                self.sink.put(vector)
+        batch.clear()
+
+    def merge(self, files: list[Path]):
+        """Replaces the output by the rows of files and all parts, row group by row group, then drops the parts."""
+        files = files + [p for p in sorted(self.parts_folder().glob("*.parquet")) if p not in files]
+        temp_file = self.parquet_output.with_name(self.parquet_output.name + ".tmp")
+        with pq.ParquetWriter(temp_file, schema=self.schema) as writer:
+            for path in files:
+                existing = pq.ParquetFile(path)
+                for i in range(existing.num_row_groups):
+                    writer.write_table(existing.read_row_group(i).cast(self.schema))
+                existing.close()
+        os.replace(temp_file, self.parquet_output)
+        shutil.rmtree(self.parts_folder(), ignore_errors=True)
+
+    def run(self):
+        existing = self.existing_files()
+        os.makedirs(self.parts_folder(), exist_ok=True)
+        self.run_id = datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        self.part_num = 0
+
+        failed = []
+        done = self.read_existing(existing)
+        # every model is fanned out to all backends, discovery and the part files are shared
+        tasks = iter([(*task, backend) for task in self.input_files for backend in (self.backends or [None])
+                      if (task[0], FeatureVectorExtractor.instance_name(*task[1:]), backend) not in done])
+        if len(done) > 0:
+            print(f"Resuming, {len(done)} models are already done.")
+
+        batch = []
+        in_flight = {}
+        with tempfile.TemporaryDirectory() as temp_folder, ThreadPoolExecutor(max_workers=FeatureVectorExtractor.num_workers) as executor:
+            while True:
+                # only a bounded amount of tasks is submitted, so finished vectors do not pile up in futures
+                while len(in_flight) < 2 * FeatureVectorExtractor.num_workers:
+                    task = next(tasks, None)
+                    if task is None:
+                        break
+                    in_flight[executor.submit(FeatureVectorExtractor.worker, temp_folder, *task, self.cache, self.limits)] = task
+
+                if len(in_flight) == 0:
+                    break
+
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    problem_id, mzn, dzn, backend = in_flight.pop(future)
+                    name = FeatureVectorExtractor.instance_name(mzn, dzn) + (f" ({backend})" if backend is not None else "")
+                    try:
+                        batch.append(future.result())
+                    except Exception as e:
+                        print(f"ERR Feature extraction of {name} failed: {e}")
+                        failed.append(name)
+
+                if len(batch) >= self.flush_size:
+                    with Tracer.span("write_batch", "extraction", rows=len(batch)):
+                        self.write_batch(batch)
+
+        with Tracer.span("write_batch", "extraction", rows=len(batch)):
+            self.write_batch(batch)
+        with Tracer.span("merge", "extraction"):
+            self.merge(existing)
 
-        print("Will flush table.")
-        table = pa.Table.from_pylist(mapping=chunk, schema=Schemas.Parquet.feature_vector)
-        self.writer.write_table(table)
-        self.writer.close()
-        temp_folder.cleanup()
+        if self.cache is not None:
+            print(self.cache.report())
+        if len(failed) > 0:
+            raise Exception(f"Feature extraction failed for {len(failed)} models: {failed}")
 
     @staticmethod
     def input_format_helper(problems: Path) -> (str, list[Path]):
@@ -98,6 +263,26 @@ class FeatureVectorExtractor:
 
         return file_list
 
+    @staticmethod
+    def input_matrix_helper(problems: Path) -> list[tuple[str, Path, Path | None]]:
+        """
+        Like input_format_helper, but pairs every model of a problem with every .dzn data file of that problem.
+        Models of problems without data files are returned once with None as data file.
+        """
+        data_files = {}
+        for root, dirs, files in os.walk(problems):
+            for file in files:
+                if file.endswith('.dzn'):
+                    match = re.match(r'prob(\d+)', os.path.basename(os.path.dirname(root)))
+                    if match:
+                        data_files.setdefault(match.group(1), []).append(Path(os.path.join(root, file)).resolve())
+
+        matrix = []
+        for problem_id, mzn in FeatureVectorExtractor.input_format_helper(problems):
+            for dzn in sorted(data_files.get(problem_id, [None]), key=lambda p: "" if p is None else p.name):
+                matrix.append((problem_id, mzn, dzn))
+        return matrix
+
 if __name__ == "__main__":
     inp_p = Path("F:/Downloads/Problems_2").resolve()
     inp = FeatureVectorExtractor.input_format_helper(inp_p)
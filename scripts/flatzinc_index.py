@@ -0,0 +1,123 @@
+import functools
+import re
+
+"""
+Single pass index over a FlatZinc model.
+The model is split into items at every ';' outside of string literals. Only the items the instance generation
+cares about are looked at further: array declarations and the solve item with its int_search annotation.
+All positions are offsets into the original content, so lookups and substitutions never copy or rescan the model.
+"""
+class FlatZincIndex:
+
+    item_separator_pattern = re.compile(r'"(?:[^"\\]|\\.)*"|;')
+    array_head_pattern = re.compile(r'\s*array\s*\[[^\]]*\]\s*of\s*[^:;]*:\s*(\w+)')
+    solve_head_pattern = re.compile(r'\s*solve\b')
+    int_search_head_pattern = re.compile(r'\s*solve\s*::\s*int_search\s*\(\s*')
+    identifier_pattern = re.compile(r'\w+')
+    whitespace_pattern = re.compile(r'\s*')
+    variable_pattern = re.compile(r'\b[\w\[\]]+\b')
+
+    def __init__(self, fzn_content: str):
+        self.content = fzn_content
+        self.arrays: dict[str, tuple[int, int]] = {}    # array name -> span of its [...] literal
+        self.solve: tuple[int, int] | None = None       # span of the solve item
+        self.search_variables: tuple[int, int] | None = None  # span of the first int_search argument
+        self.search_strategy: tuple[int, int] | None = None   # span of the variable selection argument
+        self.int_search_count = 0
+
+        start = 0
+        for match in FlatZincIndex.item_separator_pattern.finditer(fzn_content):
+            if match.group() == ';':
+                self.index_item(start, match.start())
+                start = match.end()
+        if start < len(fzn_content):
+            self.index_item(start, len(fzn_content))  # trailing item without ';'
+
+    @staticmethod
+    @functools.lru_cache(maxsize=32)
+    def of(fzn_content: str) -> "FlatZincIndex":
+        """
+        Returns the (cached) index of a model. The Testdriver substitutes into the same FlatZinc for every job,
+        so the model is only indexed once.
+        """
+        return FlatZincIndex(fzn_content)
+
+    def index_item(self, start: int, end: int):
+        content = self.content
+
+        array_match = FlatZincIndex.array_head_pattern.match(content, start, end)
+        if array_match:
+            equals = content.find('=', array_match.end(), end)
+            if equals != -1:
+                open_bracket = content.find('[', equals, end)
+                close_bracket = content.rfind(']', open_bracket, end)
+                if open_bracket != -1 and close_bracket != -1:
+                    self.arrays[array_match.group(1)] = (open_bracket, close_bracket + 1)
+            return
+
+        if not FlatZincIndex.solve_head_pattern.match(content, start, end):
+            return
+
+        self.solve = (start, end)
+        self.int_search_count = content.count('int_search', start, end)
+
+        search_match = FlatZincIndex.int_search_head_pattern.match(content, start, end)
+        if not search_match:
+            return
+
+        position = search_match.end()
+        if content.startswith('[', position):
+            close_bracket = content.find(']', position, end)
+            if close_bracket == -1:
+                return
+            variables_end = close_bracket + 1
+        else:
+            identifier = FlatZincIndex.identifier_pattern.match(content, position, end)
+            if not identifier:
+                return
+            variables_end = identifier.end()
+
+        position = FlatZincIndex.whitespace_pattern.match(content, variables_end, end).end()
+        if not content.startswith(',', position):
+            return
+        self.search_variables = (search_match.end(), variables_end)
+
+        position = FlatZincIndex.whitespace_pattern.match(content, position + 1, end).end()
+        strategy = FlatZincIndex.identifier_pattern.match(content, position, end)
+        if strategy:
+            self.search_strategy = strategy.span()
+
+    def search_array_name(self) -> str | None:
+        """Name of the array that is searched on, None if the int_search annotation uses an anonymous array."""
+        if self.search_variables is None or self.content.startswith('[', self.search_variables[0]):
+            return None
+        return self.content[self.search_variables[0]:self.search_variables[1]]
+
+    def search_array_span(self) -> tuple[int, int] | None:
+        """Span of the [...] literal holding the searched variables, wherever it is declared."""
+        if self.search_variables is None:
+            return None
+        array_name = self.search_array_name()
+        if array_name is None:
+            return self.search_variables
+        return self.arrays.get(array_name)
+
+    def variables(self) -> list[str]:
+        span = self.search_array_span()
+        if span is None:
+            return []
+        start, end = span
+        return FlatZincIndex.variable_pattern.findall(self.content, start + 1, end - 1)
+
+    def replace(self, span: tuple[int, int], replacement: str) -> str:
+        return f"{self.content[:span[0]]}{replacement}{self.content[span[1]:]}"
+
+    def replace_spans(self, replacements: list[tuple[tuple[int, int], str]]) -> str:
+        """Replaces several non overlapping spans while copying the content once."""
+        parts, position = [], 0
+        for (start, end), replacement in sorted(replacements):
+            parts.append(self.content[position:start])
+            parts.append(replacement)
+            position = end
+        parts.append(self.content[position:])
+        return "".join(parts)
@@ -1,115 +1,270 @@
-import math
+import hashlib
+import json
 import multiprocessing
+import os
+import random
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import Dict, List, Tuple
 
 import pyarrow as pa
+import pyarrow.compute as pc
 import pyarrow.parquet as pq
-import re
 
-from minizinc_wrapper import MinizincWrapper
+from flatzinc_index import FlatZincIndex
+from manifest import WorkloadManifest
+from minizinc_wrapper import MinizincWrapper, ResourceLimits
 from schemas import Constants, Schemas
+from tracing import Tracer
 
 sys.set_int_max_str_digits(20000)  # in case we have large models with more than 1000 vars
 
 class FlatZincInstanceGenerator:
-    int_search_pattern = re.compile(r"solve\s*::\s*int_search\s*\(\s*(\[\s*.*?\s*\]|\w+)\s*,", re.DOTALL)
-    int_search_pattern_extended = re.compile(r"(.*solve\s*::\s*int_search\s*\()(\s*\[\s*.*?\s*\]|\w+),(\w+),(.*)", re.DOTALL)
-    array_declaration_pattern = re.compile(r"array\s*\[\d+\.\.\d+\]\s*of\s*var\s*int:\s*(\w+)\s*=\s*(\[.*?\]);",
-                                           re.DOTALL)
-    vars_array_pattern = re.compile(r'\b[\w\[\]]+\b')
     command_template = ' --json-stream --model-check-only --input-from-stdin --input-is-flatzinc'
     result_buffer_size = 100_000
+    row_group_size = 8192       # rows per Parquet row group, the unit the Testdriver reads through the manifest. Divides the 32768 row batches of the dataset writer
+    probe_concurrency = multiprocessing.cpu_count()
 
-    factorials = {}
-    for i in range(0, 5000):
-        factorials[i] = math.factorial(i)
+    max_factorial = 5000        # upper bound of the factorial table, keeps memory and int->str conversions sane
+    factorials = [1]            # grown on demand by factorial(), factorials[i] == i!
+    factorial_lock = threading.Lock()
 
-    def __init__(self, feature_vector_parquet_input_file: Path, instances_parquet_output: Path, max_perms: int, cutoff_excess: bool = False):
-        self.reader = pq.ParquetReader()
-        self.reader.open(feature_vector_parquet_input_file)
+    def __init__(self, feature_vector_parquet_input_file: Path, instances_parquet_output: Path, max_perms: int, cutoff_excess: bool = False, append: bool = False, probe_cache_file: Path = None,
+                 limits: ResourceLimits = None, streaming: bool = False):
+        """
+        :param streaming: the feature vectors are passed to probe() and generate_model() while the input file is still
+            being written, as by the pipeline, so it is not checked here
+        """
+        if not streaming:
+            # fail early on a missing, broken or tagged input file
+            FlatZincInstanceGenerator.require_untagged(feature_vector_parquet_input_file)
+        self.feature_vector_file = feature_vector_parquet_input_file     # read by run()
         self.output_folder = instances_parquet_output
         self.max_permutations = max_perms   # amount of permutations aimed at. If its required to constrain to this exact amount set cutoff_excess
         self.cutoff_excess_vars = cutoff_excess
+        self.append = append    # only generate models and permutations missing in an existing output dataset
+        # underscore prefixed files are ignored by parquet dataset readers
+        self.probe_cache_file = probe_cache_file if probe_cache_file is not None else instances_parquet_output / "_probe_cache.json"
+        self.limits = limits    # resource limits of the MiniZinc model checks
+        self.manifest: WorkloadManifest = None
+        self.next_id = 0
+        self.existing: dict[str, set[str]] = {}
+        self.buffer: list[Dict] = []
 
-    def probe(self):
-        rows = self.reader.read_all().to_pylist()
-        rows.sort(key=lambda x: int(x[Constants.PROBLEM_ID]))
-        for row in rows:
-            print(f"Probing {row[Constants.MODEL_NAME]}")
-            variables = FlatZincInstanceGenerator.extract_variables(row[Constants.FLAT_ZINC])
-            if len(variables) == 0:
-                print(f"WARN No variables could be extracted flatzinc \n {row[Constants.FLAT_ZINC]}")
-            print(f"Extracted variables {variables}")
-            new_var_ordering = variables.copy()
-            new_var_ordering.reverse()
-
-            new_zinc = FlatZincInstanceGenerator.ensure_input_order_annotation(row[Constants.FLAT_ZINC])
-            new_zinc = FlatZincInstanceGenerator.substitute_variables(new_zinc, new_var_ordering)
-            print(f"Generated new flatzinc with variable ordering {new_var_ordering}")
-
-            if not "input_order" in new_zinc:
-                raise Exception("FlatZinc does not use input ordering.")
-
-            if len(re.findall(FlatZincInstanceGenerator.int_search_pattern, new_zinc)) != 1:
-                raise Exception("We can only handle one int_search annotation, but we found multiple.")
+    @staticmethod
+    def require_untagged(feature_vector_parquet: Path):
+        """
+        Raises if the feature vectors were extracted for several backends. Instances and results are keyed by model
+        name alone, a model would get the FlatZinc of an arbitrary backend.
+        """
+        if Constants.BACKEND in pq.read_schema(feature_vector_parquet).names:
+            raise ValueError(f"{feature_vector_parquet} holds feature vectors of several backends, "
+                             f"extract the vectors to generate and test from without --backends")
 
-            code, stdout = MinizincWrapper.run(FlatZincInstanceGenerator.command_template, stdin=new_zinc)
-            if code != 0:
-                # file will not be deleted if that trows, this is intentional
-                raise Exception(f"Variable substitution failed")
+    @staticmethod
+    def probe_model(model_name: str, fzn_content: str, limits: ResourceLimits = None):
+        """
+        Reverses the variable ordering of a model, substitutes it and lets MiniZinc check the result.
+        Throws if the model can not be used for instance generation.
+        """
+        print(f"Probing {model_name}")
+        variables = FlatZincInstanceGenerator.extract_variables(fzn_content)
+        if len(variables) == 0:
+            print(f"WARN No variables could be extracted flatzinc \n {fzn_content}")
+        print(f"Extracted variables {variables}")
+        new_var_ordering = variables.copy()
+        new_var_ordering.reverse()
+
+        new_zinc = FlatZincInstanceGenerator.ensure_input_order_annotation(fzn_content)
+        new_zinc = FlatZincInstanceGenerator.substitute_variables(new_zinc, new_var_ordering)
+        print(f"Generated new flatzinc with variable ordering {new_var_ordering}")
+
+        index = FlatZincIndex.of(new_zinc)
+        if index.search_strategy is None or new_zinc[index.search_strategy[0]:index.search_strategy[1]] != "input_order":
+            raise Exception("FlatZinc does not use input ordering.")
+
+        if index.int_search_count != 1:
+            raise Exception("We can only handle one int_search annotation, but we found multiple.")
+
+        result = MinizincWrapper.run(FlatZincInstanceGenerator.command_template, stdin=new_zinc, limits=limits)
+        if result.status != MinizincWrapper.STATUS_OK:
+            # file will not be deleted if that trows, this is intentional
+            raise Exception(f"Variable substitution failed ({result.status})")
+
+        new_var_ordering_extracted = FlatZincInstanceGenerator.extract_variables(new_zinc)
+
+        if new_var_ordering_extracted != new_var_ordering:
+            raise Exception(f"Instance generation sanity check failed")
+        else:
+            print(f"Instance generation successful for {model_name}")
 
-            new_var_ordering_extracted = FlatZincInstanceGenerator.extract_variables(new_zinc)
+    @staticmethod
+    def probe_cache_key(fzn_content: str) -> str:
+        """Models are only re-validated if their FlatZinc or the check command changed."""
+        digest = hashlib.sha256(FlatZincInstanceGenerator.command_template.encode())
+        digest.update(fzn_content.encode())
+        return digest.hexdigest()
+
+    def load_probe_cache(self) -> dict[str, str]:
+        if not self.probe_cache_file.exists():
+            return {}
+        with open(self.probe_cache_file, 'r') as f:
+            return json.load(f)
+
+    def save_probe_cache(self, cache: dict[str, str]):
+        os.makedirs(self.probe_cache_file.parent, exist_ok=True)
+        temp_file = self.probe_cache_file.with_name(self.probe_cache_file.name + ".tmp")
+        with open(temp_file, 'w') as f:
+            json.dump(cache, f, indent=1)
+        os.replace(temp_file, self.probe_cache_file)
+
+    def probe(self, rows: list[Dict] = None):
+        """
+        Validates all models with up to probe_concurrency parallel MiniZinc checks.
+        Successfully validated models are cached by content hash and skipped on later runs.
+        :param rows: feature vectors to validate, defaults to all of the input file
+        """
+        if rows is None:
+            rows = pq.read_table(self.feature_vector_file, columns=[Constants.PROBLEM_ID, Constants.MODEL_NAME, Constants.FLAT_ZINC]).to_pylist()
+        rows.sort(key=lambda x: int(x[Constants.PROBLEM_ID]))
 
-            if new_var_ordering_extracted != new_var_ordering:
-                raise Exception(f"Instance generation sanity check failed")
+        cache = self.load_probe_cache()
+        pending = {}
+        for row in rows:
+            key = FlatZincInstanceGenerator.probe_cache_key(row[Constants.FLAT_ZINC])
+            if key in cache:
+                print(f"Probing {row[Constants.MODEL_NAME]} skipped, validated in an earlier run")
             else:
-                print(f"Instance generation successful for {row[Constants.MODEL_NAME]}")
+                pending[key] = row
+
+        errors = []
+        with ThreadPoolExecutor(max_workers=FlatZincInstanceGenerator.probe_concurrency) as executor:
+            futures = {executor.submit(FlatZincInstanceGenerator.probe_model, row[Constants.MODEL_NAME], row[Constants.FLAT_ZINC], self.limits): key
+                       for key, row in pending.items()}
+            for future in as_completed(futures):
+                key = futures[future]
+                try:
+                    future.result()
+                    cache[key] = pending[key][Constants.MODEL_NAME]
+                except Exception as e:
+                    print(f"ERR Probing {pending[key][Constants.MODEL_NAME]} failed: {e}")
+                    errors.append(e)
+
+        if len(pending) > 0:
+            self.save_probe_cache(cache)
+        if len(errors) > 0:
+            raise errors[0]
+
+    def existing_instances(self) -> (int, dict[str, set[str]]):
+        """
+        Reads what an earlier run already wrote to the output dataset.
+        :return: the next free id and the permutation ids present per model
+        """
+        return FlatZincInstanceGenerator.existing_instances_in(self.output_folder)
+
+    @staticmethod
+    def existing_instances_in(folder: Path) -> (int, dict[str, set[str]]):
+        """:return: the next free id and the permutation ids present per model of the instances dataset in folder"""
+        if not folder.exists() or not any(folder.glob("**/*.parquet")):
+            return 0, {}
+
+        table = pq.ParquetDataset(folder, schema=Schemas.Parquet.instances).read(
+            columns=[Constants.MODEL_NAME, Constants.ID, Constants.PERMUTATION_ID])
+        existing = {}
+        for model_name, perm_id in zip(table[Constants.MODEL_NAME].to_pylist(), table[Constants.PERMUTATION_ID].to_pylist()):
+            existing.setdefault(model_name, set()).add(perm_id)
+        return pc.max(table[Constants.ID]).as_py() + 1, existing
 
     def run(self):
-        rows = self.reader.read_all().select([Constants.MODEL_NAME, Constants.FLAT_ZINC])
+        rows = pq.read_table(self.feature_vector_file, columns=[Constants.MODEL_NAME, Constants.FLAT_ZINC])
 
-        self.probe()
+        with Tracer.span("probe", "generator"):
+            self.probe()
 
-        id = 0
-        buffer = []
+        self.start()
         for i in range(rows.num_rows):
-            problem_id, fzn_content = rows[0][i].as_py(), rows[1][i].as_py()
+            self.generate_model(rows[0][i].as_py(), rows[1][i].as_py())
+        self.finish()
+
+    def start(self):
+        """Picks up what an earlier run already wrote, then models can be generated one by one."""
+        self.next_id, self.existing = self.existing_instances() if self.append else (0, {})
+        if self.append:
+            print(f"INF: Appending to {sum(len(p) for p in self.existing.values())} existing instances of {len(self.existing)} models, next id is {self.next_id}")
+        self.manifest = self.current_manifest()
+        self.buffer = []
+
+    def generate_model(self, problem_id: str, fzn_content: str) -> int:
+        """
+        Buffers the permutations of one model that are not in the output yet, full buffers are written.
+        :return: the amount of new instances
+        """
+        with Tracer.span("extract_variables", "generator", model=problem_id):
             variables = FlatZincInstanceGenerator.extract_variables(fzn_content)
-            if len(variables) == 0:
-                raise Exception(f"No variables could be extracted from {problem_id} with flatzinc {fzn_content}")
-            print(f"INF: There are {math.factorial(len(variables))} permutations for {problem_id}")
-            print(f"Extracted variables {variables}")
-
-            orderings = self.generate_permutations(variables)
-            for num, res in enumerate(orderings):
-                perm_id, ordering = res
-                ordering_lst = list(ordering)
-
-                buffer.append({
-                    Constants.MODEL_NAME: problem_id,
-                    Constants.ID: id,
-                    Constants.PERMUTATION_ID: perm_id,
-                    Constants.INSTANCE_PERMUTATION: ordering_lst,
-                })
-                id += 1
-
-                if num % FlatZincInstanceGenerator.result_buffer_size == 0:
-                    print(f"Currently at {num} / {len(orderings)} permutations.")
-                    self.write_parquet(buffer)
-                    buffer.clear()
-
-        if len(buffer) > 0:
-            self.write_parquet(buffer)
-
-        self.reader.close()
+        if len(variables) == 0:
+            raise Exception(f"No variables could be extracted from {problem_id} with flatzinc {fzn_content}")
+        print(f"INF: There are {FlatZincInstanceGenerator.factorial(len(variables))} permutations for {problem_id}")
+        print(f"Extracted variables {variables}")
+        self.manifest.set_variables(problem_id, variables)
+
+        if problem_id in self.existing:
+            known = self.existing[problem_id]
+            missing = [rank for rank in self.permutation_ranks(len(variables)) if str(rank) not in known]
+            if len(missing) == 0:
+                print(f"INF: All permutations of {problem_id} already exist, skipping.")
+                return 0
+            print(f"INF: {len(missing)} permutations of {problem_id} are missing.")
+            with Tracer.span("generate_permutations", "generator", model=problem_id, count=len(missing)):
+                orderings = self.generate_permutations_for_ranks(variables, missing)
+        else:
+            with Tracer.span("generate_permutations", "generator", model=problem_id):
+                orderings = self.generate_permutations(variables)
+
+        for num, res in enumerate(orderings):
+            perm_id, ordering = res
+            ordering_lst = list(ordering)
+
+            self.buffer.append({
+                Constants.MODEL_NAME: problem_id,
+                Constants.ID: self.next_id,
+                Constants.PERMUTATION_ID: perm_id,
+                Constants.INSTANCE_PERMUTATION: ordering_lst,
+            })
+            self.next_id += 1
+
+            if num % FlatZincInstanceGenerator.result_buffer_size == 0:
+                print(f"Currently at {num} / {len(orderings)} permutations.")
+                self.flush()
+        return len(orderings)
+
+    def flush(self):
+        if len(self.buffer) > 0:
+            with Tracer.span("write_parquet", "generator", rows=len(self.buffer)):
+                self.write_parquet(self.buffer)
+            self.buffer.clear()
+
+    def finish(self):
+        """Writes the buffered instances and the manifest, the output is then complete up to the last model."""
+        self.flush()
+        self.manifest.save()
+
+    def current_manifest(self) -> WorkloadManifest:
+        """The manifest of the files already in the output folder, rebuilt from their footers if it is missing or out of date."""
+        os.makedirs(self.output_folder, exist_ok=True)
+        manifest = WorkloadManifest.load(self.output_folder)
+        if manifest is None or not manifest.is_current():
+            manifest = WorkloadManifest.scan(self.output_folder, manifest)
+        return manifest
 
     def write_parquet(self, buffer: list[Dict]):
         table = pa.Table.from_pylist(buffer, schema=Schemas.Parquet.instances)
         pq.write_to_dataset(table, root_path=self.output_folder, use_threads=True,
                             schema=Schemas.Parquet.instances,
-                            partition_cols=[Constants.MODEL_NAME], existing_data_behavior="overwrite_or_ignore")
+                            partition_cols=[Constants.MODEL_NAME], existing_data_behavior="overwrite_or_ignore",
+                            row_group_size=FlatZincInstanceGenerator.row_group_size,
+                            file_visitor=self.manifest.file_visitor())
 
     """
     Returns the list of variables extracted from the int_search annotation. 
@@ -118,30 +273,23 @@ class FlatZincInstanceGenerator:
     """
     @staticmethod
     def extract_variables(fzn_content: str) -> list[str]:
-        # First, try to find a direct int_search pattern
-        match = FlatZincInstanceGenerator.int_search_pattern.search(fzn_content.replace('\n', ''))
-
-        if not match:
-            return []
-
-        array_or_var = match.group(1).strip()
-
-        # If the match is an array (starts with '['), extract variables directly
-        if array_or_var.startswith('['):
-            variables = re.findall(FlatZincInstanceGenerator.vars_array_pattern, array_or_var)
-            return variables
-        else:
-            array_name = array_or_var
-            array_pattern = re.compile(rf"{re.escape(array_name)}[^;]*=\s*\[(.*?)\];", re.DOTALL)
-
-            array_match = array_pattern.search(fzn_content.replace('\n', ''))
-
-            if array_match:
-                array_content = array_match.group(1)
-                variables = re.findall(FlatZincInstanceGenerator.vars_array_pattern, array_content)
-                return variables
+        return FlatZincIndex.of(fzn_content).variables()
 
-        return []
+    @staticmethod
+    def factorial(n: int) -> int:
+        """
+        Returns n! from a memo table that is only extended as far as it is actually needed.
+        Each missing entry costs a single multiplication with its predecessor.
+        """
+        table = FlatZincInstanceGenerator.factorials
+        if n < len(table):
+            return table[n]
+        if n >= FlatZincInstanceGenerator.max_factorial:
+            raise ValueError(f"Factorial of {n} exceeds the table bound of {FlatZincInstanceGenerator.max_factorial}")
+        with FlatZincInstanceGenerator.factorial_lock:
+            while len(table) <= n:
+                table.append(table[-1] * len(table))
+        return table[n]
 
     @staticmethod
     def generate_nth_permutation(elements, n):
@@ -153,7 +301,7 @@ class FlatZincInstanceGenerator:
         permutation = []
         cpy = elements.copy()
         while cpy:
-            factorial = FlatZincInstanceGenerator.factorials[len(cpy) - 1]
+            factorial = FlatZincInstanceGenerator.factorial(len(cpy) - 1)
             index = n // factorial  # Determine the index of the element to place
             permutation.append(cpy.pop(index))  # Append result and remove element from cpy to avoid choosing it again
             n %= factorial  # Update n to reflect remaining permutations
@@ -169,15 +317,28 @@ class FlatZincInstanceGenerator:
             result_list.append((str(perm_position), nth_permutation))
         queue.put((start, result_list))
 
+    def permutation_ranks(self, variable_count: int) -> range:
+        """
+        The lexicographic ranks generate_permutations computes for a model with variable_count variables.
+        """
+        perm_count = FlatZincInstanceGenerator.factorial(variable_count)
+        num_computable_perms = min(self.max_permutations, perm_count)
+        stepsize = perm_count // num_computable_perms
+        if self.cutoff_excess_vars:
+            return range(0, stepsize * num_computable_perms, stepsize)  # does not generate more than max_vars
+        return range(0, perm_count, stepsize)
+
     def generate_permutations(self, variables) -> List[Tuple[str, List[str]]]:
-        perm_count = FlatZincInstanceGenerator.factorials[len(variables)]
+        perm_count = FlatZincInstanceGenerator.factorial(len(variables))
         num_computable_perms = min(self.max_permutations, perm_count)
-        workers = min(multiprocessing.cpu_count() - 1, self.max_permutations)
+        workers = max(1, min(multiprocessing.cpu_count() - 1, self.max_permutations))
         chunk_size = perm_count // workers
-        stepsize = perm_count // num_computable_perms
+        ranks = self.permutation_ranks(len(variables))
+        stepsize = ranks.step
         queue = multiprocessing.Queue()
         variables.sort()
 
+        processes = []
         for worker in range(0, workers):
 
             start = worker * chunk_size
@@ -189,14 +350,12 @@ class FlatZincInstanceGenerator:
             if worker < workers - 1:
                 stop = (worker + 1) * chunk_size
             else:
-                if self.cutoff_excess_vars:
-                    stop = stepsize * num_computable_perms  # does not generate more than max_vars
-                else:
-                    stop = perm_count  # fills the slight gap that may exist at the end due to information loss through rounding of stepsize
+                stop = ranks.stop  # without cutoff this fills the slight gap that may exist at the end due to information loss through rounding of stepsize
 
             p = multiprocessing.Process(target=FlatZincInstanceGenerator.generate_range_of_permutations, args=(
                 variables, start, stop, stepsize, queue))
             p.start()
+            processes.append(p)
 
         result_list = [None] * num_computable_perms
         processed = 0
@@ -206,33 +365,112 @@ class FlatZincInstanceGenerator:
             result_list[start_index:start_index + len(chunk)] = chunk
             processed += 1
 
+        # every chunk was received, so no worker still blocks on the queue
+        for p in processes:
+            p.join()
+        return result_list
+
+    @staticmethod
+    def generate_listed_permutations(vars, ranks, position, queue):
+        result_list = []
+        for perm_position in ranks:
+            nth_permutation = FlatZincInstanceGenerator.generate_nth_permutation(vars, perm_position)
+            result_list.append((str(perm_position), nth_permutation))
+        queue.put((position, result_list))
+
+    def generate_permutations_for_ranks(self, variables, ranks: list[int]) -> List[Tuple[str, List[str]]]:
+        """
+        Like generate_permutations, but for an explicit list of ranks, e.g. the ranks missing in an existing dataset.
+        """
+        workers = max(1, min(multiprocessing.cpu_count() - 1, len(ranks)))
+        chunk_size = -(-len(ranks) // workers)
+        queue = multiprocessing.Queue()
+        variables.sort()
+
+        chunks = [ranks[i:i + chunk_size] for i in range(0, len(ranks), chunk_size)]
+        processes = []
+        for position, chunk in enumerate(chunks):
+            p = multiprocessing.Process(target=FlatZincInstanceGenerator.generate_listed_permutations, args=(
+                variables, chunk, position * chunk_size, queue))
+            p.start()
+            processes.append(p)
+
+        result_list = [None] * len(ranks)
+        for _ in range(len(chunks)):
+            position, chunk = queue.get()
+            result_list[position:position + len(chunk)] = chunk
+
+        for p in processes:
+            p.join()
         return result_list
 
     @staticmethod
-    def substitute_variables(fzn_content: str, variables: list[str]) -> str:
-        variables_str = f"[{','.join(variables)}]"
+    def sample_permutation_ranks(perm_count: int, count: int, rng: random.Random, strategy: str = "uniform", exclude: set[int] = frozenset()) -> list[int]:
+        """
+        Draws permutation ranks (lexicographic indices) without the prefix bias of a fixed stride.
+        :param perm_count: size of the permutation space
+        :param count: amount of ranks to draw
+        :param rng: source of randomness, seed it for reproducible samples
+        :param strategy: "uniform" draws from the whole space, "stratified" draws one rank from each of count equal strata
+        :param exclude: ranks that must not be drawn again (e.g. ranks of earlier rounds)
+        :return: sorted list of distinct ranks, shorter than count if the space is exhausted
+        """
+        if strategy not in ("uniform", "stratified"):
+            raise ValueError(f"Unknown sampling strategy {strategy}")
+
+        available = perm_count - len(exclude)
+        if count >= available:
+            return [r for r in range(perm_count) if r not in exclude]
+
+        ranks = set()
+        if strategy == "stratified":
+            # integer bounds, perm_count exceeds the float range above 170 variables
+            for s in range(count):
+                low = s * perm_count // count
+                high = max(low + 1, (s + 1) * perm_count // count)
+                # a few retries inside the stratum, then the rank is drawn from the whole space below
+                for _ in range(8):
+                    r = rng.randrange(low, high)
+                    if r not in exclude and r not in ranks:
+                        ranks.add(r)
+                        break
+
+        while len(ranks) < count:
+            r = rng.randrange(perm_count)
+            if r not in exclude:
+                ranks.add(r)
+
+        return sorted(ranks)
 
-        match = FlatZincInstanceGenerator.int_search_pattern.search(fzn_content.replace('\n', ''))
+    @staticmethod
+    def substitute_variables(fzn_content: str, variables: list[str], strategy: str = None) -> str:
+        """
+        :param strategy: variable selection of the int_search annotation, replaced in the same pass. None keeps it
+        """
+        index = FlatZincIndex.of(fzn_content)
 
-        if not match:
+        if index.search_variables is None:
             raise Exception("No int_search pattern found in FlatZinc")
+        if strategy is not None and index.search_strategy is None:
+            raise Exception(f"No variable selection in the int_search annotation to replace with {strategy}")
 
-        array_or_var = match.group(1).strip()  # either anonymous array [ ... ] or named array
+        span = index.search_array_span()    # either the anonymous array [ ... ] or the declaration of the named array
+        if strategy is None:
+            if span is None:
+                return fzn_content
+            return index.replace(span, f"[{','.join(variables)}]")
 
-        # array is anonymous
-        if array_or_var.startswith('['):
-            return FlatZincInstanceGenerator.int_search_pattern.sub(
-                f"solve :: int_search({variables_str},", fzn_content
-            )
-        # array is named
-        else:
-            array_pattern = re.compile(rf"({re.escape(array_or_var)}[^;]*=\s*)(\[.*?\])(;)", re.DOTALL)
-            fzn_content = array_pattern.sub(rf"\1{variables_str}\3", fzn_content)
-            return fzn_content
+        replacements = [(index.search_strategy, strategy)]
+        if span is not None:
+            replacements.append((span, f"[{','.join(variables)}]"))
+        return index.replace_spans(replacements)
 
     @staticmethod
     def ensure_input_order_annotation(fzn_content: str) -> str:
-        return FlatZincInstanceGenerator.int_search_pattern_extended.sub(rf"\1\2,{'input_order'},\4", fzn_content.replace("\n", ""))
+        index = FlatZincIndex.of(fzn_content)
+        if index.search_strategy is None:
+            return fzn_content
+        return index.replace(index.search_strategy, "input_order")
 
 if __name__ == "__main__":
     generator = FlatZincInstanceGenerator(Path("temp/vectors_big_10.parquet").resolve(), Path("instances.10000_vm").resolve(), 10000)
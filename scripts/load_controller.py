@@ -0,0 +1,105 @@
+import os
+import time
+
+"""
+Sizes the work the Testdriver keeps in memory while it runs, instead of fixed thresholds.
+It watches the job latency reported by the workers, the depth of the job queue and the resident memory of the process,
+and adjusts three knobs: how many jobs are in flight (queued or being solved), how many jobs are loaded at once
+and how many results a spool segment collects before it is folded into Parquet.
+Without memory pressure the in flight jobs cover target_queue_seconds of work and a segment covers fold_seconds of results.
+Above high_water of the memory budget both are halved, growth is limited to doubling per adjustment (AIMD like).
+"""
+class LoadController:
+
+    adjust_interval = 1.0       # seconds between two adjustments
+    target_queue_seconds = 30.0 # work kept in flight, enough to hide the next load
+    fold_seconds = 60.0         # results per spool segment, in seconds of throughput
+    high_water = 0.85           # fraction of the memory budget above which the knobs shrink
+    low_water = 0.6             # fraction of the memory budget below which they may grow
+    latency_smoothing = 0.2     # weight of a new observation in the moving average of the job latency
+
+    def __init__(self, num_workers: int, job_batch_size: int, max_in_flight: int, max_flush_rows: int,
+                 memory_budget: int = None):
+        """
+        :param max_in_flight: upper bound of the in flight jobs, the start value
+        :param max_flush_rows: upper bound of the spool segment rows, the start value
+        :param memory_budget: bytes of resident memory the process should stay below, None to only follow the latency
+        """
+        self.num_workers = num_workers
+        self.min_in_flight = num_workers * job_batch_size   # every worker can claim a full batch
+        self.max_in_flight = max(max_in_flight, self.min_in_flight)
+        self.min_flush_rows = job_batch_size
+        self.max_flush_rows = max(max_flush_rows, self.min_flush_rows)
+        self.memory_budget = memory_budget
+
+        self.in_flight = self.max_in_flight
+        self.flush_rows = self.max_flush_rows
+        self.latency = None         # seconds per job, moving average
+        self.rss = None
+        self.last_adjustment = time.monotonic()
+
+    @property
+    def load_size(self) -> int:
+        """Jobs loaded at once, the queue is refilled once half of the in flight jobs are done."""
+        return max(self.min_in_flight // 2, self.in_flight // 2)
+
+    def should_load(self, jobs_in_flight: int) -> bool:
+        return jobs_in_flight <= self.in_flight - self.load_size
+
+    @staticmethod
+    def resident_memory() -> int | None:
+        """Current resident set size of the process in bytes, None where /proc is not available."""
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError, AttributeError):
+            return None
+
+    def observe(self, jobs: int, seconds: float):
+        """Records that a worker solved jobs in seconds."""
+        if jobs <= 0:
+            return
+        latency = seconds / jobs
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += LoadController.latency_smoothing * (latency - self.latency)
+
+    def adjust(self, queue_depth: int = None, force: bool = False) -> bool:
+        """
+        Recomputes the knobs, at most once per adjust_interval unless forced.
+        :param queue_depth: jobs waiting for a worker. An empty queue means the workers starve, the in flight jobs grow.
+        :return: whether the knobs were recomputed
+        """
+        now = time.monotonic()
+        if not force and now - self.last_adjustment < LoadController.adjust_interval:
+            return False
+        self.last_adjustment = now
+        self.rss = LoadController.resident_memory()
+
+        if self.memory_budget is not None and self.rss is not None and self.rss > LoadController.high_water * self.memory_budget:
+            self.in_flight = max(self.min_in_flight, self.in_flight // 2)
+            self.flush_rows = max(self.min_flush_rows, self.flush_rows // 2)
+            return True
+        if self.memory_budget is not None and self.rss is not None and self.rss > LoadController.low_water * self.memory_budget:
+            return True     # hold, between the water marks
+
+        if self.latency is not None and self.latency > 0:
+            throughput = self.num_workers / self.latency    # jobs per second
+            in_flight = int(throughput * LoadController.target_queue_seconds)
+            if queue_depth == 0:
+                in_flight = max(in_flight, 2 * self.in_flight)
+            flush_rows = int(throughput * LoadController.fold_seconds)
+            self.in_flight = LoadController.clamp(in_flight, self.min_in_flight, min(self.max_in_flight, 2 * self.in_flight))
+            self.flush_rows = LoadController.clamp(flush_rows, self.min_flush_rows, min(self.max_flush_rows, 2 * self.flush_rows))
+        return True
+
+    @staticmethod
+    def clamp(value: int, low: int, high: int) -> int:
+        return max(low, min(value, high))
+
+    def report(self) -> str:
+        rss = f"{self.rss / 2**20:.0f}MB" if self.rss is not None else "unknown"
+        budget = f" of {self.memory_budget / 2**20:.0f}MB" if self.memory_budget is not None else ""
+        latency = f"{self.latency * 1000:.1f}ms" if self.latency is not None else "unknown"
+        return f"in flight {self.in_flight}, load {self.load_size}, flush {self.flush_rows} rows, latency {latency}/job, rss {rss}{budget}"
@@ -1,24 +1,103 @@
 import argparse
+import importlib
+import sys
+import time
 from pathlib import Path
 
-from feature_extraction import FeatureVectorExtractor
-from instance_generator import FlatZincInstanceGenerator
-from testdriver import Testdriver
+# Heavy dependencies are only imported once the subcommand is known.
+# They are listed before the project module that pulls them in, so their import time is attributed to them.
+subcommand_modules = {
+    'generate': ['pyarrow', 'pyarrow.parquet', 'instance_generator'],
+    'test': ['pyarrow', 'pyarrow.parquet', 'duckdb', 'jsonschema', 'numpy', 'catalog', 'censoring', 'summary', 'cost_model', 'testdriver'],
+    'extract': ['pyarrow', 'pyarrow.parquet', 'jsonschema', 'feature_extraction'],
+    'sample': ['pyarrow', 'pyarrow.parquet', 'duckdb', 'jsonschema', 'adaptive_sampler'],
+    'bench': ['pyarrow', 'pyarrow.parquet', 'duckdb', 'jsonschema', 'benchmark'],
+    'synth': ['pyarrow', 'pyarrow.parquet', 'synthetic'],
+    'costmodel': ['numpy', 'pyarrow', 'pyarrow.parquet', 'duckdb', 'summary', 'cost_model'],
+    'pipeline': ['pyarrow', 'pyarrow.parquet', 'duckdb', 'jsonschema', 'numpy', 'feature_extraction', 'instance_generator', 'testdriver', 'pipeline'],
+}
+command_aliases = {'-g': 'generate', '-t': 'test', '-e': 'extract', '-s': 'sample', '-b': 'bench', '-y': 'synth', '-c': 'costmodel', '-p': 'pipeline'}
+
+
+def import_subcommand_modules(command: str) -> (dict, list[tuple[str, float]]):
+    """
+    Imports the modules required by a subcommand.
+    :return: the imported modules by name and the time each import took in seconds
+    """
+    modules = {}
+    timings = []
+    for module_name in subcommand_modules[command]:
+        start = time.perf_counter()
+        modules[module_name] = importlib.import_module(module_name)
+        timings.append((module_name, time.perf_counter() - start))
+    return modules, timings
+
+
+def censoring_policy(args, modules: dict):
+    if args.censor_multiple is None:
+        return None
+    return modules['censoring'].CensoringPolicy(multiple=args.censor_multiple, quantile=args.censor_quantile, limit_type=args.censor_limit)
+
+
+def resource_limits(args) -> "ResourceLimits":
+    from minizinc_wrapper import ResourceLimits
+    memory_bytes = args.memory_limit * 1024 * 1024 if args.memory_limit is not None else None
+    return ResourceLimits(cpu_seconds=args.cpu_limit, memory_bytes=memory_bytes, wall_seconds=args.wall_limit)
+
+
+def select_backend(args):
+    from minizinc_wrapper import MinizincWrapper
+    if args.backend == 'stub':
+        MinizincWrapper.use_backend('stub', latency=args.stub_latency, latency_distribution=args.stub_latency_distribution)
+    elif args.backend == 'cli':
+        MinizincWrapper.use_backend('cli', executable=args.minizinc.resolve() if args.minizinc is not None else None)
+    else:
+        MinizincWrapper.use_backend(args.backend)
+
+
+def report_import_timings(timings: list[tuple[str, float]]):
+    print("Startup import timings:", file=sys.stderr)
+    for module_name, seconds in timings:
+        print(f"  {module_name:<24} {seconds * 1000:9.2f} ms", file=sys.stderr)
+    print(f"  {'total':<24} {sum(s for _, s in timings) * 1000:9.2f} ms", file=sys.stderr)
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='CMDline Utility for feature extraction, instance generation and testing of csplib instances.')
+    parser.add_argument('--profile-startup', action='store_true', default=False,
+                        help='Report how long the imports of the selected subcommand took')
+    # choices are checked once the subcommand is known, importing minizinc_wrapper here would slow down every start
+    parser.add_argument('--backend', default='cli',
+                        help='How MiniZinc is invoked, "cli" or "stub". The stub answers with synthetic statistics without solving')
+    parser.add_argument('--minizinc', type=Path, default=None,
+                        help='MiniZinc executable of the cli backend, defaults to $MINIZINC_EXECUTABLE or the libminizinc build')
+    parser.add_argument('--stub_latency', type=float, default=0.0, help='Mean seconds per solve of the stub backend')
+    parser.add_argument('--stub_latency_distribution', default='constant',
+                        help='Distribution of the stub solve latency: constant, exponential or lognormal')
+    parser.add_argument('--trace', type=Path, default=None,
+                        help='Record per stage spans and write them as Chrome trace JSON (chrome://tracing, ui.perfetto.dev)')
+    parser.add_argument('--trace_sample_rate', type=float, default=1.0, help='Fraction of jobs whose spans are recorded')
     subparsers = parser.add_subparsers(dest='command')
+
+    # resource limits of every MiniZinc call, shared by all subcommands that invoke MiniZinc
+    limits_parser = argparse.ArgumentParser(add_help=False)
+    limits_parser.add_argument('--cpu_limit', type=int, default=None, help='CPU seconds per MiniZinc call')
+    limits_parser.add_argument('--memory_limit', type=int, default=None, help='Address space in MB per MiniZinc call')
+    limits_parser.add_argument('--wall_limit', type=float, default=None, help='Wall clock seconds per MiniZinc call')
+
     # FlatZincInstanceGenerator command with short options
-    parser_fz = subparsers.add_parser('generate', aliases=['-g'], help='Generate FlatZinc instances')
+    parser_fz = subparsers.add_parser('generate', aliases=['-g'], parents=[limits_parser], help='Generate FlatZinc instances')
     parser_fz.add_argument('-f', '--feature_vector_parquet_input_file', type=Path, required=True,
                            help='Input Parquet file for feature vectors')
     parser_fz.add_argument('-o', '--instances_parquet_output', type=Path, required=True,
                            help='Output folder for instances Parquet files')
     parser_fz.add_argument('-t', '--max_perms', type=int, required=True, help='Maximum number of permutations to compute per problem')
     parser_fz.add_argument('-c', '--cutoff_excess', action='store_true', help='Cut off excess variables', default=False)
+    parser_fz.add_argument('-a', '--append', action='store_true', default=False,
+                           help='Only generate models and permutations missing in the existing output, continuing its ids')
 
     # Testdriver command with short options
-    parser_td = subparsers.add_parser('test', aliases=['-t'], help='Run the test driver')
+    parser_td = subparsers.add_parser('test', aliases=['-t'], parents=[limits_parser], help='Run the test driver')
     parser_td.add_argument('-f', '--feature_vector_parquet', type=Path, required=True,
                            help='Feature vector Parquet file')
     parser_td.add_argument('-w', '--workload_parquet_folder', type=Path, required=True,
@@ -26,13 +105,99 @@ if __name__ == '__main__':
     parser_td.add_argument('-o', '--output_folder', type=Path, required=True, help='Output folder for results')
     parser_td.add_argument('-l', '--log_path', type=Path, required=True, help='Log file path')
     parser_td.add_argument('-b', '--backup_path', type=Path, required=True, help='Backup file path')
+    parser_td.add_argument('-m', '--memory_budget', type=int, default=None,
+                           help='Resident memory in MB the driver should stay below, queued jobs and spool segments shrink to fit')
+    parser_td.add_argument('--censor_multiple', type=float, default=None,
+                           help='Limit every solve to this multiple of the running per model quantile, hits are recorded as censored')
+    parser_td.add_argument('--censor_quantile', type=float, default=0.5, help='Quantile the censoring limit is based on')
+    parser_td.add_argument('--censor_limit', choices=['fail', 'node'], default='fail', help='Solver limit used for censoring')
+    parser_td.add_argument('--cost_model', type=Path, default=None,
+                           help='Cost model JSON, predicts the run time per model and cuts probing to one sample per model')
+    parser_td.add_argument('--configurations', type=str, nargs='+', default=None,
+                           help='Matrix mode, solve every job with each strategy@solver configuration, e.g. input_order@gecode first_fail@chuffed. '
+                                'Solvers other than gecode need feature vectors extracted with --backends')
+    parser_td.add_argument('--tune_threads', action='store_true', default=False,
+                           help='Let probing choose parallel search per model, the threads are recorded in every row')
+    parser_td.add_argument('--catalog', type=Path, default=None,
+                           help='DuckDB file caching workload and result metadata between runs, only new files are scanned on resume')
 
     # FeatureVectorExtractor command with short options
-    parser_fve = subparsers.add_parser('extract', aliases=['-e'], help='Extract feature vectors')
+    parser_fve = subparsers.add_parser('extract', aliases=['-e'], parents=[limits_parser], help='Extract feature vectors')
     parser_fve.add_argument('-i', '--input_files', type=Path, required=True,
                             help='Input files for feature extraction')
     parser_fve.add_argument('-o', '--parquet_output_file', type=Path, required=True,
                             help='Output Parquet file for feature vectors')
+    parser_fve.add_argument('-r', '--resume', action='store_true', default=False,
+                            help='Keep the vectors already in the output file and only extract missing models')
+    parser_fve.add_argument('-c', '--cache_dir', type=Path, default=None,
+                            help='Folder of a compile cache, unchanged models are not compiled again')
+    parser_fve.add_argument('-d', '--with_data_files', action='store_true', default=False,
+                            help='Extract every model with every .dzn file of its problem')
+    parser_fve.add_argument('-b', '--backends', nargs='+', default=None,
+                            help='Solver backends (e.g. cp gecode api) every model is extracted for, rows are tagged with their backend')
+
+    # AdaptiveSampler command with short options
+    parser_as = subparsers.add_parser('sample', aliases=['-s'], parents=[limits_parser], help='Sample and solve orderings until per model statistics converge')
+    parser_as.add_argument('-f', '--feature_vector_parquet', type=Path, required=True,
+                           help='Feature vector Parquet file')
+    parser_as.add_argument('-i', '--instances_parquet_output', type=Path, required=True,
+                           help='Output folder for the sampled instances Parquet files')
+    parser_as.add_argument('-o', '--output_folder', type=Path, required=True, help='Output folder for results')
+    parser_as.add_argument('-l', '--log_path', type=Path, required=True, help='Log file path')
+    parser_as.add_argument('-t', '--max_perms', type=int, required=True, help='Maximum number of permutations to solve per problem')
+    parser_as.add_argument('-r', '--round_size', type=int, default=50, help='Permutations solved per problem and round')
+    parser_as.add_argument('-m', '--min_samples', type=int, default=30, help='Samples required before convergence is checked')
+    parser_as.add_argument('-w', '--target_width', type=float, default=0.1,
+                           help='Confidence interval width relative to the mean at which a problem is converged')
+    parser_as.add_argument('-c', '--confidence', type=float, default=0.95, choices=[0.90, 0.95, 0.99], help='Confidence level')
+    parser_as.add_argument('--strategy', choices=['uniform', 'stratified'], default='stratified', help='Rank sampling strategy')
+    parser_as.add_argument('--seed', type=int, default=None, help='Seed for reproducible samples')
+
+    # Benchmark command with short options
+    parser_bm = subparsers.add_parser('bench', aliases=['-b'], help='Benchmark the hot paths on synthetic models')
+    parser_bm.add_argument('-o', '--output_folder', type=Path, default=Path('bench'), help='Folder of the history and the baseline')
+    parser_bm.add_argument('-s', '--sizes', type=int, nargs='+', default=None, help='Variables of the synthetic models')
+    parser_bm.add_argument('-c', '--cases', nargs='+', default=None, help='Benchmark cases to run, all by default')
+    parser_bm.add_argument('-b', '--baseline_file', type=Path, default=None, help='Baseline JSON, defaults to <output_folder>/baseline.json')
+    parser_bm.add_argument('--save_baseline', action='store_true', default=False, help='Store this run as the new baseline')
+    parser_bm.add_argument('--fail_on_regression', action='store_true', default=False,
+                           help='Exit with 1 if a case is slower than the baseline allows')
+
+    # Synthetic workload command with short options
+    parser_sy = subparsers.add_parser('synth', aliases=['-y'], help='Write a synthetic workload of scalable FlatZinc models')
+    parser_sy.add_argument('-o', '--output_folder', type=Path, required=True,
+                           help='Folder for the models, feature_vectors.parquet and the instances dataset')
+    parser_sy.add_argument('-v', '--variables', type=int, nargs='+', default=[10, 100, 1000], help='Search variables, one model per value')
+    parser_sy.add_argument('-c', '--constraints_per_variable', type=float, default=None,
+                           help='Constraints relative to the search variables, defaults to 1')
+    parser_sy.add_argument('-a', '--anonymous_search', action='store_true', default=False,
+                           help='Search on a [...] literal instead of a named array')
+    parser_sy.add_argument('-b', '--target_mb', type=float, default=0, help='Pad every model to at least this many MB of FlatZinc')
+    parser_sy.add_argument('-n', '--instances_per_model', type=int, default=1000, help='Orderings per model')
+    parser_sy.add_argument('--seed', type=int, default=None, help='Seed for reproducible workloads')
+
+    # Cost model command with short options
+    parser_cm = subparsers.add_parser('costmodel', aliases=['-c'], help='Train a runtime predictor on feature vectors and results')
+    parser_cm.add_argument('-f', '--feature_vector_parquet', type=Path, required=True, help='Feature vector Parquet file')
+    parser_cm.add_argument('-r', '--results_folder', type=Path, required=True, help='Results dataset of earlier test driver runs')
+    parser_cm.add_argument('-o', '--output_file', type=Path, required=True, help='JSON file the cost model is written to')
+    parser_cm.add_argument('-a', '--alpha', type=float, default=1.0, help='Ridge regularisation strength')
+
+    # Pipeline command with short options
+    parser_pl = subparsers.add_parser('pipeline', aliases=['-p'], parents=[limits_parser],
+                                      help='Extract, generate and test as concurrent stages, solving starts with the first model')
+    parser_pl.add_argument('-i', '--input_files', type=Path, required=True, help='Input files for feature extraction')
+    parser_pl.add_argument('-d', '--with_data_files', action='store_true', default=False,
+                           help='Extract every model with every .dzn file of its problem')
+    parser_pl.add_argument('-f', '--feature_vector_parquet', type=Path, required=True, help='Feature vector Parquet file, resumed if it exists')
+    parser_pl.add_argument('-w', '--workload_parquet_folder', type=Path, required=True, help='Folder for workload Parquet files')
+    parser_pl.add_argument('-t', '--max_perms', type=int, required=True, help='Maximum number of permutations to compute per problem')
+    parser_pl.add_argument('-o', '--output_folder', type=Path, required=True, help='Output folder for results')
+    parser_pl.add_argument('-l', '--log_path', type=Path, required=True, help='Log file path')
+    parser_pl.add_argument('-b', '--backup_path', type=Path, required=True, help='Backup file path')
+    parser_pl.add_argument('--cutoff_excess', action='store_true', default=False, help='Cut off excess variables')
+    parser_pl.add_argument('--cache_dir', type=Path, default=None,
+                           help='Folder of a compile cache, unchanged models are not compiled again')
 
     args = parser.parse_args()
 
@@ -52,30 +217,135 @@ if __name__ == '__main__':
     # Path('temp/set_partition.mzn').resolve(),                 #as is (uses set_search)
     # ]
 
-    if args.command in ['generate', '-g']:
-        generator = FlatZincInstanceGenerator(
+    command = command_aliases.get(args.command, args.command)
+    if command is None:
+        parser.print_help()
+        sys.exit(1)
+
+    modules, import_timings = import_subcommand_modules(command)
+    if args.profile_startup:
+        report_import_timings(import_timings)
+    from minizinc_wrapper import MinizincWrapper, StubBackend
+    from tracing import Tracer
+    if args.backend not in MinizincWrapper.backends:
+        parser.error(f"argument --backend: invalid choice: '{args.backend}' (choose from {', '.join(MinizincWrapper.backends)})")
+    if args.stub_latency_distribution not in StubBackend.latency_distributions:
+        parser.error(f"argument --stub_latency_distribution: invalid choice: '{args.stub_latency_distribution}' "
+                     f"(choose from {', '.join(StubBackend.latency_distributions)})")
+    select_backend(args)
+    if args.trace is not None:
+        Tracer.configure(args.trace.resolve(), args.trace_sample_rate)
+
+    if command == 'generate':
+        generator = modules['instance_generator'].FlatZincInstanceGenerator(
             feature_vector_parquet_input_file=args.feature_vector_parquet_input_file,
             instances_parquet_output=args.instances_parquet_output,
-            max_perms=args.targeted_vars,
-            cutoff_excess=args.cutoff_excess
+            max_perms=args.max_perms,
+            cutoff_excess=args.cutoff_excess,
+            append=args.append,
+            limits=resource_limits(args)
         )
         generator.run()
 
-    elif args.command in ['test', '-t']:
-        test_driver = Testdriver(
+    elif command == 'test':
+        test_driver = modules['testdriver'].Testdriver(
             feature_vector_parquet=args.feature_vector_parquet,
             workload_parquet_folder=args.workload_parquet_folder,
             output_folder=args.output_folder,
             log_path=args.log_path,
-            backup_path=args.backup_path
+            backup_path=args.backup_path,
+            limits=resource_limits(args),
+            memory_budget=args.memory_budget * 1024 * 1024 if args.memory_budget is not None else None,
+            censoring=censoring_policy(args, modules),
+            tune_threads=args.tune_threads,
+            cost_model=modules['cost_model'].CostModel.load(args.cost_model) if args.cost_model is not None else None,
+            configurations=[modules['testdriver'].SolverConfiguration.parse(c) for c in args.configurations]
+            if args.configurations is not None else None,
+            catalog_file=args.catalog
         )
         test_driver.run()
 
-    elif args.command in ['extract', '-e']:
+    elif command == 'extract':
+        FeatureVectorExtractor = modules['feature_extraction'].FeatureVectorExtractor
+        if args.with_data_files:
+            input_files = FeatureVectorExtractor.input_matrix_helper(args.input_files)
+        else:
+            input_files = FeatureVectorExtractor.input_format_helper(args.input_files)
         extractor = FeatureVectorExtractor(
-            input_files=FeatureVectorExtractor.input_format_helper(args.input_files),
-            parquet_output_file=args.parquet_output_file
+            input_files=input_files,
+            parquet_output_file=args.parquet_output_file,
+            resume=args.resume,
+            cache_dir=args.cache_dir,
+            backends=args.backends,
+            limits=resource_limits(args)
         )
         extractor.run()
 
+    elif command == 'sample':
+        sampler = modules['adaptive_sampler'].AdaptiveSampler(
+            feature_vector_parquet=args.feature_vector_parquet,
+            instances_parquet_output=args.instances_parquet_output,
+            output_folder=args.output_folder,
+            log_path=args.log_path,
+            max_perms=args.max_perms,
+            round_size=args.round_size,
+            min_samples=args.min_samples,
+            target_width=args.target_width,
+            confidence=args.confidence,
+            strategy=args.strategy,
+            seed=args.seed,
+            limits=resource_limits(args)
+        )
+        sampler.run()
 
+    elif command == 'synth':
+        synthetic = modules['synthetic']
+        specs = [synthetic.ModelSpec(
+            variables=v,
+            constraints=max(1, int(v * args.constraints_per_variable)) if args.constraints_per_variable is not None else None,
+            anonymous_search=args.anonymous_search,
+            target_bytes=int(args.target_mb * 1024 * 1024)
+        ) for v in args.variables]
+        workload = synthetic.SyntheticWorkload(
+            output_folder=args.output_folder.resolve(),
+            specs=specs,
+            instances_per_model=args.instances_per_model,
+            seed=args.seed
+        )
+        workload.run()
+
+    elif command == 'pipeline':
+        FeatureVectorExtractor = modules['feature_extraction'].FeatureVectorExtractor
+        if args.with_data_files:
+            input_files = FeatureVectorExtractor.input_matrix_helper(args.input_files)
+        else:
+            input_files = FeatureVectorExtractor.input_format_helper(args.input_files)
+        pipeline = modules['pipeline'].Pipeline(
+            input_files=input_files,
+            feature_vector_parquet=args.feature_vector_parquet,
+            instances_folder=args.workload_parquet_folder,
+            output_folder=args.output_folder,
+            log_path=args.log_path,
+            backup_path=args.backup_path,
+            max_perms=args.max_perms,
+            cutoff_excess=args.cutoff_excess,
+            cache_dir=args.cache_dir,
+            limits=resource_limits(args)
+        )
+        pipeline.run()
+
+    elif command == 'costmodel':
+        cost_model = modules['cost_model'].CostModel.train(args.feature_vector_parquet, args.results_folder, args.alpha)
+        cost_model.save(args.output_file)
+
+    elif command == 'bench':
+        benchmark = modules['benchmark'].Benchmark(
+            output_folder=args.output_folder.resolve(),
+            sizes=args.sizes,
+            cases=args.cases,
+            baseline_file=args.baseline_file,
+            save_baseline=args.save_baseline
+        )
+        benchmark.run()
+        if args.fail_on_regression and benchmark.regressions:
+            sys.exit(1)
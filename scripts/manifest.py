@@ -0,0 +1,132 @@
+import json
+import os
+from pathlib import Path
+from urllib.parse import unquote
+
+import pyarrow.parquet as pq
+
+from schemas import Constants
+
+"""
+Manifest of a workload dataset, written by the instance generator next to its Parquet files as _manifest.json.
+It holds the id ranges, job counts and search variables per model and every file with the id bounds of its row groups,
+so the Testdriver starts without scanning the workload and opens only the files of the ids it loads.
+Files are stored relative to the workload folder together with their size, a manifest that no longer matches
+the files on disk can be rebuilt from the Parquet footers with scan().
+"""
+class WorkloadManifest:
+
+    file_name = "_manifest.json"    # underscore prefixed files are ignored by parquet dataset readers
+    version = 1
+
+    def __init__(self, folder: Path, models: dict[str, dict] = None, files: list[dict] = None):
+        self.folder = folder
+        self.models = models if models is not None else {}  # model name -> ranges [[min id, max id]], jobs, variables
+        self.files = files if files is not None else []     # path, size, model name, row groups [[min id, max id, rows]]
+
+    @staticmethod
+    def list_files(folder: Path) -> dict[str, tuple[int, float]]:
+        """Parquet files below folder with their size and modification time. Like pyarrow, _ and . entries are skipped."""
+        files = {}
+        for root, dirs, names in os.walk(folder):
+            dirs[:] = [d for d in dirs if not d.startswith(("_", "."))]
+            for name in names:
+                if name.endswith(".parquet") and not name.startswith(("_", ".")):
+                    stat = os.stat(os.path.join(root, name))
+                    files[str(Path(root, name))] = (stat.st_size, stat.st_mtime)
+        return files
+
+    def set_variables(self, model: str, variables: list[str]):
+        self.models.setdefault(model, {"ranges": [], "jobs": 0})["variables"] = variables
+
+    def add_file(self, path: str, metadata: pq.FileMetaData):
+        """Adds a written file of the dataset, its model is taken from the hive partition folder."""
+        model = unquote(Path(path).parent.name.split("=", 1)[1])
+        column = metadata.schema.to_arrow_schema().get_field_index(Constants.ID)
+        row_groups = []
+        for i in range(metadata.num_row_groups):
+            row_group = metadata.row_group(i)
+            if row_group.num_rows == 0:
+                continue
+            statistics = row_group.column(column).statistics
+            row_groups.append([statistics.min, statistics.max, row_group.num_rows])
+
+        entry = self.models.setdefault(model, {"ranges": [], "jobs": 0})
+        for low, high, rows in row_groups:
+            entry["jobs"] += rows
+            ranges = entry["ranges"]
+            if len(ranges) > 0 and ranges[-1][1] + 1 == low:
+                ranges[-1][1] = high
+            else:
+                ranges.append([low, high])
+                ranges.sort()
+        self.files.append({
+            "path": os.path.relpath(path, self.folder),
+            "size": os.path.getsize(path),
+            Constants.MODEL_NAME: model,
+            "row_groups": row_groups,
+        })
+
+    def file_visitor(self):
+        """Callback for pq.write_to_dataset that adds every written file."""
+        return lambda written_file: self.add_file(written_file.path, written_file.metadata)
+
+    def save(self):
+        temp_file = self.folder / (WorkloadManifest.file_name + ".tmp")
+        with open(temp_file, 'w') as f:
+            json.dump({"version": WorkloadManifest.version, "models": self.models, "files": self.files}, f)
+        os.replace(temp_file, self.folder / WorkloadManifest.file_name)
+
+    @staticmethod
+    def load(folder: Path) -> "WorkloadManifest | None":
+        """:return: the manifest of folder, None if there is none"""
+        path = folder / WorkloadManifest.file_name
+        if not path.exists():
+            return None
+        with open(path, 'r') as f:
+            manifest = json.load(f)
+        if manifest["version"] != WorkloadManifest.version:
+            return None
+        return WorkloadManifest(folder, manifest["models"], manifest["files"])
+
+    @staticmethod
+    def scan(folder: Path, previous: "WorkloadManifest" = None) -> "WorkloadManifest":
+        """
+        Builds the manifest of a dataset from the footers of its files, without reading any rows.
+        :param previous: earlier manifest the variables of the models are taken from, footers do not hold them
+        """
+        manifest = WorkloadManifest(folder)
+        for path in sorted(WorkloadManifest.list_files(folder)):
+            manifest.add_file(path, pq.read_metadata(path))
+        if previous is not None:
+            for model, entry in previous.models.items():
+                if model in manifest.models and "variables" in entry:
+                    manifest.models[model]["variables"] = entry["variables"]
+        return manifest
+
+    def is_current(self) -> bool:
+        """True if the manifest lists exactly the files on disk, with their sizes."""
+        on_disk = WorkloadManifest.list_files(self.folder)
+        listed = {str(self.folder / f["path"]): f["size"] for f in self.files}
+        return listed == {path: size for path, (size, _) in on_disk.items()}
+
+    def id_range(self) -> (int | None, int | None):
+        ranges = [r for entry in self.models.values() for r in entry["ranges"]]
+        if len(ranges) == 0:
+            return None, None
+        return min(low for low, _ in ranges), max(high for _, high in ranges)
+
+    def jobs(self) -> int:
+        return sum(entry["jobs"] for entry in self.models.values())
+
+    def source(self, low: int = None, high: int = None) -> str | None:
+        """
+        SQL table expression over the files with row groups that hold ids in [low, high), all files without a range.
+        The row group bounds are tight, so DuckDB skips every other row group of these files by its statistics.
+        :return: None if no file overlaps the range
+        """
+        files = [str(self.folder / f["path"]) for f in self.files
+                 if low is None or any(max_id >= low and min_id < high for min_id, max_id, _ in f["row_groups"])]
+        if len(files) == 0:
+            return None
+        return f"read_parquet({files!r}, hive_partitioning = true)"
@@ -1,27 +1,294 @@
+import functools
+import json
+import math
+import os
+import random
+import re
+import signal
 import subprocess
+import time
+import zlib
 from pathlib import Path
+from typing import NamedTuple
+
+from tracing import Tracer
+
+try:
+    import resource     # POSIX only, limits are not applied on other platforms
+except ImportError:
+    resource = None
+
+
+class ResourceLimits(NamedTuple):
+    cpu_seconds: int | None = None      # RLIMIT_CPU of the MiniZinc process
+    memory_bytes: int | None = None     # RLIMIT_AS of the MiniZinc process
+    wall_seconds: float | None = None   # the whole process group is killed after this time
+
+
+class MinizincResult(NamedTuple):
+    returncode: int
+    output: list[str]
+    status: str     # one of MinizincWrapper.STATUS_*
+
+
+class CliBackend:
+    """
+    Invokes the minizinc executable with arguments and captures the output.
+    """
+
+    def __init__(self, executable: Path = None):
+        self.executable = executable    # None falls back to MinizincWrapper.minizinc_executable
+
+    def run(self, args, stdin=None, limits: ResourceLimits = None) -> MinizincResult:
+        limits = limits if limits is not None else ResourceLimits()
+        use_rlimits = resource is not None and (limits.cpu_seconds is not None or limits.memory_bytes is not None)
+        executable = self.executable if self.executable is not None else MinizincWrapper.minizinc_executable
+
+        # the limits are set by the shell, preexec_fn is not safe while other threads spawn solvers
+        prefix = MinizincWrapper.ulimit_prefix(limits) if use_rlimits else ""
+        command = f"{prefix}{executable} {args}"
+        with Tracer.span("spawn", "solver"):
+            process = subprocess.Popen(command,
+                                       shell=True,
+                                       text=True,
+                                       stdin=subprocess.PIPE if stdin is not None else None,
+                                       stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE,
+                                       cwd=executable.parent,
+                                       start_new_session=True,
+            )
+
+        with Tracer.span("communicate", "solver"):
+            try:
+                stdout, stderr = process.communicate(input=stdin, timeout=limits.wall_seconds)
+                status = MinizincWrapper.classify(process.returncode, stderr, limits)
+            except subprocess.TimeoutExpired:
+                MinizincWrapper.kill_process_group(process)
+                stdout, stderr = process.communicate()
+                status = MinizincWrapper.STATUS_WALL_TIMEOUT
+
+        if status != MinizincWrapper.STATUS_OK:
+            print(f"Command failed ({status}) with error: {stdout.strip(), stderr.strip()}")
+
+        return MinizincResult(process.returncode, stdout.strip().split('\n'), status)
+
+
+class StubBackend:
+    """
+    Answers like the minizinc executable without solving anything, for load tests of the pipeline.
+    Model checks always succeed and solves emit a solution, status and statistics line of the json stream.
+    The statistics are drawn from a generator seeded with the input, so the same job always gets the same numbers.
+    Failures follow a log-normal distribution, the solve latency one of latency_distributions.
+    A --fail or --node limit below the drawn search stops the run without a solution, like gecode does.
+    Feature vector compilations treat the model file as FlatZinc: it is copied to the output file and the feature vector
+    is counted from its variable, constraint and solve items, enough for the synthetic models.
+    """
+
+    latency_distributions = ["constant", "exponential", "lognormal"]
+    parallel_efficiency = 0.8   # n threads (-p n) solve n ** parallel_efficiency times faster
+
+    def __init__(self, latency: float = 0.0, latency_distribution: str = "constant", failures_median: float = 1000.0,
+                 failures_sigma: float = 2.0):
+        """
+        :param latency: mean seconds a solve takes, the stub really sleeps that long
+        """
+        if latency_distribution not in StubBackend.latency_distributions:
+            raise ValueError(f"Latency distribution must be one of {StubBackend.latency_distributions}")
+        self.latency = latency
+        self.latency_distribution = latency_distribution
+        self.failures_mu = math.log(failures_median)
+        self.failures_sigma = failures_sigma
+
+    def draw_latency(self, rng: random.Random) -> float:
+        if self.latency <= 0:
+            return 0.0
+        if self.latency_distribution == "exponential":
+            return rng.expovariate(1 / self.latency)
+        if self.latency_distribution == "lognormal":
+            sigma = 1.0
+            return rng.lognormvariate(math.log(self.latency) - sigma ** 2 / 2, sigma)   # mean equals latency
+        return self.latency
+
+    def run(self, args, stdin=None, limits: ResourceLimits = None) -> MinizincResult:
+        limits = limits if limits is not None else ResourceLimits()
+
+        if "--version" in args:
+            return MinizincResult(0, ["MiniZinc stub backend"], MinizincWrapper.STATUS_OK)
+        if "--model-check-only" in args:
+            return MinizincResult(0, [""], MinizincWrapper.STATUS_OK)
+        if "--feature-vector" in args:
+            return self.compile(args)
+        if "--solver-statistics" not in args or stdin is None:
+            return MinizincResult(1, [""], MinizincWrapper.STATUS_ERROR)
+        from schemas import Constants   # deferred, schemas pulls in pyarrow and this module is imported by every CLI start
+
+        # limits and threads are left out of the seed, a limited run is the prefix of the unlimited one
+        cutoff = re.search(r" --(fail|node) (\d+)", args)
+        parallel = re.search(r" -p (\d+)", args)
+        seed_args = args
+        for option in (cutoff, parallel):
+            seed_args = seed_args.replace(option.group(0), "") if option is not None else seed_args
+        rng = random.Random(zlib.crc32(stdin.encode()) ^ zlib.crc32(seed_args.encode()))
+        latency = self.draw_latency(rng)
+        if parallel is not None:
+            latency /= int(parallel.group(1)) ** StubBackend.parallel_efficiency
+        failures = int(rng.lognormvariate(self.failures_mu, self.failures_sigma))
+        nodes = 2 * failures + 1
+
+        solved = True
+        if cutoff is not None:
+            limit = int(cutoff.group(2))
+            reached = failures if cutoff.group(1) == "fail" else nodes
+            if reached >= limit:
+                solved = False
+                latency *= limit / max(1, reached)  # search time is proportional to the explored tree
+                failures, nodes = (limit, 2 * limit + 1) if cutoff.group(1) == "fail" else ((limit - 1) // 2, limit)
+
+        if limits.wall_seconds is not None and latency > limits.wall_seconds:
+            time.sleep(limits.wall_seconds)
+            return MinizincResult(-signal.SIGKILL, [""], MinizincWrapper.STATUS_WALL_TIMEOUT)
+        if latency > 0:
+            time.sleep(latency)
+
+        variables = stdin.count("var ")
+        statistics = {
+            Constants.INIT_TIME: round(rng.uniform(0.0005, 0.005), 6),
+            Constants.SOLVE_TIME: round(latency, 6),
+            Constants.SOLUTIONS: 1 if solved else 0,
+            Constants.VARIABLES: variables,
+            Constants.PROPAGATORS: stdin.count("constraint "),
+            Constants.PROPAGATIONS: failures * rng.randint(5, 50),
+            Constants.NODES: nodes,
+            Constants.FAILURES: failures,
+            Constants.RESTARTS: 0,
+            Constants.PEAK_DEPTH: rng.randint(1, max(1, variables)),
+        }
+        output = [json.dumps({"type": "solution", "output": {"default": "", "raw": ""}, "sections": ["default", "raw"]})] if solved else []
+        return MinizincResult(0, output + [
+            json.dumps({Constants.OUTPUT_TYPE: Constants.SOLVER_STATISTICS, Constants.SOLVER_STATISTICS: statistics}),
+            json.dumps({"type": "status", "status": "SATISFIED" if solved else "UNKNOWN"}),
+        ], MinizincWrapper.STATUS_OK)
+
+
+    def compile(self, args: str) -> MinizincResult:
+        from schemas import Constants   # deferred, see run()
+        fzn_file, model_file = re.search(r'--output-fzn-to-file (\S+) "([^"]+)"', args).groups()
+        fzn = Path(model_file).read_text()
+        Path(fzn_file).write_text(fzn)
+        latency = self.draw_latency(random.Random(zlib.crc32(fzn.encode())))
+        if latency > 0:
+            time.sleep(latency)
+
+        domains = [(int(low), int(high), name) for low, high, name in re.findall(r"^var (-?\d+)\.\.(-?\d+): (\w+)", fzn, re.M)]
+        bools = re.findall(r"^var bool: (\w+)", fzn, re.M)
+        constraints = re.findall(r"^constraint (\w+)\((.*)\)", fzn, re.M)
+        widths = sorted(high - low + 1 for low, high, _ in domains)
+        mean = sum(widths) / max(1, len(widths))
+        histogram = {}
+        for name, _ in constraints:
+            histogram[name] = histogram.get(name, 0) + 1
+        method = re.search(r"^solve .*?(satisfy|minimize|maximize)", fzn, re.M)
+        vector = {
+            Constants.FLAT_BOOL_VARS: len(bools),
+            Constants.FLAT_INT_VARS: len(domains),
+            Constants.FLAT_SET_VARS: 0,
+            Constants.ID_TO_VAR_NAME_MAP: {str(i): name for i, name in enumerate([name for _, _, name in domains] + bools)},
+            Constants.ID_TO_CONSTRAINT_NAME_MAP: {str(i): name for i, (name, _) in enumerate(constraints)},
+            Constants.DOMAIN_WIDTHS: widths,
+            Constants.STD_DEVIATION_DOMAIN: (sum((w - mean) ** 2 for w in widths) / max(1, len(widths))) ** 0.5,
+            Constants.AVERAGE_DOMAIN_SIZE: mean,
+            Constants.MEDIAN_DOMAIN_SIZE: widths[len(widths) // 2] if len(widths) > 0 else 0,
+            Constants.AVERAGE_DOMAIN_OVERLAP: 1.0,
+            Constants.NUMBER_OF_DISJOINT_PAIRS: 0,
+            Constants.META_CONSTRAINTS: 0,
+            Constants.TOTAL_CONSTRAINTS: len(constraints),
+            Constants.AVG_DECISION_VARS_IN_CONSTRAINTS: sum(len(a.split(",")) for _, a in constraints) / max(1, len(constraints)),
+            Constants.CONSTRAINT_GRAPH: "",
+            Constants.CONSTRAINT_HISTOGRAM: histogram,
+            Constants.ANNOTATION_HISTOGRAM: {"int_search": fzn.count("int_search(")},
+            Constants.METHOD: method.group(1) if method is not None else "satisfy",
+        }
+        return MinizincResult(0, [json.dumps({Constants.OUTPUT_TYPE: Constants.FEATURE_VECTOR, Constants.FEATURE_VECTOR: vector})],
+                              MinizincWrapper.STATUS_OK)
+
 
 """
-Invokes the minizinc.exe with arguments and captures the output.
+Entry point for all MiniZinc invocations. Calls are delegated to the active backend, see use_backend.
 """
 class MinizincWrapper:
 
-    minizinc_executable = Path(f"{Path(__file__).parent}/../libminizinc/out/build/x64-Debug/minizinc.exe").resolve()
+    minizinc_executable = Path(os.environ.get(
+        "MINIZINC_EXECUTABLE", f"{Path(__file__).parent}/../libminizinc/out/build/x64-Debug/minizinc.exe")).resolve()
+
+    backends = {"cli": CliBackend, "stub": StubBackend}
+    backend = CliBackend()
+
+    STATUS_OK = "ok"
+    STATUS_ERROR = "error"
+    STATUS_CPU_LIMIT = "cpu_limit"
+    STATUS_MEMORY_LIMIT = "memory_limit"
+    STATUS_WALL_TIMEOUT = "wall_timeout"
+    limit_statuses = {STATUS_CPU_LIMIT, STATUS_MEMORY_LIMIT, STATUS_WALL_TIMEOUT}
+
+    out_of_memory_markers = ["bad_alloc", "out of memory", "cannot allocate memory"]
+
+    @staticmethod
+    def register_backend(name: str, factory):
+        """Makes a backend available to use_backend. factory is called with the options given there."""
+        MinizincWrapper.backends[name] = factory
+
+    @staticmethod
+    def use_backend(name: str, **options):
+        if name not in MinizincWrapper.backends:
+            raise ValueError(f"Unknown backend {name}, registered are {list(MinizincWrapper.backends)}")
+        MinizincWrapper.backend = MinizincWrapper.backends[name](**options)
+        MinizincWrapper.version.cache_clear()
+
+    @staticmethod
+    def ulimit_prefix(limits: ResourceLimits) -> str:
+        """
+        Shell commands that apply the limits before MiniZinc is executed in place of the shell.
+        The soft CPU limit raises SIGXCPU, the hard limit one second later kills for good.
+        """
+        prefix = ""
+        if limits.cpu_seconds is not None:
+            prefix += f"ulimit -S -t {limits.cpu_seconds} && ulimit -H -t {limits.cpu_seconds + 1} && "
+        if limits.memory_bytes is not None:
+            prefix += f"ulimit -v {limits.memory_bytes // 1024} && "
+        return prefix + "exec "
+
+    @staticmethod
+    def kill_process_group(process: subprocess.Popen):
+        if hasattr(os, "killpg"):
+            try:
+                os.killpg(process.pid, signal.SIGKILL)  # the shell and MiniZinc share the group of the session
+            except ProcessLookupError:
+                pass
+        else:
+            process.kill()
+
+    @staticmethod
+    def classify(returncode: int, stderr: str, limits: ResourceLimits) -> str:
+        if returncode == 0:
+            return MinizincWrapper.STATUS_OK
+
+        # a signal either terminates the process directly (negative code) or is reported by the shell (128 + signal)
+        signals = {-returncode, returncode - 128}
+        if limits.cpu_seconds is not None and {int(signal.SIGXCPU), int(signal.SIGKILL)} & signals:
+            return MinizincWrapper.STATUS_CPU_LIMIT
+        if limits.memory_bytes is not None and any(m in stderr.lower() for m in MinizincWrapper.out_of_memory_markers):
+            return MinizincWrapper.STATUS_MEMORY_LIMIT
+        return MinizincWrapper.STATUS_ERROR
+
+    @staticmethod
+    def run(args, stdin=None, limits: ResourceLimits = None) -> MinizincResult:
+        with Tracer.span("minizinc", "solver") as span:
+            result = MinizincWrapper.backend.run(args, stdin=stdin, limits=limits)
+            span.set("status", result.status)
+        return result
 
     @staticmethod
-    def run(args, stdin=None) -> (int, list[str]):
-
-        command = f"{MinizincWrapper.minizinc_executable} {args}"
-        result = subprocess.run(command,
-                                shell=True,
-                                text=True,
-                                input=stdin,
-                                cwd=MinizincWrapper.minizinc_executable.parent,
-                                check=True,
-                                capture_output=True,
-        )
-
-        if result.returncode != 0:
-            print(f"Command failed with error: {result.stdout.strip(), result.stderr.strip()}")
-
-        return result.returncode, result.stdout.strip().split('\n')
\ No newline at end of file
+    @functools.lru_cache(maxsize=1)
+    def version() -> str:
+        """Version string of the MiniZinc binary, queried once per process."""
+        return "\n".join(MinizincWrapper.run("--version").output)
@@ -1,20 +1,23 @@
 import os
+from pathlib import Path
+
 import matplotlib.pyplot as plt
 import pandas as pd
 
 from schemas import Constants
+from summary import ResultSummary
 
-instance_results = pd.read_parquet('../result.10000_vm')
+results_folder = Path('../result.10000_vm')
 output_dir = 'backtracks'
 os.makedirs(output_dir, exist_ok=True)
 
-failures_extremes = instance_results.groupby(Constants.MODEL_NAME, observed=False)[Constants.FAILURES].agg(
-    ['max', 'min']).reset_index()
+failures_extremes = ResultSummary.read(results_folder).to_pandas()
 
 # Generates a plot for every model. technically makes max and min diff obsolete
+# the results are read one model at a time, never all at once
 for _, row in failures_extremes.iterrows():
     model_name = row[Constants.MODEL_NAME]
-    model_data = instance_results[instance_results[Constants.MODEL_NAME] == model_name].sort_values(by=Constants.ID)
+    model_data = pd.read_parquet(results_folder, filters=[(Constants.MODEL_NAME, '==', model_name)]).sort_values(by=Constants.ID)
 
     # Plot the data points (failures) for each model
     plt.figure(figsize=(10, 5))
@@ -23,10 +26,10 @@ for _, row in failures_extremes.iterrows():
     plt.ylabel('Backtracks')
 
     # min and max data
-    #max_failures = model_data[Constants.FAILURES].max()
-    #min_failures = model_data[Constants.FAILURES].min()
-    #max_index = model_data[model_data[Constants.FAILURES] == max_failures][Constants.ID].values[0]
-    #min_index = model_data[model_data[Constants.FAILURES] == min_failures][Constants.ID].values[0]
+    #max_failures = row[ResultSummary.column(Constants.FAILURES, 'Max')]
+    #min_failures = row[ResultSummary.column(Constants.FAILURES, 'Min')]
+    #max_index = row[ResultSummary.column(Constants.FAILURES, 'ArgMax')]
+    #min_index = row[ResultSummary.column(Constants.FAILURES, 'ArgMin')]
 
     # min and max config
     #plt.axhline(y=max_failures, color='green', linestyle='--', label='Max Failures')
@@ -6,17 +6,20 @@ from schemas import Constants
 
 if __name__ == "__main__":
 
+    # one extraction run with --backends cp gecode api, rows are tagged with their backend
+    vectors = pq.read_table("../temp/vectors_generic.parquet").to_pandas()
+
     hists = [
-        ("../temp/vectors_generic_cp.parquet", "histograms/combined_histograms_cp.svg", (10,6)),
-        ("../temp/vectors_generic_gecode.parquet", "histograms/combined_histograms_gecode.svg", (10,6)),
-        ("../temp/vectors_generic_api.parquet", "histograms/combined_histograms_api.svg", (2,6)),
+        ("cp", "histograms/combined_histograms_cp.svg", (10,6)),
+        ("gecode", "histograms/combined_histograms_gecode.svg", (10,6)),
+        ("api", "histograms/combined_histograms_api.svg", (2,6)),
     ]
 
     for hist in hists:
 
-        parquet, savename, figsize = hist
+        backend, savename, figsize = hist
 
-        df = pq.read_table(parquet).to_pandas()
+        df = vectors[vectors[Constants.BACKEND] == backend]
         histogram_data = defaultdict(int)
 
         for entry in df[Constants.CONSTRAINT_HISTOGRAM]:
@@ -1,13 +1,17 @@
+from pathlib import Path
+
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 
 from schemas import Constants
+from summary import ResultSummary
 
 # SHOW THE RELATION BETWEEN BACKTRACKS AND VARS VS BACKTRACKS AND CONSTRAINTS
 
-instance_results = pd.read_parquet('../result.10000_vm')
-failures_avg = instance_results.groupby(Constants.MODEL_NAME, observed=False)[Constants.FAILURES].mean().reset_index()
+summary = ResultSummary.read(Path('../result.10000_vm')).to_pandas()
+failures_avg = summary[[Constants.MODEL_NAME, ResultSummary.column(Constants.FAILURES, 'Mean')]]
+failures_avg = failures_avg.rename(columns={ResultSummary.column(Constants.FAILURES, 'Mean'): Constants.FAILURES})
 
 feature_vectors = pd.read_parquet('../temp/vector_big_10.parquet')
 feature_vectors['totalVariables'] = feature_vectors[Constants.FLAT_INT_VARS] + feature_vectors[Constants.FLAT_SET_VARS] + feature_vectors[Constants.FLAT_BOOL_VARS]
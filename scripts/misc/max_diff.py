@@ -1,15 +1,19 @@
+from pathlib import Path
+
 import matplotlib.pyplot as plt
 import pandas as pd
 
 from schemas import Constants
+from summary import ResultSummary
 
-instance_results = pd.read_parquet('../result.10000_vm')
-
-failures_extremes = instance_results.groupby(Constants.MODEL_NAME, observed=False)[Constants.FAILURES].agg(['max', 'min']).reset_index()
-failures_extremes['Difference'] = failures_extremes['max'] - failures_extremes['min']
+results_folder = Path('../result.10000_vm')
+summary = ResultSummary.read(results_folder).to_pandas()
+summary['Difference'] = summary[ResultSummary.column(Constants.FAILURES, 'Max')] - summary[ResultSummary.column(Constants.FAILURES, 'Min')]
 
-model_max_diff = failures_extremes.loc[failures_extremes['Difference'].idxmax(), Constants.MODEL_NAME]
-model_data = instance_results[instance_results[Constants.MODEL_NAME] == model_max_diff]
+# only the results of the chosen model are read
+extremes = summary.loc[summary['Difference'].idxmax()]
+model_max_diff = extremes[Constants.MODEL_NAME]
+model_data = pd.read_parquet(results_folder, filters=[(Constants.MODEL_NAME, '==', model_max_diff)])
 model_data = model_data.sort_values(by=Constants.ID)
 
 plt.figure(figsize=(10, 5))
@@ -18,10 +22,10 @@ plt.xlabel('Lösungs ID (Nicht gleichbedeutend mit "permutationId")')
 plt.ylabel('Backtracks')
 
 # max and min data
-max_failures = model_data[Constants.FAILURES].max()
-min_failures = model_data[Constants.FAILURES].min()
-max_index = model_data[model_data[Constants.FAILURES] == max_failures][Constants.ID].values[0]
-min_index = model_data[model_data[Constants.FAILURES] == min_failures][Constants.ID].values[0]
+max_failures = extremes[ResultSummary.column(Constants.FAILURES, 'Max')]
+min_failures = extremes[ResultSummary.column(Constants.FAILURES, 'Min')]
+max_index = extremes[ResultSummary.column(Constants.FAILURES, 'ArgMax')]
+min_index = extremes[ResultSummary.column(Constants.FAILURES, 'ArgMin')]
 
 # Max and Min config
 plt.axhline(y=max_failures, color='green', linestyle='--', label='Max Backtracks')
@@ -1,17 +1,21 @@
+from pathlib import Path
+
 import matplotlib.pyplot as plt
 import pandas as pd
 #plt.rcParams['svg.fonttype'] = 'none'
 
 
 from schemas import Constants
+from summary import ResultSummary
 
-instance_results = pd.read_parquet('../result.10000_vm')
-
-failures_extremes = instance_results.groupby(Constants.MODEL_NAME, observed=False)[Constants.FAILURES].agg(['max', 'min']).reset_index()
-failures_extremes['Difference'] = failures_extremes['max'] - failures_extremes['min']
+results_folder = Path('../result.10000_vm')
+summary = ResultSummary.read(results_folder).to_pandas()
+summary['Difference'] = summary[ResultSummary.column(Constants.FAILURES, 'Max')] - summary[ResultSummary.column(Constants.FAILURES, 'Min')]
 
-model_min_diff = failures_extremes.loc[failures_extremes['Difference'].idxmin(), Constants.MODEL_NAME]
-model_data_min = instance_results[instance_results[Constants.MODEL_NAME] == model_min_diff]
+# only the results of the chosen model are read
+extremes = summary.loc[summary['Difference'].idxmin()]
+model_min_diff = extremes[Constants.MODEL_NAME]
+model_data_min = pd.read_parquet(results_folder, filters=[(Constants.MODEL_NAME, '==', model_min_diff)])
 model_data_min = model_data_min.sort_values(by=Constants.ID)
 
 plt.figure(figsize=(10, 5))
@@ -21,8 +25,8 @@ plt.xlabel('Lösungs ID (Nicht gleichbedeutend mit "permutationId")')
 plt.ylabel('Backtracks')
 
 # max and min config
-max_failures_min = model_data_min[Constants.FAILURES].max()
-min_failures_min = model_data_min[Constants.FAILURES].min()
+max_failures_min = extremes[ResultSummary.column(Constants.FAILURES, 'Max')]
+min_failures_min = extremes[ResultSummary.column(Constants.FAILURES, 'Min')]
 plt.axhline(y=max_failures_min, color='green', linestyle='--', label='Max Failures')
 plt.axhline(y=min_failures_min, color='orange', linestyle='--', label='Min Failures')
 plt.legend()
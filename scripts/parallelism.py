@@ -0,0 +1,88 @@
+import math
+import threading
+
+"""
+Counting semaphore over the cores of the machine. A job solved with n threads holds n cores, so fewer jobs run
+concurrently when jobs are parallel. Requests are served in arrival order, a large request is not starved by small ones.
+"""
+class CoreBudget:
+
+    def __init__(self, cores: int):
+        self.cores = cores
+        self.available = cores
+        self.condition = threading.Condition()
+        self.next_ticket = 0
+        self.serving = 0
+
+    def acquire(self, n: int) -> int:
+        """Blocks until n cores are free. Requests above the budget are clamped to it. :return: the cores held"""
+        n = max(1, min(n, self.cores))
+        with self.condition:
+            ticket = self.next_ticket
+            self.next_ticket += 1
+            self.condition.wait_for(lambda: self.serving == ticket and self.available >= n)
+            self.available -= n
+            self.serving += 1
+            self.condition.notify_all()
+        return n
+
+    def release(self, n: int):
+        with self.condition:
+            self.available += n
+            self.condition.notify_all()
+
+
+"""
+Chooses per model between parallel search in one job (gecode -p) and more concurrent single threaded jobs.
+With c cores and a solve time of t(n) on n threads, c / n jobs finish every t(n) seconds. While more jobs remain
+than the cores can take, the thread count with the highest throughput, i.e. the lowest n * t(n), is picked, and with
+the usual sublinear speedup that is 1. Once fewer jobs remain, cores would idle and the choice becomes the thread
+count that finishes the remaining jobs soonest, so the long solves at the end of a run get parallel search.
+Single threaded search is kept unless parallel search is at least min_gain faster, its statistics are deterministic
+and cheaper to compare. Models whose solves are shorter than min_tune_seconds are not tuned, there the parallel
+overhead dominates.
+"""
+class ThreadTuner:
+
+    max_threads = 8
+    min_gain = 1.2
+    min_tune_seconds = 0.5
+
+    def __init__(self, cores: int):
+        self.cores = cores
+        self.timings: dict[str, dict[int, float]] = {}  # seconds per job by threads per job, by model name
+        self.remaining: int | None = None   # jobs left in the run, updated by the driver. None while unknown
+
+    def candidates(self) -> list[int]:
+        """Powers of two up to the cores and max_threads."""
+        candidates = [1]
+        while candidates[-1] * 2 <= min(self.cores, ThreadTuner.max_threads):
+            candidates.append(candidates[-1] * 2)
+        return candidates
+
+    @staticmethod
+    def choose(timings: dict[int, float], remaining: int = None, cores: int = 1) -> int:
+        """
+        :param timings: seconds per job by threads per job, must contain 1
+        :param remaining: jobs left to solve on cores. None assumes enough to keep every core busy
+        :return: the threads per job that finish the remaining jobs soonest
+        """
+        def seconds(n: int) -> float:
+            if remaining is None:
+                return n * timings[n]
+            return math.ceil(remaining / max(1, cores // n)) * timings[n]     # rounds of concurrent jobs
+
+        best = min(timings, key=lambda n: (seconds(n), n))
+        if best != 1 and seconds(1) < ThreadTuner.min_gain * seconds(best):
+            return 1
+        return best
+
+    def tune(self, model: str, timings: dict[int, float]) -> int:
+        """:return: the threads chosen for the current amount of remaining jobs"""
+        self.timings[model] = timings
+        return self.threads_for(model)
+
+    def threads_for(self, model: str) -> int:
+        if model not in self.timings:
+            return 1
+        return ThreadTuner.choose(self.timings[model], self.remaining, self.cores)
@@ -0,0 +1,86 @@
+import queue
+import threading
+from pathlib import Path
+
+from feature_extraction import FeatureVectorExtractor
+from instance_generator import FlatZincInstanceGenerator
+from minizinc_wrapper import ResourceLimits
+from schemas import Constants
+from testdriver import Testdriver
+from tracing import Tracer
+
+"""
+Runs feature extraction, instance generation and the Testdriver as concurrent stages, so solving the first model
+starts while later models still compile. Each stage is a thread that passes feature vectors on through a bounded
+queue once its own output is on disk: the extractor after writing the vector, the generator after writing the
+instances and the manifest. A full queue blocks the stage before it, None marks the end of a stream.
+All outputs are the same as those of the separate commands, and a pipeline run resumes from them:
+extraction resumes its output file, generation appends the missing permutations and the Testdriver skips
+jobs with results.
+"""
+class Pipeline:
+
+    queue_size = 4      # feature vectors a stage may be ahead of the next one
+
+    def __init__(self, input_files: list[tuple], feature_vector_parquet: Path, instances_folder: Path, output_folder: Path,
+                 log_path: Path, backup_path: Path, max_perms: int, cutoff_excess: bool = False, cache_dir: Path = None,
+                 limits: ResourceLimits = None):
+        """
+        :param input_files: (problem_id, mzn) or (problem_id, mzn, dzn) tuples, see FeatureVectorExtractor
+        """
+        self.vectors = queue.Queue(maxsize=Pipeline.queue_size)     # extracted, not yet generated
+        self.models = queue.Queue(maxsize=Pipeline.queue_size)      # generated, not yet passed to the Testdriver
+        self.extractor = FeatureVectorExtractor(input_files, feature_vector_parquet, resume=True, cache_dir=cache_dir,
+                                                limits=limits, sink=self.vectors)
+        self.generator = FlatZincInstanceGenerator(feature_vector_parquet, instances_folder, max_perms, cutoff_excess,
+                                                   append=True, limits=limits, streaming=True)
+        self.testdriver = Testdriver(feature_vector_parquet, instances_folder, output_folder, log_path, backup_path,
+                                     limits=limits, models=self.models)
+        self.errors: list[Exception] = []
+
+    def stage(self, target, downstream: queue.Queue):
+        """Runs a stage and always ends the stream of the next one, so a failing stage does not stall the pipeline."""
+        try:
+            target()
+        except Exception as e:
+            print(f"ERR Pipeline stage {target.__name__} failed: {e}")
+            self.errors.append(e)
+        finally:
+            downstream.put(None)
+
+    def generate(self):
+        """Generates the instances of every extracted model, a model is passed on once its instances are on disk."""
+        ended = False
+        try:
+            self.generator.start()
+            while (vector := self.vectors.get()) is not None:
+                name = vector[Constants.MODEL_NAME]
+                with Tracer.span("probe", "generator", model=name):
+                    self.generator.probe([vector])
+                self.generator.generate_model(name, vector[Constants.FLAT_ZINC])
+                self.generator.finish()
+                self.models.put(vector)
+            ended = True
+        finally:
+            if not ended:
+                # the extractor would block on the full queue otherwise
+                while self.vectors.get() is not None:
+                    pass
+
+    def run(self):
+        extraction = threading.Thread(target=self.stage, args=(self.extractor.run, self.vectors), name="extraction")
+        generation = threading.Thread(target=self.stage, args=(self.generate, self.models), name="generation")
+        extraction.start()
+        generation.start()
+        try:
+            self.testdriver.run()
+        except Exception:
+            # the stages before keep their outputs for a resume, but must not block on the full queue
+            while self.models.get() is not None:
+                pass
+            raise
+        finally:
+            generation.join()
+            extraction.join()
+        if len(self.errors) > 0:
+            raise self.errors[0]
@@ -0,0 +1,133 @@
+import datetime
+import glob
+import os
+import queue
+import threading
+from pathlib import Path
+from typing import Callable, Dict
+
+import pyarrow as pa
+
+from schemas import Constants
+from tracing import Tracer
+
+"""
+Append-only spool for finished results. Every result (batch) is written to an Arrow IPC stream segment as soon as it arrives,
+so a crash or OOM kill of the driver loses no solved job. Full segments are folded into the Parquet output by a
+background thread and deleted afterwards. Segments left behind by a crashed run are folded again on startup.
+The fold callback has to write deterministic file names per segment, then folding a segment twice overwrites
+the files of the first attempt instead of duplicating rows.
+Records are flushed to the OS with every append, which survives the process but not the machine going down.
+"""
+class ResultSpool:
+
+    segment_suffix = ".arrows"
+
+    def __init__(self, spool_folder: Path, schema: pa.Schema, fold: Callable[[pa.Table, str], None], segment_rows: int):
+        """
+        :param fold: writes the rows of a segment, sorted by id, to Parquet. The second argument names the segment.
+        :param segment_rows: results per segment, i.e. per fold
+        """
+        self.spool_folder = spool_folder
+        self.schema = schema
+        self.fold = fold
+        self.segment_rows = segment_rows
+        self.run_id = datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+        self.segment_num = 0
+        self.sink = None
+        self.writer = None
+        self.rows_in_segment = 0
+        self.fold_queue = queue.Queue()
+        self.fold_errors = []
+        self.folder_thread = None
+
+        os.makedirs(self.spool_folder, exist_ok=True)
+
+    def segments(self) -> list[Path]:
+        return sorted(Path(p) for p in glob.glob(f"{self.spool_folder}/*{ResultSpool.segment_suffix}"))
+
+    @staticmethod
+    def read_segment(path: Path, schema: pa.Schema) -> pa.Table:
+        """
+        Reads all complete records of a segment. The tail of a segment whose writer was killed may be torn,
+        everything before it is still readable.
+        """
+        batches = []
+        try:
+            with pa.OSFile(str(path)) as f:
+                for batch in pa.ipc.open_stream(f):
+                    batches.append(batch)
+        except (pa.ArrowInvalid, OSError):
+            pass
+        table = pa.Table.from_batches(batches, schema=schema)
+        return table.sort_by(Constants.ID)
+
+    def fold_segment(self, path: Path):
+        with Tracer.span("fold_segment", "spool"):
+            table = ResultSpool.read_segment(path, self.schema)
+            if table.num_rows > 0:
+                self.fold(table, path.stem)
+            os.remove(path)
+
+    def replay(self) -> int:
+        """
+        Folds the segments of earlier runs into the output. Has to happen before the finished jobs are determined.
+        :return: the amount of recovered results
+        """
+        recovered = 0
+        for path in self.segments():
+            recovered += ResultSpool.read_segment(path, self.schema).num_rows
+            self.fold_segment(path)
+        return recovered
+
+    def start(self):
+        self.folder_thread = threading.Thread(target=self.fold_worker, name="spool-folder", daemon=True)
+        self.folder_thread.start()
+        self.open_segment()
+
+    def fold_worker(self):
+        while True:
+            path = self.fold_queue.get()
+            if path is None:
+                break
+            try:
+                self.fold_segment(path)
+            except Exception as e:
+                # the segment stays on disk and is folded by the next replay
+                print(f"ERR Folding {path} failed: {e}")
+                self.fold_errors.append(e)
+
+    def open_segment(self):
+        self.path = self.spool_folder / f"segment_{self.run_id}_{self.segment_num:06}{ResultSpool.segment_suffix}"
+        self.sink = pa.OSFile(str(self.path), "wb")
+        self.writer = pa.ipc.new_stream(self.sink, self.schema)
+        self.rows_in_segment = 0
+        self.segment_num += 1
+
+    def close_segment(self):
+        self.writer.close()
+        self.sink.close()
+        if self.rows_in_segment > 0:
+            self.fold_queue.put(self.path)
+        else:
+            os.remove(self.path)
+
+    def append(self, result: Dict):
+        self.append_batch(pa.RecordBatch.from_pylist([result], schema=self.schema))
+
+    def append_batch(self, batch: pa.RecordBatch):
+        with Tracer.span("spool_append", "spool", rows=batch.num_rows):
+            self.writer.write_batch(batch)
+            self.sink.flush()
+            self.rows_in_segment += batch.num_rows
+            if self.rows_in_segment >= self.segment_rows:
+                self.close_segment()
+                self.open_segment()
+
+    def close(self):
+        """Folds the last segment and waits until the background thread has written everything."""
+        self.close_segment()
+        self.fold_queue.put(None)
+        self.folder_thread.join()
+        if len(self.fold_errors) > 0:
+            raise self.fold_errors[0]
@@ -1,7 +1,6 @@
 from typing import Mapping, Any
 import pyarrow as pa
 import json
-from jsonschema.validators import validate
 
 
 class Constants:
@@ -30,6 +29,7 @@ class Constants:
     FLAT_ZINC = "flatZinc"
     MINI_ZINC = "miniZinc"
     DATA_FILE = "dataFile"
+    BACKEND = "backend"
 
     ####
     INSTANCE_RESULTS = "instanceResults"
@@ -50,6 +50,19 @@ class Constants:
     FAILURES = "failures"   #backtracks
     RESTARTS = "restarts"
     PEAK_DEPTH = "peakDepth"
+    CENSORED = "censored"   # the run hit its limit, the true value is above the limit
+    FAIL_LIMIT = "failLimit"
+    NODE_LIMIT = "nodeLimit"
+    THREADS = "threads"
+    CONFIGURATION = "configuration"
+    COUNT = "count"     # results of a model in the result summary
+
+    ####
+    BENCHMARK_RUN = "run"   # timestamp of the benchmark run
+    BENCHMARK_CASE = "case"
+    BENCHMARK_SIZE = "size"  # variables of the synthetic model
+    SECONDS_PER_CALL = "secondsPerCall"
+    CALLS = "calls"
 
 
 class Schemas:
@@ -81,6 +94,9 @@ class Schemas:
 
         feature_vector_with_dzn = feature_vector.append(pa.field(Constants.DATA_FILE, pa.string(), False))
 
+        # tags feature vectors of runs that extract for several solver backends at once
+        backend_field = pa.field(Constants.BACKEND, pa.string(), False)
+
         # schema
         instance_results: pa.Schema = pa.schema(
             [
@@ -101,6 +117,18 @@ class Schemas:
             ]
         )
 
+        # results of runs with a fail or node limit, see CensoringPolicy. A limit is null while a model warms up
+        censoring_fields = [
+            pa.field(Constants.CENSORED, pa.bool_(), nullable=False),
+            pa.field(Constants.FAIL_LIMIT, pa.int64(), nullable=True),
+            pa.field(Constants.NODE_LIMIT, pa.int64(), nullable=True),
+        ]
+        # threads of the search when the Testdriver tunes parallelism per model
+        threads_field = pa.field(Constants.THREADS, pa.int32(), nullable=False)
+
+        # solver configuration of a row when the Testdriver runs a configuration matrix
+        configuration_field = pa.field(Constants.CONFIGURATION, pa.string(), nullable=False)
+
         instances: pa.Schema = pa.schema(
             [
                 pa.field(Constants.MODEL_NAME, pa.string(), False),
@@ -110,6 +138,16 @@ class Schemas:
             ]
         )
 
+        benchmark_results: pa.Schema = pa.schema(
+            [
+                pa.field(Constants.BENCHMARK_RUN, pa.string(), False),
+                pa.field(Constants.BENCHMARK_CASE, pa.string(), False),
+                pa.field(Constants.BENCHMARK_SIZE, pa.int64(), False),
+                pa.field(Constants.SECONDS_PER_CALL, pa.float64(), False),
+                pa.field(Constants.CALLS, pa.int64(), False),
+            ]
+        )
+
     class JSON:
         feature_vector: Mapping[str, Any] = {
             "$schema": "http://json-schema.org/draft-07/schema#",
@@ -266,6 +304,7 @@ class Helpers:
     @staticmethod
     def parse_json_validated(maybe_json: str, schema: Mapping[str, Any]):
         """Throws if validating fails"""
+        from jsonschema.validators import validate  # deferred, only subcommands that validate JSON pay for the import
         data = json.loads(maybe_json)
         validate(instance=data, schema=schema)
         return data
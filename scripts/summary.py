@@ -0,0 +1,300 @@
+import math
+import os
+from pathlib import Path
+from typing import Dict
+
+import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from schemas import Constants
+
+"""
+Mergeable quantile sketch with relative error guarantees (DDSketch). Positive values fall into logarithmic buckets
+of width gamma, zeros are counted apart. Any quantile is estimated within relative_accuracy of an observed value,
+and two sketches merge exactly by adding their bucket counts, so summaries of result subsets combine without the rows.
+"""
+class QuantileSketch:
+
+    relative_accuracy = 0.01
+    gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+    log_gamma = math.log(gamma)
+
+    def __init__(self, zeros: int = 0, buckets: dict[int, int] = None):
+        self.zeros = zeros      # values <= 0, the metrics summarized are never negative
+        self.buckets = buckets if buckets is not None else {}   # bucket key -> count, values in (gamma^(key-1), gamma^key]
+
+    @staticmethod
+    def key(value: float) -> int:
+        return math.ceil(math.log(value) / QuantileSketch.log_gamma)
+
+    @staticmethod
+    def key_sql(column: str) -> str:
+        """Bucket key of column as a DuckDB expression, NULL for zeros."""
+        return f"CASE WHEN {column} > 0 THEN CAST(ceil(ln({column}) / {QuantileSketch.log_gamma!r}) AS INTEGER) END"
+
+    def add(self, value: float, count: int = 1):
+        if value <= 0:
+            self.zeros += count
+        else:
+            key = QuantileSketch.key(value)
+            self.buckets[key] = self.buckets.get(key, 0) + count
+
+    def merge(self, other: "QuantileSketch"):
+        self.zeros += other.zeros
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+
+    def count(self) -> int:
+        return self.zeros + sum(self.buckets.values())
+
+    def quantile(self, q: float) -> float | None:
+        """:return: the estimated q quantile, None for an empty sketch"""
+        if not 0 <= q <= 1:
+            raise ValueError("Quantile must be in [0, 1]")
+        count = self.count()
+        if count == 0:
+            return None
+        rank = q * (count - 1)
+        seen = self.zeros
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                return 2 * QuantileSketch.gamma ** key / (QuantileSketch.gamma + 1)
+        return 2 * QuantileSketch.gamma ** max(self.buckets) / (QuantileSketch.gamma + 1)
+
+    def to_dict(self) -> Dict:
+        keys = sorted(self.buckets)
+        return {"zeros": self.zeros, "keys": keys, "counts": [self.buckets[k] for k in keys]}
+
+    @staticmethod
+    def from_dict(data: Dict) -> "QuantileSketch":
+        return QuantileSketch(data["zeros"], dict(zip(data["keys"], data["counts"])))
+
+
+"""
+Count, min, max, mean and variance of one metric, with the ids of the min and max, plus a QuantileSketch.
+Values are added with Welford's update and summaries merge with its pairwise form (Chan et al.),
+so mean and variance stay accurate over millions of results without keeping them.
+"""
+class MetricSummary:
+
+    def __init__(self):
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.mean = 0.0
+        self.m2 = 0.0       # sum of squared differences from the mean
+        self.argmin = None  # id of the first result with the min
+        self.argmax = None
+        self.sketch = QuantileSketch()
+
+    def add(self, value: float, job_id: int):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.min is None or value < self.min:
+            self.min, self.argmin = value, job_id
+        if self.max is None or value > self.max:
+            self.max, self.argmax = value, job_id
+        self.sketch.add(value)
+
+    def merge(self, other: "MetricSummary"):
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.min, self.argmin, self.max, self.argmax = other.min, other.argmin, other.max, other.argmax
+        else:
+            if other.min < self.min:
+                self.min, self.argmin = other.min, other.argmin
+            if other.max > self.max:
+                self.max, self.argmax = other.max, other.argmax
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.sketch.merge(other.sketch)
+
+    def variance(self) -> float:
+        """Sample variance, 0 below two values."""
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+
+"""
+Per model summary of the results of a Testdriver output folder, kept as _summary.parquet next to the result partitions.
+Every row holds the count and, for failures, nodes and solveTime, the MetricSummary columns named metric + statistic,
+e.g. failuresMin or solveTimeSketch. Analyses of per model extremes, means or quantiles read this file of a few
+kilobytes instead of the result set. In matrix mode rows are per model and configuration.
+The Testdriver updates the summary with every folded spool segment. A summary whose count differs from the rows on
+disk, e.g. after a crash between folding and saving, is rebuilt from the results with one aggregation query.
+Censored results enter with their limit, a lower bound of the true value.
+"""
+class ResultSummary:
+
+    file_name = "_summary.parquet"  # underscore prefixed files are ignored by parquet dataset readers
+    metrics = [Constants.FAILURES, Constants.NODES, Constants.SOLVE_TIME]
+    statistics = ["Min", "Max", "Mean", "Variance", "ArgMin", "ArgMax", "Sketch"]
+    sketch_type = pa.struct([pa.field("zeros", pa.int64(), False), pa.field("keys", pa.list_(pa.int32()), False),
+                             pa.field("counts", pa.list_(pa.int64()), False)])
+
+    def __init__(self, folder: Path, configuration: bool = False):
+        """:param configuration: results of a configuration matrix, summarized per model and configuration"""
+        self.folder = folder
+        self.keys = [Constants.MODEL_NAME] + ([Constants.CONFIGURATION] if configuration else [])
+        self.summaries: dict[tuple, dict[str, MetricSummary]] = {}
+
+    @staticmethod
+    def column(metric: str, statistic: str) -> str:
+        return metric + statistic
+
+    @staticmethod
+    def schema_for(configuration: bool = False) -> pa.Schema:
+        fields = [pa.field(Constants.MODEL_NAME, pa.string(), False)]
+        if configuration:
+            fields.append(pa.field(Constants.CONFIGURATION, pa.string(), False))
+        fields.append(pa.field(Constants.COUNT, pa.int64(), False))
+        for metric in ResultSummary.metrics:
+            value_type = pa.float64() if metric == Constants.SOLVE_TIME else pa.int64()
+            fields += [
+                pa.field(ResultSummary.column(metric, "Min"), value_type, False),
+                pa.field(ResultSummary.column(metric, "Max"), value_type, False),
+                pa.field(ResultSummary.column(metric, "Mean"), pa.float64(), False),
+                pa.field(ResultSummary.column(metric, "Variance"), pa.float64(), False),
+                pa.field(ResultSummary.column(metric, "ArgMin"), pa.int64(), False),
+                pa.field(ResultSummary.column(metric, "ArgMax"), pa.int64(), False),
+                pa.field(ResultSummary.column(metric, "Sketch"), ResultSummary.sketch_type, False),
+            ]
+        return pa.schema(fields)
+
+    @staticmethod
+    def results_pattern(folder: Path) -> str:
+        """Glob of the result files of a Testdriver output folder, leaves out the summary and other _ files."""
+        return f"{folder}/{Constants.MODEL_NAME}=*/*.parquet"
+
+    def metric_summaries(self, key: tuple) -> dict[str, MetricSummary]:
+        if key not in self.summaries:
+            self.summaries[key] = {metric: MetricSummary() for metric in ResultSummary.metrics}
+        return self.summaries[key]
+
+    def update(self, results: pa.Table):
+        """Adds result rows, e.g. a folded spool segment."""
+        columns = results.select(self.keys + [Constants.ID] + ResultSummary.metrics).to_pydict()
+        keys = list(zip(*(columns[k] for k in self.keys)))
+        for metric in ResultSummary.metrics:
+            for key, job_id, value in zip(keys, columns[Constants.ID], columns[metric]):
+                self.metric_summaries(key)[metric].add(value, job_id)
+
+    def merge(self, other: "ResultSummary"):
+        """Adds the summary of other results, e.g. of another output folder of the same workload."""
+        for key, summaries in other.summaries.items():
+            for metric, summary in summaries.items():
+                self.metric_summaries(key)[metric].merge(summary)
+
+    def count(self) -> int:
+        return sum(summaries[ResultSummary.metrics[0]].count for summaries in self.summaries.values())
+
+    def quantile(self, model: str, metric: str, q: float, configuration: str = None) -> float | None:
+        key = (model,) if configuration is None else (model, configuration)
+        if key not in self.summaries:
+            return None
+        return self.summaries[key][metric].sketch.quantile(q)
+
+    def to_table(self) -> pa.Table:
+        rows = []
+        for key in sorted(self.summaries):
+            summaries = self.summaries[key]
+            row = dict(zip(self.keys, key))
+            row[Constants.COUNT] = summaries[ResultSummary.metrics[0]].count
+            for metric, summary in summaries.items():
+                row[ResultSummary.column(metric, "Min")] = summary.min
+                row[ResultSummary.column(metric, "Max")] = summary.max
+                row[ResultSummary.column(metric, "Mean")] = summary.mean
+                row[ResultSummary.column(metric, "Variance")] = summary.variance()
+                row[ResultSummary.column(metric, "ArgMin")] = summary.argmin
+                row[ResultSummary.column(metric, "ArgMax")] = summary.argmax
+                row[ResultSummary.column(metric, "Sketch")] = summary.sketch.to_dict()
+            rows.append(row)
+        return pa.Table.from_pylist(rows, schema=ResultSummary.schema_for(len(self.keys) > 1))
+
+    def save(self):
+        temp_file = self.folder / (ResultSummary.file_name + ".tmp")
+        pq.write_table(self.to_table(), temp_file)
+        os.replace(temp_file, self.folder / ResultSummary.file_name)
+
+    @staticmethod
+    def read(folder: Path) -> pa.Table:
+        """The summary table of an output folder, for analyses that need no sketch arithmetic."""
+        return pq.read_table(folder / ResultSummary.file_name)
+
+    @staticmethod
+    def load(folder: Path) -> "ResultSummary | None":
+        """:return: the summary of folder, None if there is none"""
+        path = folder / ResultSummary.file_name
+        if not path.exists():
+            return None
+        table = pq.read_table(path)
+        summary = ResultSummary(folder, Constants.CONFIGURATION in table.column_names)
+        for row in table.to_pylist():
+            summaries = summary.metric_summaries(tuple(row[k] for k in summary.keys))
+            for metric, metric_summary in summaries.items():
+                metric_summary.count = row[Constants.COUNT]
+                metric_summary.min = row[ResultSummary.column(metric, "Min")]
+                metric_summary.max = row[ResultSummary.column(metric, "Max")]
+                metric_summary.mean = row[ResultSummary.column(metric, "Mean")]
+                metric_summary.m2 = row[ResultSummary.column(metric, "Variance")] * max(0, metric_summary.count - 1)
+                metric_summary.argmin = row[ResultSummary.column(metric, "ArgMin")]
+                metric_summary.argmax = row[ResultSummary.column(metric, "ArgMax")]
+                metric_summary.sketch = QuantileSketch.from_dict(row[ResultSummary.column(metric, "Sketch")])
+        return summary
+
+    @staticmethod
+    def build(con: duckdb.DuckDBPyConnection, folder: Path, configuration: bool = False) -> "ResultSummary":
+        """Summarizes the results on disk in DuckDB, the sketches get the bucket keys of QuantileSketch.key."""
+        summary = ResultSummary(folder, configuration)
+        if not any(folder.glob(f"{Constants.MODEL_NAME}=*/*.parquet")):
+            return summary
+        source = f"read_parquet('{ResultSummary.results_pattern(folder)}', hive_partitioning = true, union_by_name = true)"
+        keys = ", ".join(summary.keys)
+        for metric in ResultSummary.metrics:
+            rows = con.execute(f"""
+                SELECT {keys}, COUNT(*), min({metric}), max({metric}), avg({metric}), coalesce(var_pop({metric}), 0),
+                       arg_min({Constants.ID}, {metric}), arg_max({Constants.ID}, {metric})
+                FROM {source}
+                GROUP BY ALL
+                """).fetchall()
+            for row in rows:
+                key, (count, low, high, mean, variance, argmin, argmax) = tuple(row[:len(summary.keys)]), row[len(summary.keys):]
+                metric_summary = summary.metric_summaries(key)[metric]
+                metric_summary.count, metric_summary.mean, metric_summary.m2 = count, mean, variance * count
+                metric_summary.min, metric_summary.max, metric_summary.argmin, metric_summary.argmax = low, high, argmin, argmax
+            buckets = con.execute(f"""
+                SELECT {keys}, {QuantileSketch.key_sql(metric)} AS bucket, COUNT(*)
+                FROM {source}
+                GROUP BY ALL
+                """).fetchall()
+            for row in buckets:
+                key, (bucket, count) = tuple(row[:len(summary.keys)]), row[len(summary.keys):]
+                sketch = summary.metric_summaries(key)[metric].sketch
+                if bucket is None:
+                    sketch.zeros += count
+                else:
+                    sketch.buckets[bucket] = count
+        return summary
+
+    @staticmethod
+    def open(con: duckdb.DuckDBPyConnection, folder: Path, configuration: bool = False) -> "ResultSummary":
+        """The saved summary of folder if it covers all results on disk, otherwise one rebuilt from them."""
+        summary = ResultSummary.load(folder)
+        on_disk = 0
+        if any(folder.glob(f"{Constants.MODEL_NAME}=*/*.parquet")):
+            on_disk = con.execute(f"SELECT COUNT(*) FROM read_parquet('{ResultSummary.results_pattern(folder)}')").fetchone()[0]
+        if summary is not None and summary.count() == on_disk and (len(summary.keys) > 1) == configuration:
+            return summary
+        print(f"INF: Result summary is missing or outdated, rebuilding it from {on_disk} results.")
+        summary = ResultSummary.build(con, folder, configuration)
+        summary.save()
+        return summary
@@ -0,0 +1,210 @@
+import os
+import random
+from pathlib import Path
+from typing import Dict, NamedTuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from instance_generator import FlatZincInstanceGenerator
+from manifest import WorkloadManifest
+from schemas import Constants, Schemas
+
+
+class ModelSpec(NamedTuple):
+    variables: int                  # search variables
+    constraints: int | None = None  # defaults to one constraint per search variable
+    anonymous_search: bool = False  # int_search on a [...] literal instead of a named output array
+    target_bytes: int = 0           # padding variables and constraints are added until the FlatZinc is this large
+
+
+"""
+FlatZinc model of arbitrary size that looks like the output of the MiniZinc compiler: bounded integer variables,
+a chain of linear inequalities, disequalities, an all different constraint and an int_search annotation.
+The model is satisfiable, the chain x1 < x2 < ... fits into the domains.
+Padding variables only take part in int_le constraints and are not searched on.
+"""
+class SyntheticModel:
+
+    domain_size = 10
+
+    def __init__(self, spec: ModelSpec):
+        if spec.variables < 2:
+            raise ValueError("A synthetic model needs at least 2 search variables")
+        self.spec = spec
+        self.name = SyntheticModel.model_name(spec)
+        self.variables = SyntheticModel.variable_names(spec.variables)
+        self.upper = max(SyntheticModel.domain_size, spec.variables)
+
+        n = spec.variables
+        constraint_count = spec.constraints if spec.constraints is not None else n
+        if constraint_count < 1:
+            raise ValueError("A synthetic model needs at least 1 constraint")
+        chain = min(n - 1, constraint_count - 1)
+        self.constraints = [("int_lin_le", f"X_INTRODUCED_COEFFS_,[{self.variables[i]},{self.variables[i + 1]}],-1") for i in range(chain)]
+        for i in range(max(0, constraint_count - 1 - chain)):
+            a, b = i % n, (i // n + i + 2) % n
+            b = b if b != a else (a + 1) % n
+            self.constraints.append(("int_ne", f"{self.variables[a]},{self.variables[b]}"))
+        self.constraints.append(("fzn_all_different_int", "x"))
+
+        variable_lines = ["array [1..2] of int: X_INTRODUCED_COEFFS_ = [1,-1];"]
+        variable_lines.extend(f"var 1..{self.upper}: {v}:: output_var;" for v in self.variables)
+        array_line = f"array [1..{n}] of var int: x:: output_array([1..{n}]) = [{','.join(self.variables)}];"
+        constraint_lines = [f"constraint {c}({args});" for c, args in self.constraints]
+        search = f"[{','.join(self.variables)}]" if spec.anonymous_search else "x"
+        solve = f"solve :: int_search({search},first_fail,indomain_min,complete) satisfy;"
+
+        # FlatZinc declares all variables before the first constraint, so padding goes into both sections
+        size = sum(len(line) + 1 for line in variable_lines + constraint_lines) + len(array_line) + len(solve) + 2
+        self.padding = 0
+        while size < spec.target_bytes:
+            padding_variable = f"X_PADDING_{self.padding}_"
+            variable_lines.append(f"var 1..{SyntheticModel.domain_size}: {padding_variable}:: var_is_introduced;")
+            constraint_lines.append(f"constraint int_le({padding_variable},{self.variables[0]});")
+            size += len(variable_lines[-1]) + len(constraint_lines[-1]) + 2
+            self.padding += 1
+
+        self.flat_zinc = "\n".join(variable_lines + [array_line] + constraint_lines + [solve]) + "\n"
+
+    @staticmethod
+    def model_name(spec: ModelSpec) -> str:
+        name = f"synthetic_{spec.variables}"
+        if spec.constraints is not None:
+            name += f"_c{spec.constraints}"
+        if spec.anonymous_search:
+            name += "_anonymous"
+        if spec.target_bytes > 0:
+            name += f"_b{spec.target_bytes}"
+        return f"{name}.mzn"
+
+    @staticmethod
+    def variable_names(variable_count: int) -> list[str]:
+        return [f"X_INTRODUCED_{i}_" for i in range(variable_count)]
+
+    def feature_vector(self, problem_id: str = "000") -> Dict:
+        """A feature vector row matching Schemas.Parquet.feature_vector."""
+        variable_names = self.variables + [f"X_PADDING_{i}_" for i in range(self.padding)]
+        constraint_names = [c for c, _ in self.constraints] + ["int_le"] * self.padding
+        histogram = {}
+        for c in constraint_names:
+            histogram[c] = histogram.get(c, 0) + 1
+        decision_vars = sum(2 for c in constraint_names if c != "fzn_all_different_int") + self.spec.variables
+        domain_widths = [self.upper] * self.spec.variables + [SyntheticModel.domain_size] * self.padding
+        mean = sum(domain_widths) / len(domain_widths)
+        return {
+            Constants.PROBLEM_ID: problem_id,
+            Constants.MODEL_NAME: self.name,
+            Constants.FLAT_BOOL_VARS: 0,
+            Constants.FLAT_INT_VARS: len(variable_names),
+            Constants.FLAT_SET_VARS: 0,
+            Constants.ID_TO_VAR_NAME_MAP: dict(enumerate(variable_names)),
+            Constants.ID_TO_CONSTRAINT_NAME_MAP: dict(enumerate(constraint_names)),
+            Constants.DOMAIN_WIDTHS: domain_widths,
+            Constants.STD_DEVIATION_DOMAIN: (sum((w - mean) ** 2 for w in domain_widths) / len(domain_widths)) ** 0.5,
+            Constants.AVERAGE_DOMAIN_SIZE: mean,
+            Constants.MEDIAN_DOMAIN_SIZE: sorted(domain_widths)[len(domain_widths) // 2],
+            Constants.AVERAGE_DOMAIN_OVERLAP: 1.0,
+            Constants.NUMBER_OF_DISJOINT_PAIRS: 0,
+            Constants.META_CONSTRAINTS: 0,
+            Constants.TOTAL_CONSTRAINTS: len(constraint_names),
+            Constants.AVG_DECISION_VARS_IN_CONSTRAINTS: decision_vars / len(constraint_names),
+            Constants.CONSTRAINT_GRAPH: "",
+            Constants.CONSTRAINT_HISTOGRAM: histogram,
+            Constants.ANNOTATION_HISTOGRAM: {"int_search": 1},
+            Constants.METHOD: "satisfy",
+            Constants.FLAT_ZINC: self.flat_zinc,
+            Constants.MINI_ZINC: "",
+        }
+
+    def instances(self, count: int, rng: random.Random, first_id: int = 0, exclude: set[int] = None) -> list[Dict]:
+        """
+        Instance rows like FlatZincInstanceGenerator writes them, the orderings are drawn at random lexicographic ranks.
+        Fewer than count rows are returned if the model has less orderings.
+        :param exclude: ranks drawn before, the new ranks are added to it
+        """
+        variables = sorted(self.variables)
+        perm_count = FlatZincInstanceGenerator.factorial(len(variables))
+        exclude = exclude if exclude is not None else set()
+        ranks = FlatZincInstanceGenerator.sample_permutation_ranks(perm_count, count, rng, exclude=exclude)
+        exclude.update(ranks)
+        return [{
+            Constants.MODEL_NAME: self.name,
+            Constants.ID: first_id + i,
+            Constants.PERMUTATION_ID: str(rank),
+            Constants.INSTANCE_PERMUTATION: FlatZincInstanceGenerator.generate_nth_permutation(variables, rank),
+        } for i, rank in enumerate(ranks)]
+
+    @staticmethod
+    def results(instances: list[Dict], rng: random.Random) -> list[Dict]:
+        """Solver results for instance rows, matching Schemas.Parquet.instance_results."""
+        results = []
+        for instance in instances:
+            failures = int(rng.lognormvariate(6.9, 2.0))
+            results.append(instance | {
+                Constants.INIT_TIME: rng.uniform(0.0005, 0.005),
+                Constants.SOLVE_TIME: failures * 1e-6,
+                Constants.SOLUTIONS: 1,
+                Constants.VARIABLES: len(instance[Constants.INSTANCE_PERMUTATION]),
+                Constants.PROPAGATORS: len(instance[Constants.INSTANCE_PERMUTATION]),
+                Constants.PROPAGATIONS: failures * 20,
+                Constants.NODES: 2 * failures + 1,
+                Constants.FAILURES: failures,
+                Constants.RESTARTS: 0,
+                Constants.PEAK_DEPTH: rng.randint(1, len(instance[Constants.INSTANCE_PERMUTATION])),
+            })
+        return results
+
+
+"""
+Writes a complete synthetic workload: the models as .fzn files, their feature vectors and the instances dataset,
+laid out like the outputs of feature extraction and instance generation.
+"""
+class SyntheticWorkload:
+
+    instance_chunk_size = 100_000
+
+    def __init__(self, output_folder: Path, specs: list[ModelSpec], instances_per_model: int, seed: int = None):
+        self.output_folder = output_folder
+        self.models_folder = output_folder / "models"
+        self.feature_vector_file = output_folder / "feature_vectors.parquet"
+        self.instances_folder = output_folder / "instances"
+        self.specs = specs
+        self.instances_per_model = instances_per_model
+        self.rng = random.Random(seed)
+
+        os.makedirs(self.models_folder, exist_ok=True)
+
+    def run(self):
+        writer = pq.ParquetWriter(self.feature_vector_file, Schemas.Parquet.feature_vector)
+        os.makedirs(self.instances_folder, exist_ok=True)
+        manifest = WorkloadManifest(self.instances_folder)
+        id = 0
+        try:
+            for num, spec in enumerate(self.specs):
+                model = SyntheticModel(spec)
+                (self.models_folder / model.name).with_suffix(".fzn").write_text(model.flat_zinc)
+                manifest.set_variables(model.name, model.variables)
+                writer.write_table(pa.Table.from_pylist([model.feature_vector(f"{num:03}")], schema=Schemas.Parquet.feature_vector))
+
+                drawn = set()
+                remaining = self.instances_per_model
+                while remaining > 0:
+                    chunk = model.instances(min(remaining, SyntheticWorkload.instance_chunk_size), self.rng, id, drawn)
+                    if len(chunk) == 0:
+                        break
+                    pq.write_to_dataset(pa.Table.from_pylist(chunk, schema=Schemas.Parquet.instances), root_path=self.instances_folder,
+                                        schema=Schemas.Parquet.instances, partition_cols=[Constants.MODEL_NAME],
+                                        existing_data_behavior="overwrite_or_ignore",
+                                        row_group_size=FlatZincInstanceGenerator.row_group_size,
+                                        file_visitor=manifest.file_visitor())
+                    id += len(chunk)
+                    remaining -= len(chunk)
+                    if len(chunk) < SyntheticWorkload.instance_chunk_size:
+                        break   # the ordering space of the model is exhausted
+
+                print(f"INF: Wrote {model.name} with {len(model.flat_zinc)} bytes of FlatZinc, {model.padding} padding variables.")
+        finally:
+            writer.close()
+        manifest.save()
+        print(f"INF: Wrote {id} instances of {len(self.specs)} models to {self.output_folder}")
@@ -1,4 +1,3 @@
-import bisect
 import datetime
 import glob
 import logging
@@ -11,76 +10,315 @@ import time
 import zipfile
 from logging.handlers import RotatingFileHandler
 from pathlib import Path
-from typing import Dict
+from typing import Dict, NamedTuple
 
 import duckdb
 import pyarrow.parquet as pq
 import pyarrow as pa
 
+from catalog import WorkloadCatalog
+from censoring import CensoringPolicy
+from cost_model import CostModel
 from instance_generator import FlatZincInstanceGenerator
-from minizinc_wrapper import MinizincWrapper
+from load_controller import LoadController
+from manifest import WorkloadManifest
+from minizinc_wrapper import MinizincWrapper, ResourceLimits
+from parallelism import CoreBudget, ThreadTuner
+from result_spool import ResultSpool
 from schemas import Helpers, Schemas, Constants
+from summary import ResultSummary
+from tracing import Tracer
+
+
+class ResultBatch(NamedTuple):
+    results: pa.RecordBatch     # columnar rows of Schemas.Parquet.instance_results
+    failed: list[int]           # ids of the jobs that failed
+    seconds: float = 0.0        # time the worker spent on the batch
+    jobs: int = 0               # jobs of the batch, in matrix mode a job has a row per configuration
+
+
+class SolverConfiguration(NamedTuple):
+    name: str                       # value of the configuration column
+    solver: str = "gecode"
+    strategy: str = "input_order"   # variable selection of the int_search annotation
+
+    @staticmethod
+    def parse(spec: str) -> "SolverConfiguration":
+        """Reads strategy@solver, e.g. first_fail@chuffed. Either part may be left out for the default."""
+        strategy, _, solver = spec.partition("@")
+        return SolverConfiguration(spec, solver or "gecode", strategy or "input_order")
 
 
 class Testdriver:
 
-    command_template = ' --solver gecode --json-stream --solver-statistics --input-from-stdin --input-is-flatzinc'
-    job_loading_threshold = 5000 #10_000
+    default_solver = "gecode"
+    command_template = ' --solver {solver} --json-stream --solver-statistics --input-from-stdin --input-is-flatzinc'
+    job_loading_threshold = 5000 #10_000        # default and upper bound of a load, the LoadController adapts it
     backup_threshold = 1000000 #5_000_000
-    result_parquet_chunksize = 5000 #10_000
-    num_workers = multiprocessing.cpu_count() - 2
-
-    def __init__(self, feature_vector_parquet: Path, workload_parquet_folder: Path, output_folder: Path, log_path: Path, backup_path: Path):
+    result_parquet_chunksize = 5000 #10_000     # upper bound of the results per spool segment
+    num_workers = max(1, multiprocessing.cpu_count() - 2)
+    pending_key = "_pendingConfigurations"     # set on jobs of which an earlier run solved only some configurations
+    job_batch_size = 16     # jobs a worker claims at once, their results return as one batch
+    result_flush_seconds = 1.0  # results of a claim that is still being solved are sent at least this often
+
+    def __init__(self, feature_vector_parquet: Path, workload_parquet_folder: Path, output_folder: Path, log_path: Path, backup_path: Path,
+                 limits: ResourceLimits = None, memory_budget: int = None, censoring: CensoringPolicy = None,
+                 tune_threads: bool = False, cost_model: CostModel = None, configurations: list[SolverConfiguration] = None,
+                 catalog_file: Path = None, models: queue.Queue = None):
+        """
+        :param memory_budget: bytes of resident memory the driver process should stay below, see LoadController
+        :param censoring: solves with fail or node limits, the results get the censoring columns
+        :param tune_threads: probe picks parallel search per model, the results get the threads column
+        :param cost_model: predicts the cost of every model, probing is cut to one sample per model
+        :param configurations: matrix mode, every job is solved once per configuration and the results get the
+            configuration column. Each solver gets the FlatZinc extracted for it, see load_feature_vectors. The
+            FlatZinc of a job is built once per strategy and shared by the solvers it was extracted for
+        :param catalog_file: DuckDB file of a WorkloadCatalog, kept between runs so only new files are scanned
+        :param models: streaming mode, the workload grows while running. Feature vectors of models whose instances
+            were just written arrive on this queue, None ends the stream. The feature vector file is not read
+        """
+        if configurations is not None and (censoring is not None or tune_threads):
+            raise ValueError("Matrix mode can not be combined with censoring or thread tuning")
+        if configurations is not None and len({c.name for c in configurations}) != len(configurations):
+            raise ValueError("Configuration names must be unique")
+        if configurations is not None and models is not None:
+            raise ValueError("Matrix mode can not be combined with streaming mode, streamed vectors are extracted for one solver")
+        if models is not None and catalog_file is not None:
+            raise ValueError("Streaming mode can not be combined with a catalog, it would count new results as done")
         self.output_folder = output_folder
+        self.workload_folder = workload_parquet_folder
+        self.models = models
+        self.limits = limits    # resource limits of every solver run
+        self.censoring = censoring
+        self.cost_model = cost_model
+        self.configurations = configurations
+        self.pending_configurations: dict[int, list[SolverConfiguration]] = {}  # jobs an earlier run solved partially
+        self.tuner = ThreadTuner(Testdriver.num_workers) if tune_threads else None
+        self.cores = CoreBudget(Testdriver.num_workers) if tune_threads else None
+        self.result_schema = Testdriver.results_schema_for(censoring is not None, tune_threads, configurations is not None)
+        self.controller = LoadController(Testdriver.num_workers, Testdriver.job_batch_size,
+                                         max_in_flight=2 * Testdriver.job_loading_threshold,
+                                         max_flush_rows=Testdriver.result_parquet_chunksize,
+                                         memory_budget=memory_budget)
         self.log_path = log_path
         self.backup_path = backup_path
-        self.job_queue = multiprocessing.Queue()
-        self.result_queue = multiprocessing.Queue()
-        self.job_view = "job_view"
-        self.con = duckdb.connect(database=':memory:')
+        self.job_queue = queue.Queue()      # lists of up to job_batch_size jobs
+        self.result_queue = queue.Queue()   # ResultBatches of up to job_batch_size jobs
+        self.done_table = "done_jobs"
+        self.con = duckdb.connect(database=str(catalog_file) if catalog_file is not None else ':memory:')
+        self.catalog = WorkloadCatalog(self.con, workload_parquet_folder, output_folder) if catalog_file is not None else None
         self.failed_jobs_file = self.output_folder / "failed_jobs.txt"
 
         # create output folder if not exists
         os.makedirs(self.output_folder, exist_ok=True)
         os.makedirs(self.backup_path, exist_ok=True)
+        os.makedirs(self.log_path, exist_ok=True)
+
+        # results a crashed run left in the spool go into the output before the finished jobs are determined
+        self.summary: ResultSummary = None
+        self.spool = ResultSpool(self.output_folder / "_spool", self.result_schema, fold=self.fold,
+                                 segment_rows=Testdriver.result_parquet_chunksize)
+        recovered = self.spool.replay()
+        if recovered > 0:
+            print(f"INF: Recovered {recovered} results from the spool of an earlier run.")
+        # a replayed segment may already be in the saved summary, open() tells by the row count
+        self.summary = ResultSummary.open(self.con, self.output_folder, configuration=configurations is not None)
+
+        # the workload is described by the catalog or the manifest of the generator, neither reads it row by row
+        self.manifest = None
+        if self.catalog is not None:
+            workload_files, result_files = self.catalog.refresh()
+            print(f"INF: Catalog read {workload_files} new workload and {result_files} new result files.")
+        else:
+            self.load_manifest()
+        if len(self.model_ranges()) == 0 and self.models is None:
+            raise FileNotFoundError(f"No workload files in {workload_parquet_folder}")
+
+        # jobs that already have a result are never loaded again, the catalog keeps their ids between runs
+        output_file_pattern = ResultSummary.results_pattern(output_folder)
+        if self.use_catalog_counts():
+            self.done_table = WorkloadCatalog.done_table
+        else:
+            self.con.execute(f"CREATE TEMPORARY TABLE {self.done_table} ({Constants.ID} BIGINT)")
+        if glob.glob(output_file_pattern, recursive=True):
+            if self.configurations is not None:
+                self.load_done_configurations(output_file_pattern)
+            elif not self.use_catalog_counts():
+                self.con.execute(f"INSERT INTO {self.done_table} SELECT DISTINCT {Constants.ID} FROM '{output_file_pattern}'")
+            if self.censoring is not None:
+                self.seed_censoring(output_file_pattern)
+
+        # the job counter walks the id range of the unfinished jobs in steps of the load size
+        self.job_counter = 0
+        self.jobs_loaded = 0
+        self.job_offset, self.max_job_id = (self.catalog or self.manifest).id_range()
+        self.job_count = sum(self.remaining_jobs().values())
 
-        # create view on parquet input data to read from
-        self.con.execute(f"""
-            CREATE TEMPORARY VIEW {self.job_view} AS 
-            SELECT * FROM '{workload_parquet_folder}/**/*.parquet'
-        """)
+        # fill a dictionary with the provided feature vectors for quick access
+        self.feature_vectors = Testdriver.load_feature_vectors(feature_vector_parquet) if self.models is None and configurations is None else {}
+        # matrix mode, the vectors of every solver by solver name
+        self.solver_vectors = None
+        if configurations is not None:
+            self.solver_vectors = {c.solver: Testdriver.load_feature_vectors(feature_vector_parquet, c.solver) for c in configurations}
+            self.feature_vectors = self.solver_vectors[configurations[0].solver]
+
+    def load_manifest(self):
+        self.manifest = WorkloadManifest.load(self.workload_folder)
+        if self.manifest is None or not self.manifest.is_current():
+            print(f"INF: No current workload manifest, building it from the Parquet footers.")
+            self.manifest = WorkloadManifest.scan(self.workload_folder, self.manifest)
+
+    def receive_models(self, logger: "Testdriver.JobLogger") -> bool:
+        """
+        Streaming mode, adds the feature vectors that arrived since the last call and extends the workload.
+        :return: True if the workload changed
+        """
+        received, ended = 0, False
+        while self.models is not None:
+            try:
+                vector = self.models.get_nowait()
+            except queue.Empty:
+                break
+            if vector is None:
+                self.models, ended = None, True
+                break
+            vector[Constants.FLAT_ZINC] = FlatZincInstanceGenerator.ensure_input_order_annotation(vector[Constants.FLAT_ZINC])
+            self.feature_vectors[vector[Constants.MODEL_NAME]] = vector
+            received += 1
 
-        # determine starting point of the job_counter
-        # job counter will be minimal job id that is not already worked on
-        output_file_pattern = f'{output_folder}/**/*.parquet'
-        self.job_counter = 0
-        if glob.glob(output_file_pattern):
-            self.job_offset = self.con.execute(
-                f"""
-                SELECT MIN(w.{Constants.ID})
-                FROM {self.job_view} w
-                LEFT JOIN '{output_file_pattern}' r
-                ON w.{Constants.ID} = r.{Constants.ID}
-                WHERE r.{Constants.ID} IS NULL
-                """).fetchone()[0]
+        if received > 0 or ended:
+            self.extend_workload()
+            logger.total_jobs = self.job_count
+            logger.log(logging.INFO, 0, f"Received {received} models, {self.job_count} jobs in total.")
+        return received > 0 or ended
+
+    def extend_workload(self):
+        """
+        Re-reads the manifest in streaming mode. Jobs are only loaded up to the first model whose feature vector did
+        not arrive yet, the ids of a resumed workload may already hold models the pipeline did not pass on again.
+        Once the stream ended every job is loaded.
+        """
+        self.load_manifest()
+        low, high = self.manifest.id_range()
+        waiting = [first for model, first, _, _ in self.model_ranges() if model not in self.feature_vectors]
+        if self.models is not None and len(waiting) > 0:
+            high = min(waiting) - 1
+        if self.job_offset is None:
+            self.job_offset = low
+        self.max_job_id = high
+        self.job_count = sum(jobs for model, jobs in self.remaining_jobs().items()
+                             if self.models is None or model in self.feature_vectors)
+
+    def use_catalog_counts(self) -> bool:
+        """The catalog knows the finished jobs, except in matrix mode where a job is finished per configuration."""
+        return self.catalog is not None and self.configurations is None
+
+    def model_ranges(self) -> list[tuple[str, int, int, int]]:
+        """
+        (model name, min id, max id, jobs) of every model of the workload. Appended instances give a model several
+        id ranges, min and max span all of them and may enclose ids of other models.
+        """
+        if self.catalog is not None:
+            return self.catalog.models()
+        return sorted(((model, entry["ranges"][0][0], entry["ranges"][-1][1], entry["jobs"])
+                       for model, entry in self.manifest.models.items() if entry["jobs"] > 0), key=lambda m: m[1])
+
+    def remaining_jobs(self) -> dict[str, int]:
+        """Jobs without a (complete) result per model, finished ids are counted per id range of the model."""
+        if self.use_catalog_counts():
+            return self.catalog.remaining_jobs()
+        if self.catalog is not None:
+            ranges = self.catalog.id_ranges()    # matrix mode, the catalog only describes the workload
         else:
-            self.job_offset = self.con.execute(
-                f"""
-                    SELECT MIN({Constants.ID})
-                    FROM {self.job_view}
-                """).fetchone()[0]
+            ranges = [(model, low, high) for model, entry in self.manifest.models.items() for low, high in entry["ranges"]]
+        if len(ranges) == 0:
+            return {}
+        done = dict(self.con.execute(f"""
+            SELECT r.model, COUNT(*)
+            FROM (SELECT unnest(?) AS model, unnest(?) AS low, unnest(?) AS high) r
+            JOIN {self.done_table} d ON d.{Constants.ID} BETWEEN r.low AND r.high
+            GROUP BY r.model
+            """, [[r[0] for r in ranges], [r[1] for r in ranges], [r[2] for r in ranges]]).fetchall())
+        return {model: jobs - done.get(model, 0) for model, _, _, jobs in self.model_ranges()}
+
+    def job_source(self, low: int, high: int) -> str | None:
+        """
+        SQL table expression holding the workload jobs with ids in [low, high), over the files that overlap the range.
+        :return: None if no workload file holds ids of the range
+        """
+        return (self.catalog or self.manifest).source(low, high)
 
-        # get amount of jobs
-        self.job_count = self.con.execute(f"""SELECT COUNT(*) FROM {self.job_view}""").fetchone()[0]
+    @staticmethod
+    def results_schema_for(censoring: bool = False, threads: bool = False, configuration: bool = False) -> pa.Schema:
+        """Schema of the result rows, optional columns are appended per mode."""
+        fields = list(Schemas.Parquet.instance_results)
+        if censoring:
+            fields += Schemas.Parquet.censoring_fields
+        if threads:
+            fields.append(Schemas.Parquet.threads_field)
+        if configuration:
+            fields.append(Schemas.Parquet.configuration_field)
+        return pa.schema(fields)
+
+    def load_done_configurations(self, output_file_pattern: str):
+        """
+        In matrix mode a job is done once it has a result for every configuration. Jobs with results for only some
+        configurations, e.g. because the driver died in between, are loaded again for the missing ones.
+        """
+        names = ", ".join(f"'{c.name}'" for c in self.configurations)
+        self.con.execute(f"""
+            CREATE TEMPORARY TABLE done_configurations AS
+            SELECT {Constants.ID}, list(DISTINCT {Constants.CONFIGURATION}) AS done
+            FROM read_parquet('{output_file_pattern}', union_by_name = true)
+            WHERE {Constants.CONFIGURATION} IN ({names})
+            GROUP BY {Constants.ID}
+            """)
+        self.con.execute(f"""
+            INSERT INTO {self.done_table}
+            SELECT {Constants.ID} FROM done_configurations WHERE len(done) = {len(self.configurations)}
+            """)
+        for job_id, done in self.con.execute(
+                f"SELECT {Constants.ID}, done FROM done_configurations WHERE len(done) < {len(self.configurations)}").fetchall():
+            self.pending_configurations[job_id] = [c for c in self.configurations if c.name not in done]
+
+    def seed_censoring(self, output_file_pattern: str):
+        """Continues the running quantiles of a resumed run with a random sample of its results per model."""
+        metric = self.censoring.metric
+        rows = self.con.execute(f"""
+            SELECT {Constants.MODEL_NAME}, {metric}
+            FROM read_parquet('{output_file_pattern}', hive_partitioning = true, union_by_name = true)
+            QUALIFY row_number() OVER (PARTITION BY {Constants.MODEL_NAME} ORDER BY random()) <= {CensoringPolicy.reservoir_size}
+            """).fetchall()
+        for model, value in rows:
+            self.censoring.observe(model, value)
 
-        # fill a dictionary with the provided feature vectors for quick access
-        vectors = pq.read_table(feature_vector_parquet, schema=Schemas.Parquet.feature_vector).to_pylist()
-        self.feature_vectors = {}
+    @staticmethod
+    def load_feature_vectors(feature_vector_parquet: Path, solver: str = None) -> dict[str, Dict]:
+        """
+        Reads the feature vectors keyed by model name, with the FlatZinc already set to input ordering.
+        Files extracted for several backends are rejected, see FlatZincInstanceGenerator.require_untagged.
+        :param solver: matrix mode, reads the vectors extracted for this backend. An untagged file only serves the
+            default solver, its FlatZinc was compiled for the default backend of the extractor
+        """
+        if solver is None:
+            FlatZincInstanceGenerator.require_untagged(feature_vector_parquet)
+            vectors = pq.read_table(feature_vector_parquet, schema=Schemas.Parquet.feature_vector).to_pylist()
+        elif Constants.BACKEND not in pq.read_schema(feature_vector_parquet).names:
+            if solver != Testdriver.default_solver:
+                raise ValueError(f"{feature_vector_parquet} holds FlatZinc for {Testdriver.default_solver} only, "
+                                 f"extract the vectors with --backends for {solver}")
+            vectors = pq.read_table(feature_vector_parquet, schema=Schemas.Parquet.feature_vector).to_pylist()
+        else:
+            vectors = pq.read_table(feature_vector_parquet, schema=Schemas.Parquet.feature_vector.append(Schemas.Parquet.backend_field),
+                                    filters=[(Constants.BACKEND, "=", solver)]).to_pylist()
+            if len(vectors) == 0:
+                raise ValueError(f"{feature_vector_parquet} holds no feature vectors extracted for {solver}")
+        feature_vectors = {}
         for vector in vectors:
-            self.feature_vectors[vector[Constants.MODEL_NAME]] = vector
+            feature_vectors[vector[Constants.MODEL_NAME]] = vector
             # todo decide if this next step should happen during feature extraction?
             vector[Constants.FLAT_ZINC] = FlatZincInstanceGenerator.ensure_input_order_annotation(vector[Constants.FLAT_ZINC])
-
+        return feature_vectors
 
     class JobLogger:
         def __init__(self, total_num_jobs: int, log_path: Path):
@@ -105,81 +343,221 @@ class Testdriver:
             self.total_jobs = total_num_jobs
 
         def log(self, level, job: int, message: str, job_name: str = ""):
-            progress = (job / self.total_jobs) * 100
+            progress = (job / self.total_jobs) * 100 if self.total_jobs > 0 else 0.0
             extra = {'job': f"{job_name} {job}", 'progress': f"{progress:.2f}"}
             self.logger.log(level, message, extra=extra)
 
     @staticmethod
-    def worker(job_queue, result_queue, feature_vectors: dict[Dict], logger: JobLogger, queue_timeout: int):
-
-        while True:
-            try:
-                job = job_queue.get(timeout=queue_timeout)
-            except queue.Empty:
-                logger.log(logging.DEBUG, 0, "Empty Queue - Worker is exiting.")
-                break
-
-            job_num = job[Constants.ID]
-            logger.log(logging.DEBUG, job_num,
-                       f"Processing Variable Ordering {job[Constants.INSTANCE_PERMUTATION]}", job[Constants.MODEL_NAME])
+    def solve_job(job: Dict, feature_vectors: dict[Dict], logger: JobLogger, limits: ResourceLimits = None,
+                  censoring: CensoringPolicy = None, threads: int = None, observe: bool = True) -> Dict | None:
+        """
+        Solves one job. Returns the result row, or None if the job failed.
+        With censoring the solver gets the current limit of the model and the row the censoring columns.
+        :param threads: threads of the search, recorded in the row. None runs the solver default without recording it
+        :param observe: False applies the censoring limit without adding the solve to the policy, for repeated timings
+        """
+        job_num = job[Constants.ID]
+        logger.log(logging.DEBUG, job_num,
+                   f"Processing Variable Ordering {job[Constants.INSTANCE_PERMUTATION]}", job[Constants.MODEL_NAME])
 
+        with Tracer.span("job", "testdriver", id=job_num, model=job[Constants.MODEL_NAME]):
             try:
                 associated_feature_vector = feature_vectors[job[Constants.MODEL_NAME]]
-                mutated_zinc = FlatZincInstanceGenerator.substitute_variables(
-                    associated_feature_vector[Constants.FLAT_ZINC], job[Constants.INSTANCE_PERMUTATION])
-                _, output = MinizincWrapper.run(Testdriver.command_template, stdin=mutated_zinc)
+                with Tracer.span("substitute", "testdriver"):
+                    mutated_zinc = FlatZincInstanceGenerator.substitute_variables(
+                        associated_feature_vector[Constants.FLAT_ZINC], job[Constants.INSTANCE_PERMUTATION])
+                command, cutoff = Testdriver.command_template.replace("{solver}", Testdriver.default_solver), None
+                if censoring is not None:
+                    cutoff = censoring.limit(job[Constants.MODEL_NAME])
+                    command += censoring.solver_flag(cutoff)
+                if threads is not None and threads > 1:
+                    command += f" -p {threads}"
+                data = Testdriver.run_solver(command, mutated_zinc, job, logger, limits)
+                if data is None:
+                    return None
+                if threads is not None:
+                    data[Constants.THREADS] = threads
+                if censoring is not None and observe:
+                    optimisation = associated_feature_vector[Constants.METHOD] != "satisfy"
+                    data.update(censoring.record(job[Constants.MODEL_NAME], data, cutoff, optimisation))
+                    if data[Constants.CENSORED]:
+                        logger.log(logging.INFO, job_num, f"Censored at {censoring.limit_type} limit {cutoff}", job[Constants.MODEL_NAME])
+                        return data
+
+                logger.log(logging.INFO, job_num, f"Backtracks: {data[Constants.FAILURES]}, SolveTime: {data[Constants.SOLVE_TIME]}", job[Constants.MODEL_NAME])
+                return data
 
-                found_statistics = False
-                # in the output look for the line that matches the json statistics schema.
-                for o in output:
-                    try:
-                        data = Helpers.json_to_solution_statistics_dict(o)
-                        found_statistics = True
-                    except:
-                        # intended behaviour
-                        continue
-
-                    data[Constants.INSTANCE_PERMUTATION] = job[Constants.INSTANCE_PERMUTATION]
-                    data[Constants.MODEL_NAME] = job[Constants.MODEL_NAME]
-                    data[Constants.ID] = job_num
-                    data[Constants.PERMUTATION_ID] = job[Constants.PERMUTATION_ID]
-
-                    logger.log(logging.INFO, job_num, f"Backtracks: {data[Constants.FAILURES]}, SolveTime: {data[Constants.SOLVE_TIME]}", job[Constants.MODEL_NAME])
+            except Exception as e:
+                logger.log(logging.ERROR, job_num,
+                           f"Validation Error: {e}", job[Constants.MODEL_NAME])
+                return None
 
-                    result_queue.put(data)
+    @staticmethod
+    def run_solver(command: str, fzn: str, job: Dict, logger: JobLogger, limits: ResourceLimits = None) -> Dict | None:
+        """
+        Runs the solver on the FlatZinc of a job and returns the result row. Returns None if a resource limit was hit,
+        raises if the solver failed.
+        """
+        job_num = job[Constants.ID]
+        result = MinizincWrapper.run(command, stdin=fzn, limits=limits)
+        if result.status in MinizincWrapper.limit_statuses:
+            logger.log(logging.WARN, job_num, f"Limit hit: {result.status}", job[Constants.MODEL_NAME])
+            return None
+        if result.status != MinizincWrapper.STATUS_OK:
+            raise ValueError(f"MiniZinc exited with code {result.returncode}.")
+
+        found_statistics = False
+        # in the output look for the line that matches the json statistics schema.
+        with Tracer.span("parse", "testdriver"):
+            for o in result.output:
+                try:
+                    data = Helpers.json_to_solution_statistics_dict(o)
+                    found_statistics = True
                     break
+                except:
+                    # intended behaviour
+                    continue
 
-                if not found_statistics:
-                    raise ValueError(f"No {Constants.SOLVER_STATISTICS} found in output.")
+        if not found_statistics:
+            raise ValueError(f"No {Constants.SOLVER_STATISTICS} found in output.")
 
-            except Exception as e:
-                logger.log(logging.ERROR, job_num,
-                           f"Validation Error: {e}", job[Constants.MODEL_NAME])
-                result_queue.put(job_num)  # communicates a job failure
-                continue
+        data[Constants.INSTANCE_PERMUTATION] = job[Constants.INSTANCE_PERMUTATION]
+        data[Constants.MODEL_NAME] = job[Constants.MODEL_NAME]
+        data[Constants.ID] = job_num
+        data[Constants.PERMUTATION_ID] = job[Constants.PERMUTATION_ID]
+        return data
 
+    @staticmethod
+    def solve_job_matrix(job: Dict, solver_vectors: dict[str, dict[str, Dict]], logger: JobLogger, configurations: list[SolverConfiguration],
+                         limits: ResourceLimits = None) -> list[Dict]:
+        """
+        Solves one job with every configuration. The FlatZinc is built once per search strategy and FlatZinc and
+        handed to all solvers of that strategy whose vectors hold the same FlatZinc.
+        :param solver_vectors: feature vectors by model name, by solver
+        :return: a result row per configuration that succeeded
+        """
+        job_num = job[Constants.ID]
+        model = job[Constants.MODEL_NAME]
+        by_strategy: dict[tuple[str, str], list[SolverConfiguration]] = {}
+        for configuration in configurations:
+            fzn = solver_vectors[configuration.solver][model][Constants.FLAT_ZINC]
+            by_strategy.setdefault((configuration.strategy, fzn), []).append(configuration)
+
+        rows = []
+        with Tracer.span("job", "testdriver", id=job_num, model=model, configurations=len(configurations)):
+            for (strategy, fzn), group in by_strategy.items():
+                try:
+                    with Tracer.span("substitute", "testdriver", strategy=strategy):
+                        mutated_zinc = FlatZincInstanceGenerator.substitute_variables(
+                            fzn, job[Constants.INSTANCE_PERMUTATION], strategy)
+                except Exception as e:
+                    logger.log(logging.ERROR, job_num, f"Validation Error: {e}", model)
+                    continue
+
+                for configuration in group:
+                    try:
+                        command = Testdriver.command_template.replace("{solver}", configuration.solver)
+                        data = Testdriver.run_solver(command, mutated_zinc, job, logger, limits)
+                    except Exception as e:
+                        logger.log(logging.ERROR, job_num, f"Validation Error in {configuration.name}: {e}", model)
+                        continue
+                    if data is not None:
+                        data[Constants.CONFIGURATION] = configuration.name
+                        logger.log(logging.INFO, job_num, f"{configuration.name} Backtracks: {data[Constants.FAILURES]}, "
+                                                          f"SolveTime: {data[Constants.SOLVE_TIME]}", model)
+                        rows.append(data)
+        return rows
 
-    def load_next_job_batch(self, logger):
+    @staticmethod
+    def worker(job_queue, result_queue, feature_vectors: dict[Dict], logger: JobLogger, queue_timeout: int, limits: ResourceLimits = None,
+               censoring: CensoringPolicy = None, tuner: ThreadTuner = None, cores: CoreBudget = None,
+               configurations: list[SolverConfiguration] = None):
+        """
+        Claims lists of jobs from the job queue and answers them with ResultBatches. The results of a claim are sent
+        once it is solved, or as soon as result_flush_seconds passed, so long jobs do not hold back finished solves.
+        Workers are threads, both queues are in process queues that pass references instead of pickling.
+        With a tuner every job runs with the threads chosen for its model and holds that many cores of the budget.
+        With configurations a job counts as failed if any of its configurations failed, and feature_vectors are the
+        vectors by solver as in solve_job_matrix.
+        """
+        schema = Testdriver.results_schema_for(censoring is not None, tuner is not None, configurations is not None)
+        while True:
+            try:
+                jobs = job_queue.get(timeout=queue_timeout)
+            except queue.Empty:
+                logger.log(logging.DEBUG, 0, "Empty Queue - Worker is exiting.")
+                break
+            if jobs is None:
+                break   # the driver is done
+
+            with Tracer.span("job_batch", "testdriver", jobs=len(jobs)):
+                rows, failed_ids, seconds, solved = [], [], 0.0, 0
+                last_flush = time.perf_counter()
+                for num, job in enumerate(jobs, 1):
+                    start = time.perf_counter()
+                    if configurations is not None:
+                        pending = job.get(Testdriver.pending_key, configurations)
+                        results = Testdriver.solve_job_matrix(job, feature_vectors, logger, pending, limits)
+                        failed = [job[Constants.ID]] if len(results) < len(pending) else []
+                    else:
+                        threads = tuner.threads_for(job[Constants.MODEL_NAME]) if tuner is not None else None
+                        held = cores.acquire(threads) if cores is not None else 0
+                        try:
+                            data = Testdriver.solve_job(job, feature_vectors, logger, limits, censoring, threads)
+                        finally:
+                            if cores is not None:
+                                cores.release(held)
+                        results, failed = ([], [job[Constants.ID]]) if data is None else ([data], [])
+
+                    rows.extend(results)
+                    failed_ids.extend(failed)
+                    seconds += time.perf_counter() - start
+                    solved += 1
+                    if num == len(jobs) or solved >= Testdriver.job_batch_size \
+                            or time.perf_counter() - last_flush >= Testdriver.result_flush_seconds:
+                        with Tracer.span("enqueue_result", "testdriver", jobs=solved):
+                            result_queue.put(ResultBatch(pa.RecordBatch.from_pylist(rows, schema=schema), failed_ids, seconds, solved))
+                        rows, failed_ids, seconds, solved = [], [], 0.0, 0
+                        last_flush = time.perf_counter()
+
+    def load_next_job_batch(self, logger, size: int = None):
         """
         Jobs are loaded in chunks, because storing them all in memory would require to much ram.
+        Each chunk is a range of size ids (default job_loading_threshold) up to max_job_id, minus the jobs finished in earlier runs.
         """
-        # todo will fail if job range of worked on jobs is not continuous (due to earlier errors)
-        # but can work with non continuous ranges if no output is already present
+        size = size if size is not None else Testdriver.job_loading_threshold
         logger.log(logging.DEBUG, 0, f"About to load new jobs. Current QSize {self.job_queue.qsize()}")
         loaded_in_this_batch = 0
-        while self.job_counter < self.job_count and loaded_in_this_batch < Testdriver.job_loading_threshold:
-
+        while self.job_count > 0 and self.job_offset + self.job_counter <= self.max_job_id \
+                and loaded_in_this_batch < size:
+
+            low = self.job_offset + self.job_counter
+            high = min(low + size, self.max_job_id + 1)     # a streamed workload may not be loadable any further yet
+            source = self.job_source(low, high)
+            if source is None:
+                # no workload file holds ids of this range
+                self.job_counter += high - low
+                continue
             jobs = self.con.execute(f"""
-                            SELECT * FROM {self.job_view}
-                            WHERE {Constants.ID} >= {self.job_counter + self.job_offset}
-                            AND {Constants.ID} < {self.job_counter + self.job_offset + Testdriver.job_loading_threshold}
-                            """).arrow().to_pylist()
+                            SELECT w.* FROM {source} w
+                            ANTI JOIN {self.done_table} d
+                            ON w.{Constants.ID} = d.{Constants.ID}
+                            WHERE w.{Constants.ID} >= {low}
+                            AND w.{Constants.ID} < {high}
+                            ORDER BY w.{Constants.ID}
+                            """).fetch_arrow_table().to_pylist()
 
             loaded_in_this_batch += len(jobs)
-            for job in jobs:
-                self.job_queue.put(job)
-            self.job_counter += loaded_in_this_batch
-
+            if len(self.pending_configurations) > 0:
+                for job in jobs:
+                    pending = self.pending_configurations.pop(job[Constants.ID], None)
+                    if pending is not None:
+                        job[Testdriver.pending_key] = pending
+            for i in range(0, len(jobs), Testdriver.job_batch_size):
+                self.job_queue.put(jobs[i:i + Testdriver.job_batch_size])
+            self.job_counter += high - low
+
+        self.jobs_loaded += loaded_in_this_batch
         logger.log(logging.DEBUG, 0, f"Attempted loading new Jobs. New QSize {self.job_queue.qsize()}")
 
     def probe(self, logger: JobLogger, samples_per_problem=5):
@@ -190,31 +568,26 @@ class Testdriver:
         :param logger: logger of the caller
         """
         # ov every problem fetch one row (one instance)
-        min_max = self.con.execute(
-            f"""SELECT
-            MIN({Constants.ID}) as min_id, MAX({Constants.ID}) as max_id
-            FROM {self.job_view}
-            GROUP BY {Constants.MODEL_NAME}
-            """)
-
+        model_ranges = self.model_ranges()
         probe_rows = {}
-        for d in min_max.arrow().to_pylist():
-            min_ = d["min_id"]
-            max_ = d["max_id"]
+        for _, min_, max_, _ in model_ranges:
 
             if max_ - min_ < samples_per_problem:
-                # not work probing
-                break
+                # not worth probing
+                continue
 
             search = list(range(min_, max_, (max_ - min_) // samples_per_problem))
 
             for v in search:
-                r = self.con.execute(f"""
+                source = self.job_source(v, v + 1)
+                if source is None:
+                    continue
+                for r in self.con.execute(f"""
                 SELECT *
-                FROM {self.job_view}
+                FROM {source}
                 WHERE {Constants.ID} = {v}
-                """).arrow().to_pylist()[0]
-                probe_rows.setdefault(r[Constants.MODEL_NAME], []).append(r)
+                """).fetch_arrow_table().to_pylist():
+                    probe_rows.setdefault(r[Constants.MODEL_NAME], []).append(r)
 
         result_queue = queue.Queue()
         job_queue = queue.Queue()
@@ -225,21 +598,20 @@ class Testdriver:
             logger.log(logging.INFO, 0, f"Probing Preparation", problem)
 
             for sample in samples:
-                job_queue.put_nowait(sample)
+                job_queue.put_nowait([sample])
                 if problem == "magic_sequence4.mzn":
                     print(self.feature_vectors[problem][Constants.FLAT_ZINC])
-                self.worker(job_queue, result_queue, self.feature_vectors, logger, 0)
+                self.worker(job_queue, result_queue, self.solver_vectors or self.feature_vectors, logger, 0, self.limits,
+                            self.censoring, configurations=self.configurations)
                 _ = result_queue.get_nowait()
 
             indiv_t = (time.time() - start) / len(samples)
             logger.log(logging.INFO, 0, f"Probing 1 Job took {indiv_t}s per sample", problem)
+            if self.tuner is not None:
+                indiv_t = self.tune_threads(problem, samples, indiv_t, logger)
 
             # get the number of jobs for this problem
-            problem_count = self.con.execute(f"""
-                SELECT COUNT(*)
-                FROM {self.job_view}
-                WHERE {Constants.MODEL_NAME} = '{problem}'
-            """).arrow().to_pydict()["count_star()"][0]
+            problem_count = next(jobs for model, _, _, jobs in model_ranges if model == problem)
 
             timings[problem] = (indiv_t, problem_count)
 
@@ -248,21 +620,74 @@ class Testdriver:
 
         estimated_total_h = 0
         for problem, stats in timings.items():
-            estimated_exec_time_for_problem_s = stats[0] * stats[1]     # time with 1 core
+            estimated_exec_time_for_problem_s = stats[0] * stats[1]     # time with 1 core, core time with parallel search
             estimated_h = estimated_exec_time_for_problem_s / 60 / 60 / Testdriver.num_workers
             estimated_total_h += estimated_h
             logger.log(logging.INFO, 0, f"Estimating {estimated_h}h with {Testdriver.num_workers} workers.", problem)
 
         logger.log(logging.INFO, 0, f"Estimated total {estimated_total_h}h time with {Testdriver.num_workers} workers.")
 
+    def predict(self, logger: JobLogger):
+        """
+        Estimates the remaining time per model with the cost model and starts the load controller from the
+        predicted latency instead of waiting for the first results.
+        """
+        counts = self.remaining_jobs().items()
+
+        total_seconds, total_jobs = 0.0, 0
+        for problem, jobs in counts:
+            if problem not in self.feature_vectors:
+                continue
+            prediction = self.cost_model.predict(self.feature_vectors[problem])
+            total_seconds += prediction["seconds"] * jobs
+            total_jobs += jobs
+            logger.log(logging.INFO, 0, f"Predicting {prediction['seconds']}s and {prediction[Constants.FAILURES]:.0f} failures per job, "
+                                        f"{prediction['seconds'] * jobs / 60 / 60 / Testdriver.num_workers}h with {Testdriver.num_workers} workers.", problem)
+
+        logger.log(logging.INFO, 0, f"Predicted total {total_seconds / 60 / 60 / Testdriver.num_workers}h time with {Testdriver.num_workers} workers.")
+        if total_jobs > 0:
+            self.controller.observe(total_jobs, total_seconds)
+
+    def tune_threads(self, problem: str, samples: list[Dict], single_thread_t: float, logger: JobLogger) -> float:
+        """
+        Times the probe samples of a model at every candidate thread count and lets the tuner choose.
+        The samples run under the censoring limit of the real run, but are observed only once by the probe.
+        :return: core seconds per job with the chosen threads
+        """
+        if single_thread_t < ThreadTuner.min_tune_seconds:
+            self.tuner.tune(problem, {1: single_thread_t})
+            return single_thread_t
+
+        timings = {1: single_thread_t}
+        for threads in self.tuner.candidates()[1:]:
+            start = time.time()
+            for sample in samples:
+                Testdriver.solve_job(sample, self.feature_vectors, logger, self.limits, self.censoring, threads=threads, observe=False)
+            timings[threads] = (time.time() - start) / len(samples)
+        chosen = self.tuner.tune(problem, timings)
+        logger.log(logging.INFO, 0, f"Seconds per job by threads {timings}, using {chosen} threads per job "
+                                    f"while more jobs remain than cores", problem)
+        return chosen * timings[chosen]
+
     def write_parquet(self, buffer: list[Dict], num: int, logger: JobLogger):
-        table = pa.Table.from_pylist(buffer, schema=Schemas.Parquet.instance_results)
+        table = pa.Table.from_pylist(buffer, schema=self.result_schema)
+        self.write_table(table, f"part_{{i}}{num}_{datetime.datetime.now():%H-%M-%S-%f}.parquet", logger)  #  {i} must be included...
+
+    def fold(self, table: pa.Table, name: str):
+        """Writes a spool segment to the output and adds it to the result summary."""
+        self.write_table(table, f"part_{{i}}_{name}.parquet")
+        if self.summary is not None:
+            with Tracer.span("update_summary", "testdriver", rows=table.num_rows):
+                self.summary.update(table)
+                self.summary.save()
+
+    def write_table(self, table: pa.Table, basename_template: str, logger: JobLogger = None):
         pq.write_to_dataset(table=table,
                             root_path=self.output_folder,
                             use_threads=True,
-                            schema=Schemas.Parquet.instance_results,
-                            file_visitor=lambda x: logger.log(logging.INFO, 0, f"Parquet Writer touched {x.path}"),
-                            basename_template=f"part_{{i}}{num}_{datetime.datetime.now():%H-%M-%S-%f}.parquet",  #  {{i}} must be included...
+                            schema=self.result_schema,
+                            file_visitor=(lambda x: logger.log(logging.INFO, 0, f"Parquet Writer touched {x.path}")) if logger is not None else None,
+                            basename_template=basename_template,
                             partition_cols=[Constants.MODEL_NAME],
                             existing_data_behavior="overwrite_or_ignore")
 
@@ -274,10 +699,21 @@ class Testdriver:
     def run(self):
         logger = Testdriver.JobLogger(self.job_count, self.log_path)
 
-        self.probe(logger)
+        if self.models is not None:
+            # models arrive while running, an estimate over the first of them would mislead
+            logger.log(logging.INFO, 0, "Streaming mode, probing is skipped.")
+            self.extend_workload()
+            self.receive_models(logger)
+        else:
+            with Tracer.span("probe", "testdriver"):
+                # one sample per model still fails early on broken jobs, thread tuning needs the full probe
+                self.probe(logger, samples_per_problem=1 if self.cost_model is not None and self.tuner is None else 5)
+            if self.cost_model is not None:
+                self.predict(logger)
 
         logger.log(logging.INFO, 0, "Filling Job Queue with first Batch")
-        self.load_next_job_batch(logger)
+        with Tracer.span("load_jobs", "testdriver"):
+            self.load_next_job_batch(logger, self.controller.in_flight)
 
         logger.log(logging.INFO, 0, f"Processing will start using {Testdriver.num_workers} workers.")
 
@@ -286,58 +722,80 @@ class Testdriver:
             t = threading.Thread(target=Testdriver.worker, kwargs={
                 "job_queue": self.job_queue,
                 "result_queue": self.result_queue,
-                "feature_vectors": self.feature_vectors,
+                "feature_vectors": self.solver_vectors or self.feature_vectors,
                 "logger": logger,
-                "queue_timeout": 30}
+                "queue_timeout": 30 if self.models is None else None,   # streamed jobs may take a while to arrive
+                "limits": self.limits,
+                "censoring": self.censoring,
+                "tuner": self.tuner,
+                "cores": self.cores,
+                "configurations": self.configurations}
             )
             t.start()
             threads.append(t)
 
-        def sort_by(d: Dict) -> int:
-            return d[Constants.ID]
+        self.spool.start()
 
         failed_jobs = 0
         processed_count = 0
-        sorted_buffer = []
-        while processed_count < self.job_count:
+        if self.tuner is not None:
+            self.tuner.remaining = self.job_count
+        backups = 0
+        while processed_count < self.job_count or self.models is not None:
+
+            if self.models is not None and self.receive_models(logger):
+                if self.models is None and processed_count >= self.job_count:
+                    break   # the stream ended with everything solved
+                if self.controller.should_load(self.jobs_loaded - processed_count):
+                    with Tracer.span("load_jobs", "testdriver"):
+                        self.load_next_job_batch(logger, self.controller.load_size)
 
             try:
-                output = self.result_queue.get(timeout=60)
-                processed_count += 1
+                with Tracer.span("wait_result", "testdriver"):
+                    batch = self.result_queue.get(timeout=60 if self.models is None else 1)
             except queue.Empty:
                 continue
+            processed_count += batch.jobs
+            if self.tuner is not None:
+                self.tuner.remaining = self.job_count - processed_count     # picks parallel search once cores idle
 
-            # check for failed job
-            if isinstance(output, int):
-                failed_jobs += 1
+            if len(batch.failed) > 0:
+                failed_jobs += len(batch.failed)
                 with open(self.failed_jobs_file, mode="a") as f:
-                    f.write(f"{output}\n")
-            else:
-                bisect.insort(sorted_buffer, output, key=sort_by)
-
-            if self.job_queue.qsize() < Testdriver.job_loading_threshold:
-                self.load_next_job_batch(logger)
-
-            # When the buffer is slightly larger than the chunksize we write we flush to disk
-            # This way we will most likely be flushing fully sorted rows.
-            # But as we can not be 100% certain, a postprocessing step is still required.
-            if len(sorted_buffer) >= int(Testdriver.result_parquet_chunksize * 1.1):
-                self.write_parquet(sorted_buffer[:Testdriver.result_parquet_chunksize], processed_count // Testdriver.result_parquet_chunksize,  logger)
-                logger.log(logging.INFO, 0,
-                           f"Flushed Parquet Table to disk after {processed_count} jobs.")
-                sorted_buffer = sorted_buffer[Testdriver.result_parquet_chunksize:]
-
-            if processed_count % Testdriver.backup_threshold == 0:
-                self.backup(f"backup_{processed_count // Testdriver.backup_threshold}.zip")
-
-        if len(sorted_buffer) > 0:
-            self.write_parquet(sorted_buffer, processed_count // Testdriver.result_parquet_chunksize, logger)
-            logger.log(logging.INFO, 0,
-                       f"Final Flush of Parquet Table to disk.")
-
+                    f.writelines(f"{job_num}\n" for job_num in batch.failed)
+            if batch.results.num_rows > 0:
+                self.spool.append_batch(batch.results)    # on disk right away, folded into parquet in the background
+
+            self.controller.observe(batch.jobs, batch.seconds)
+            knobs = (self.controller.in_flight, self.controller.flush_rows)
+            if self.controller.adjust(self.job_queue.qsize() * Testdriver.job_batch_size):
+                self.spool.segment_rows = self.controller.flush_rows
+                if knobs != (self.controller.in_flight, self.controller.flush_rows):
+                    logger.log(logging.DEBUG, processed_count, f"Load adjusted: {self.controller.report()}")
+
+            if self.controller.should_load(self.jobs_loaded - processed_count):
+                with Tracer.span("load_jobs", "testdriver"):
+                    self.load_next_job_batch(logger, self.controller.load_size)
+
+            if processed_count // Testdriver.backup_threshold > backups:
+                backups = processed_count // Testdriver.backup_threshold
+                with Tracer.span("backup", "testdriver"):
+                    self.backup(f"backup_{backups}.zip")
+
+        # every spool segment is sorted by id, but segments overlap, so a postprocessing step is still required
+        with Tracer.span("write_parquet", "testdriver"):
+            self.spool.close()
+        logger.log(logging.INFO, 0,
+                   f"Final Flush of Parquet Table to disk.")
+
+        for _ in threads:
+            self.job_queue.put(None)
         for t in threads:
             t.join()
 
+        if self.censoring is not None:
+            logger.log(logging.INFO, processed_count, self.censoring.report())
+
         if failed_jobs == 0:
             logger.log(logging.INFO, processed_count,
                        f"All jobs finished gracefully.")
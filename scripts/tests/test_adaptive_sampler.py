@@ -0,0 +1,75 @@
+import logging
+import math
+import tempfile
+import unittest
+from pathlib import Path
+
+import pyarrow.parquet as pq
+from adaptive_sampler import AdaptiveSampler
+from minizinc_wrapper import MinizincWrapper
+from schemas import Constants
+from synthetic import ModelSpec, SyntheticWorkload
+
+
+class TestAdaptiveSampler(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        temp = Path(self.temp_dir.name)
+        self.sampler = AdaptiveSampler(feature_vector_parquet=Path("test_data/feature_vector.parquet").resolve(),
+                                       instances_parquet_output=temp / "instances",
+                                       output_folder=temp / "results",
+                                       log_path=temp / "logs",
+                                       max_perms=100, min_samples=5, target_width=0.1)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_relative_ci_width(self):
+        z = AdaptiveSampler.z_scores[0.95]
+        self.assertEqual(math.inf, AdaptiveSampler.relative_ci_width([1.0], z))
+        self.assertEqual(0.0, AdaptiveSampler.relative_ci_width([3, 3, 3], z))
+        self.assertEqual(math.inf, AdaptiveSampler.relative_ci_width([-1, 1], z))
+        # mean 2, sample variance 2, n 2 -> 2 * 1.96 * 1 / 2
+        self.assertAlmostEqual(1.96, AdaptiveSampler.relative_ci_width([1, 3], z))
+
+    def test_is_converged(self):
+        def results(failures, solve_times):
+            return [{Constants.FAILURES: f, Constants.SOLVE_TIME: t} for f, t in zip(failures, solve_times)]
+
+        # too few samples
+        self.assertFalse(self.sampler.is_converged(results([10] * 4, [1.0] * 4)))
+        # stable statistics
+        self.assertTrue(self.sampler.is_converged(results([100, 101, 99, 100, 100, 101], [1.0] * 6)))
+        # failures are stable but solve times are not
+        self.assertFalse(self.sampler.is_converged(results([100] * 6, [0.1, 5.0, 0.2, 9.0, 0.1, 3.0])))
+
+    def test_rerun_continues(self):
+        temp = Path(self.temp_dir.name)
+        workload = SyntheticWorkload(temp / "workload", [ModelSpec(4), ModelSpec(5)], instances_per_model=1, seed=0)
+        workload.run()
+        backend = MinizincWrapper.backend
+        MinizincWrapper.use_backend("stub")
+
+        def run(seed: int, max_perms: int, **options) -> list[dict]:
+            AdaptiveSampler(workload.feature_vector_file, temp / "instances", temp / "results", temp / "logs",
+                            max_perms=max_perms, round_size=5, seed=seed, **options).run()
+            return pq.read_table(temp / "instances").to_pylist()
+
+        try:
+            self.assertEqual(20, len(run(0, 10)))
+            # the second run draws only new orderings up to the larger budget and continues the ids
+            instances = run(1, 20)
+            self.assertEqual(list(range(40)), sorted(i[Constants.ID] for i in instances))
+            pairs = [(i[Constants.MODEL_NAME], i[Constants.PERMUTATION_ID]) for i in instances]
+            self.assertEqual(len(pairs), len(set(pairs)))
+            # models that converged on the earlier results get no new samples
+            self.assertEqual(40, len(run(2, 24, min_samples=5, target_width=1e9)))
+        finally:
+            MinizincWrapper.backend = backend
+            MinizincWrapper.version.cache_clear()
+            logging.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import json
+import multiprocessing
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+import pyarrow.parquet as pq
+from benchmark import Benchmark
+from schemas import Constants, Schemas
+
+
+class TestBenchmark(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.output_folder = Path(self.temp_dir.name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_measure(self):
+        calls = []
+        seconds, number = Benchmark.measure(lambda: calls.append(1), repeat=3, min_round_time=0.001)
+        self.assertGreater(seconds, 0)
+        self.assertEqual(number * 3, len(calls) - (number - 1))  # calibration ran 1 + 2 + ... + number / 2 calls before
+
+    def test_unknown_case(self):
+        with self.assertRaises(ValueError):
+            Benchmark(self.output_folder, cases=["nope"])
+
+    @patch.object(Benchmark, 'min_round_time', 0.001)
+    @patch.object(Benchmark, 'repeat', 1)
+    def test_history_and_baseline(self):
+        cases = ["extract_variables", "substitute_variables"]
+        rows = Benchmark(self.output_folder, sizes=[5], cases=cases, save_baseline=True).run()
+        self.assertEqual(cases, [r[Constants.BENCHMARK_CASE] for r in rows])
+
+        baseline = json.loads((self.output_folder / "baseline.json").read_text())
+        self.assertEqual({"extract_variables[5]", "substitute_variables[5]"}, set(baseline))
+
+        # a baseline that is far too fast turns every case into a regression
+        (self.output_folder / "baseline.json").write_text(json.dumps({k: 1e-12 for k in baseline}))
+        benchmark = Benchmark(self.output_folder, sizes=[5], cases=cases)
+        benchmark.run()
+        self.assertEqual(2, len(benchmark.regressions))
+
+        history = pq.ParquetDataset(self.output_folder / "history", schema=Schemas.Parquet.benchmark_results).read()
+        self.assertEqual(4, history.num_rows)
+
+    def test_generate_permutations_joins_workers(self):
+        calls = Benchmark(self.output_folder, sizes=[6]).generate_permutations_case(6, self.output_folder / "work")
+        start, join = multiprocessing.Process.start, multiprocessing.Process.join
+        with patch.object(multiprocessing.Process, 'start', autospec=True, side_effect=start) as started, \
+                patch.object(multiprocessing.Process, 'join', autospec=True, side_effect=join) as joined:
+            for _ in range(3):
+                calls()
+        self.assertGreater(started.call_count, 0)
+        self.assertEqual(started.call_count, joined.call_count)
+        self.assertEqual([], multiprocessing.active_children())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import random
+import tempfile
+import unittest
+from pathlib import Path
+
+import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
+from catalog import WorkloadCatalog
+from schemas import Constants, Schemas
+from synthetic import ModelSpec, SyntheticModel, SyntheticWorkload
+
+
+class TestWorkloadCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.workload = SyntheticWorkload(Path(self.temp_dir.name) / "workload", [ModelSpec(4), ModelSpec(5)],
+                                          instances_per_model=10, seed=0)
+        self.workload.run()
+        self.results_folder = Path(self.temp_dir.name) / "results"
+        os.makedirs(self.results_folder)
+        self.catalog_file = Path(self.temp_dir.name) / "catalog.duckdb"
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def catalog(self) -> WorkloadCatalog:
+        return WorkloadCatalog(duckdb.connect(str(self.catalog_file)), self.workload.instances_folder, self.results_folder)
+
+    def write_results(self, name: str, ids: list[int]):
+        jobs = pq.read_table(self.workload.instances_folder).to_pylist()
+        rng = random.Random(0)
+        results = SyntheticModel.results([job for job in jobs if job[Constants.ID] in ids], rng)
+        pq.write_table(pa.Table.from_pylist(results, schema=Schemas.Parquet.instance_results), self.results_folder / name)
+
+    def test_refresh(self):
+        catalog = self.catalog()
+        self.assertEqual((2, 0), catalog.refresh())
+        self.assertEqual((0, 19), catalog.id_range())
+        self.assertEqual([10, 10], [jobs for _, _, _, jobs in catalog.models()])
+        self.assertEqual(20, sum(catalog.remaining_jobs().values()))
+
+        self.write_results("part_0.parquet", list(range(0, 4)))
+        self.assertEqual((0, 1), catalog.refresh())
+        self.assertEqual((0, 0), catalog.refresh())
+        remaining = catalog.remaining_jobs()
+        first, second = [name for name, _, _, _ in catalog.models()]
+        self.assertEqual({first: 6, second: 10}, remaining)
+
+        # the catalog survives the connection
+        catalog.con.close()
+        catalog = self.catalog()
+        self.assertEqual((0, 0), catalog.refresh())
+        self.assertEqual(remaining, catalog.remaining_jobs())
+
+        # removed results are rebuilt from the files left
+        self.write_results("part_1.parquet", list(range(10, 12)))
+        catalog.refresh()
+        os.remove(self.results_folder / "part_0.parquet")
+        self.assertEqual((0, 1), catalog.refresh())
+        self.assertEqual({first: 10, second: 8}, catalog.remaining_jobs())
+        catalog.con.close()
+
+    def test_non_contiguous_model(self):
+        instances = pq.read_table(self.workload.instances_folder).sort_by(Constants.ID).to_pylist()
+        first, second = instances[0][Constants.MODEL_NAME], instances[10][Constants.MODEL_NAME]
+        # appended instances of the first model get ids after those of the second
+        appended = [row | {Constants.ID: row[Constants.ID] + 20} for row in instances[:10]]
+        pq.write_to_dataset(pa.Table.from_pylist(appended, schema=Schemas.Parquet.instances),
+                            root_path=self.workload.instances_folder, partition_cols=[Constants.MODEL_NAME])
+        self.write_results("part_0.parquet", list(range(10, 20)))
+        catalog = self.catalog()
+        catalog.refresh()
+        self.assertEqual({first: 20, second: 0}, catalog.remaining_jobs())
+        catalog.con.close()
+
+    def test_source(self):
+        catalog = self.catalog()
+        catalog.refresh()
+        self.assertIsNone(catalog.source(20, 30))
+        ids = [row[0] for row in catalog.con.execute(f"SELECT {Constants.ID} FROM {catalog.source(8, 12)}").fetchall()]
+        self.assertEqual(list(range(20)), sorted(ids))
+        source = catalog.source(0, 5)
+        self.assertEqual(10, catalog.con.execute(f"SELECT COUNT(*) FROM {source}").fetchone()[0])
+        catalog.con.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
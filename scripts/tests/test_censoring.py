@@ -0,0 +1,71 @@
+import random
+import unittest
+
+from censoring import CensoringPolicy
+from schemas import Constants
+
+
+class TestCensoringPolicy(unittest.TestCase):
+
+    @staticmethod
+    def statistics(failures: int, solutions: int = 1) -> dict:
+        return {Constants.FAILURES: failures, Constants.NODES: 2 * failures + 1, Constants.SOLUTIONS: solutions}
+
+    def test_no_limit_while_warming_up(self):
+        policy = CensoringPolicy(multiple=10, warmup=5, min_limit=0)
+        for failures in [100, 200, 300, 400]:
+            self.assertIsNone(policy.limit("m"))
+            policy.observe("m", failures)
+        policy.observe("m", 500)
+        self.assertEqual(3000, policy.limit("m"))
+        self.assertIsNone(policy.limit("other"))
+        self.assertEqual(" --fail 3000", policy.solver_flag(3000))
+        self.assertEqual("", policy.solver_flag(None))
+
+    def test_min_limit(self):
+        policy = CensoringPolicy(multiple=10, warmup=1, min_limit=1000)
+        policy.observe("m", 3)
+        self.assertEqual(1000, policy.limit("m"))
+
+    def test_record(self):
+        policy = CensoringPolicy(multiple=10, warmup=1, min_limit=0)
+        row = policy.record("m", self.statistics(50), None)
+        self.assertEqual({Constants.CENSORED: False, Constants.FAIL_LIMIT: None, Constants.NODE_LIMIT: None}, row)
+
+        row = policy.record("m", self.statistics(500, solutions=0), 500)
+        self.assertEqual({Constants.CENSORED: True, Constants.FAIL_LIMIT: 500, Constants.NODE_LIMIT: None}, row)
+        self.assertFalse(policy.record("m", self.statistics(499, solutions=0), 500)[Constants.CENSORED])  # unsatisfiable
+        self.assertEqual(1, policy.censored)
+        self.assertEqual([50, 499, 500], policy.reservoirs["m"])
+
+        # an optimisation run at the limit found solutions but did not finish, its value is only a lower bound
+        row = policy.record("opt", self.statistics(500, solutions=3), 500, optimisation=True)
+        self.assertTrue(row[Constants.CENSORED])
+        self.assertFalse(policy.record("opt", self.statistics(499, solutions=3), 500, optimisation=True)[Constants.CENSORED])
+        self.assertFalse(policy.record("m", self.statistics(500, solutions=1), 500)[Constants.CENSORED])
+        self.assertEqual(2, policy.censored)
+
+        node_policy = CensoringPolicy(limit_type="node", warmup=1)
+        row = node_policy.record("m", self.statistics(10, solutions=0), 21)
+        self.assertEqual({Constants.CENSORED: True, Constants.FAIL_LIMIT: None, Constants.NODE_LIMIT: 21}, row)
+
+    def test_reservoir_is_bounded(self):
+        policy = CensoringPolicy(quantile=0.9, warmup=1, seed=0)
+        rng = random.Random(0)
+        for _ in range(10 * CensoringPolicy.reservoir_size):
+            policy.observe("m", rng.randrange(1000))
+        self.assertEqual(CensoringPolicy.reservoir_size, len(policy.reservoirs["m"]))
+        self.assertEqual(sorted(policy.reservoirs["m"]), policy.reservoirs["m"])
+        self.assertAlmostEqual(900, policy.running_quantile("m"), delta=50)
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            CensoringPolicy(limit_type="time")
+        with self.assertRaises(ValueError):
+            CensoringPolicy(quantile=1.0)
+        with self.assertRaises(ValueError):
+            CensoringPolicy(multiple=1.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
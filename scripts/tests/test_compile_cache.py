@@ -0,0 +1,36 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from compile_cache import CompileCache
+
+
+class TestCompileCache(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = CompileCache(Path(self.temp_dir.name) / "cache")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_key(self):
+        key = CompileCache.key(" --solver cp", "2.8.5", "solve satisfy;")
+        self.assertEqual(key, CompileCache.key(" --solver cp", "2.8.5", "solve satisfy;"))
+        self.assertNotEqual(key, CompileCache.key(" --solver gecode", "2.8.5", "solve satisfy;"))
+        self.assertNotEqual(key, CompileCache.key(" --solver cp", "2.8.6", "solve satisfy;"))
+        self.assertNotEqual(key, CompileCache.key(" --solver cp", "2.8.5", "solve satisfy;", "n = 3;"))
+        # parts can not shift into each other
+        self.assertNotEqual(CompileCache.key("a", "b", "cd"), CompileCache.key("a", "bc", "d"))
+
+    def test_get_put(self):
+        key = CompileCache.key(" --solver cp", "2.8.5", "solve satisfy;")
+        self.assertIsNone(self.cache.get(key))
+
+        self.cache.put(key, ['{"type": "feature_vector"}', ''], "solve satisfy;\n")
+        self.assertEqual((['{"type": "feature_vector"}', ''], "solve satisfy;\n"), self.cache.get(key))
+        self.assertEqual((1, 1), (self.cache.hits, self.cache.misses))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import math
+import random
+import tempfile
+import unittest
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from cost_model import CostModel
+from schemas import Constants, Schemas
+from synthetic import ModelSpec, SyntheticModel
+
+
+class TestCostModel(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.feature_vectors = Path(self.temp_dir.name) / "feature_vectors.parquet"
+        self.results = Path(self.temp_dir.name) / "results"
+        self.sizes = [4, 6, 8, 12, 16, 24, 32, 48]
+
+        rng = random.Random(0)
+        models = [SyntheticModel(ModelSpec(size)) for size in self.sizes]
+        pq.write_table(pa.Table.from_pylist([m.feature_vector(f"{i:03}") for i, m in enumerate(models)],
+                                            schema=Schemas.Parquet.feature_vector), self.feature_vectors)
+        rows = []
+        for model in models:
+            for row in SyntheticModel.results(model.instances(20, rng, first_id=len(rows)), rng):
+                # cost grows with the model size, failures quadratically
+                row[Constants.FAILURES] = len(model.variables) ** 2
+                row[Constants.INIT_TIME], row[Constants.SOLVE_TIME] = 0.0, 0.001 * len(model.variables)
+                rows.append(row)
+        pq.write_to_dataset(pa.Table.from_pylist(rows, schema=Schemas.Parquet.instance_results), root_path=self.results,
+                            partition_cols=[Constants.MODEL_NAME])
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_train_and_predict(self):
+        cost_model = CostModel.train(self.feature_vectors, self.results, alpha=0.01)
+        self.assertEqual(len(self.sizes), cost_model.trained_models)
+        self.assertIn("int_lin_le", cost_model.vocabulary)
+
+        # an unseen model between the training sizes
+        prediction = cost_model.predict(SyntheticModel(ModelSpec(20)).feature_vector())
+        self.assertAlmostEqual(math.log(0.02), math.log(prediction["seconds"]), delta=0.5)
+        self.assertAlmostEqual(math.log(400), math.log1p(prediction[Constants.FAILURES]), delta=0.5)
+
+    def test_save_and_load(self):
+        cost_model = CostModel.train(self.feature_vectors, self.results)
+        path = Path(self.temp_dir.name) / "cost_model.json"
+        cost_model.save(path)
+        vector = SyntheticModel(ModelSpec(10)).feature_vector()
+        self.assertEqual(cost_model.predict(vector), CostModel.load(path).predict(vector))
+
+    def test_censored_results_are_left_out(self):
+        table = pq.read_table(self.results).to_pylist()
+        model = table[0][Constants.MODEL_NAME]
+        censored = [row | {Constants.ID: 10_000 + i, Constants.FAILURES: 10 ** 9, Constants.CENSORED: True,
+                           Constants.FAIL_LIMIT: 10 ** 9, Constants.NODE_LIMIT: None}
+                    for i, row in enumerate(table) if row[Constants.MODEL_NAME] == model]
+        schema = pa.schema(list(Schemas.Parquet.instance_results) + Schemas.Parquet.censoring_fields)
+        pq.write_to_dataset(pa.Table.from_pylist(censored, schema=schema), root_path=self.results,
+                            partition_cols=[Constants.MODEL_NAME], basename_template="censored_{i}.parquet")
+        aggregates = CostModel.aggregate_results(self.results)
+        self.assertEqual(20, aggregates[model]["jobs"])
+
+    def test_needs_two_models(self):
+        pq.write_table(pq.read_table(self.feature_vectors).slice(0, 1), self.feature_vectors)
+        with self.assertRaises(ValueError):
+            CostModel.train(self.feature_vectors, self.results)
+
+
+if __name__ == '__main__':
+    unittest.main()
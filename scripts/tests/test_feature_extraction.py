@@ -1,10 +1,12 @@
+import shutil
+import tempfile
 import unittest
 from pathlib import Path
 from feature_extraction import FeatureVectorExtractor
 import pyarrow.compute as pc
 import pyarrow.parquet as pa
 from unittest.mock import patch
-from schemas import Schemas, Constants
+from schemas import Schemas, Constants, Helpers
 
 
 class TestFeatureVectorExtractorWithRealFiles(unittest.TestCase):
@@ -51,10 +53,115 @@ class TestFeatureVectorExtractorWithRealFiles(unittest.TestCase):
 
         print(table.schema)
 
+    def test_resume_skips_existing_models(self):
+        with open("test_data/sample_feature_vector.json", 'r') as f:
+            feature_vector_json = f.read()
+
+        def fake_worker(tempfolder, problem_id, mzn_fqn, *args):
+            data = Helpers.json_to_normalized_feature_vector_dict(feature_vector_json)
+            data[Constants.PROBLEM_ID] = problem_id
+            data[Constants.MODEL_NAME] = mzn_fqn.name
+            data[Constants.FLAT_ZINC] = ""
+            data[Constants.MINI_ZINC] = ""
+            return data
+
+        with patch.object(FeatureVectorExtractor, 'worker', side_effect=fake_worker):
+            FeatureVectorExtractor(self.input_files[:2], self.parquet_file).run()
+
+        with patch.object(FeatureVectorExtractor, 'worker', side_effect=fake_worker) as worker:
+            FeatureVectorExtractor(self.input_files, self.parquet_file, resume=True).run()
+            self.assertEqual(2, worker.call_count)
+
+        table = pa.read_table(schema=Schemas.Parquet.feature_vector, source=self.parquet_file)
+        self.assertEqual(sorted(f.name for _, f in self.input_files), sorted(table[Constants.MODEL_NAME].to_pylist()))
+
+    def fake_worker(self):
+        with open("test_data/sample_feature_vector.json", 'r') as f:
+            feature_vector_json = f.read()
+
+        def worker(tempfolder, problem_id, mzn_fqn, dzn_fqn=None, backend=None, *args):
+            data = Helpers.json_to_normalized_feature_vector_dict(feature_vector_json)
+            data[Constants.PROBLEM_ID] = problem_id
+            data[Constants.MODEL_NAME] = mzn_fqn.name
+            data[Constants.FLAT_ZINC] = ""
+            data[Constants.MINI_ZINC] = ""
+            if backend is not None:
+                data[Constants.BACKEND] = backend
+            return data
+        return worker
+
+    def test_backend_fan_out(self):
+        with patch.object(FeatureVectorExtractor, 'worker', side_effect=self.fake_worker()) as worker:
+            FeatureVectorExtractor(self.input_files[:2], self.parquet_file, backends=["cp", "gecode"]).run()
+            self.assertEqual(4, worker.call_count)
+        table = pa.read_table(self.parquet_file)
+        self.assertEqual(Schemas.Parquet.feature_vector.append(Schemas.Parquet.backend_field).names, table.schema.names)
+        rows = sorted(zip(table[Constants.MODEL_NAME].to_pylist(), table[Constants.BACKEND].to_pylist()))
+        self.assertEqual(sorted((f.name, backend) for _, f in self.input_files[:2] for backend in ["cp", "gecode"]), rows)
+
+        # resume tracks model and backend pairs, a new backend is extracted for every model
+        with patch.object(FeatureVectorExtractor, 'worker', side_effect=self.fake_worker()) as worker:
+            FeatureVectorExtractor(self.input_files[:2], self.parquet_file, backends=["cp", "gecode", "api"], resume=True).run()
+            self.assertEqual(2, worker.call_count)
+            self.assertEqual({"api"}, {call.args[4] for call in worker.call_args_list})
+        self.assertEqual(6, pa.read_metadata(self.parquet_file).num_rows)
+
+    @patch.object(FeatureVectorExtractor, 'num_workers', new=1)
+    @patch.object(FeatureVectorExtractor, 'row_group_size', new=1)
+    def test_resume_after_kill(self):
+        worker = self.fake_worker()
+        calls = []
+
+        def killed_worker(tempfolder, problem_id, mzn_fqn, *args):
+            calls.append(mzn_fqn.name)
+            if len(calls) == 3:
+                raise KeyboardInterrupt()   # stands in for a kill, the run neither merges nor cleans up
+            return worker(tempfolder, problem_id, mzn_fqn, *args)
+
+        with patch.object(FeatureVectorExtractor, 'worker', side_effect=killed_worker):
+            with self.assertRaises(KeyboardInterrupt):
+                FeatureVectorExtractor(self.input_files, self.parquet_file).run()
+        self.assertFalse(self.parquet_file.exists())
+
+        with patch.object(FeatureVectorExtractor, 'worker', side_effect=worker) as resumed:
+            FeatureVectorExtractor(self.input_files, self.parquet_file, resume=True).run()
+            self.assertEqual(2, resumed.call_count)
+        table = pa.read_table(schema=Schemas.Parquet.feature_vector, source=self.parquet_file)
+        self.assertEqual(sorted(f.name for _, f in self.input_files), sorted(table[Constants.MODEL_NAME].to_pylist()))
+        self.assertFalse(self.parquet_file.with_name(self.parquet_file.name + ".parts").exists())
+
+    def test_resume_keys_on_problem(self):
+        # the same file name in two problems are two models
+        input_files = [("000", self.input_files[0][1]), ("001", self.input_files[0][1])]
+        with patch.object(FeatureVectorExtractor, 'worker', side_effect=self.fake_worker()):
+            FeatureVectorExtractor(input_files[:1], self.parquet_file).run()
+        with patch.object(FeatureVectorExtractor, 'worker', side_effect=self.fake_worker()) as worker:
+            FeatureVectorExtractor(input_files, self.parquet_file, resume=True).run()
+            self.assertEqual(1, worker.call_count)
+        table = pa.read_table(schema=Schemas.Parquet.feature_vector, source=self.parquet_file)
+        self.assertEqual(["000", "001"], sorted(table[Constants.PROBLEM_ID].to_pylist()))
+
+    def test_input_matrix_helper(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            root = Path(temp_dir)
+            for problem, models, data_files in [("prob001", ["a", "b"], ["d1", "d2"]), ("prob002", ["c"], [])]:
+                (root / problem / "models").mkdir(parents=True)
+                (root / problem / "data").mkdir()
+                for model in models:
+                    (root / problem / "models" / f"{model}.mzn").write_text("")
+                for data_file in data_files:
+                    (root / problem / "data" / f"{data_file}.dzn").write_text("")
+
+            matrix = FeatureVectorExtractor.input_matrix_helper(root)
+            names = sorted((problem_id, FeatureVectorExtractor.instance_name(mzn, dzn)) for problem_id, mzn, dzn in matrix)
+            self.assertEqual([("001", "a.mzn_d1.dzn"), ("001", "a.mzn_d2.dzn"), ("001", "b.mzn_d1.dzn"),
+                              ("001", "b.mzn_d2.dzn"), ("002", "c.mzn")], names)
+
     def tearDown(self):
         if self.parquet_file.exists():
             self.parquet_file.unlink()
             pass
+        shutil.rmtree(self.parquet_file.with_name(self.parquet_file.name + ".parts"), ignore_errors=True)
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
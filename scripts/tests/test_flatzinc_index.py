@@ -0,0 +1,61 @@
+import unittest
+
+from flatzinc_index import FlatZincIndex
+from instance_generator import FlatZincInstanceGenerator
+
+
+class TestFlatZincIndex(unittest.TestCase):
+
+    fzn = ('array [1..2] of int: X_INTRODUCED_5_ = [1,-1];\n'
+           'var 0..9: X_INTRODUCED_1_;\n'
+           'var 0..9: X_INTRODUCED_2_;\n'
+           'array [1..2] of var int: marks:: output_array([1..2]) = [X_INTRODUCED_2_,X_INTRODUCED_1_];\n'
+           'array [1..2] of var int: mark:: output_array([1..2]) = [X_INTRODUCED_1_,\n X_INTRODUCED_2_];\n'
+           'constraint int_lin_le(X_INTRODUCED_5_,[X_INTRODUCED_1_,X_INTRODUCED_2_],-1);\n'
+           'solve :: int_search(mark,first_fail,indomain_min,complete) satisfy;\n')
+
+    def test_index(self):
+        index = FlatZincIndex(self.fzn)
+        self.assertEqual({"X_INTRODUCED_5_", "marks", "mark"}, set(index.arrays))
+        self.assertEqual("mark", index.search_array_name())
+        self.assertEqual("first_fail", self.fzn[index.search_strategy[0]:index.search_strategy[1]])
+        self.assertEqual(1, index.int_search_count)
+        self.assertEqual(["X_INTRODUCED_1_", "X_INTRODUCED_2_"], index.variables())
+
+    def test_string_literals_do_not_split_items(self):
+        fzn = 'var 1..2: x:: output_var:: mzn_path("a;b");\nsolve :: int_search([x],input_order,indomain_min) satisfy;'
+        index = FlatZincIndex(fzn)
+        self.assertEqual(["x"], index.variables())
+
+    def test_substitution_keeps_layout(self):
+        substituted = FlatZincInstanceGenerator.substitute_variables(self.fzn, ["X_INTRODUCED_2_", "X_INTRODUCED_1_"])
+        self.assertIn("mark:: output_array([1..2]) = [X_INTRODUCED_2_,X_INTRODUCED_1_];\n", substituted)
+        self.assertIn("marks:: output_array([1..2]) = [X_INTRODUCED_2_,X_INTRODUCED_1_];\n", substituted)
+        # everything outside of the substituted array is untouched
+        self.assertTrue(substituted.startswith(self.fzn[:self.fzn.index("mark::")]))
+        self.assertTrue(substituted.endswith(self.fzn[self.fzn.index("\nconstraint"):]))
+
+        input_order = FlatZincInstanceGenerator.ensure_input_order_annotation(substituted)
+        self.assertIn("solve :: int_search(mark,input_order,indomain_min,complete) satisfy;", input_order)
+        self.assertEqual(["X_INTRODUCED_2_", "X_INTRODUCED_1_"], FlatZincInstanceGenerator.extract_variables(input_order))
+
+    def test_substitution_with_strategy(self):
+        variables = ["X_INTRODUCED_2_", "X_INTRODUCED_1_"]
+        substituted = FlatZincInstanceGenerator.substitute_variables(self.fzn, variables, "dom_w_deg")
+        expected = FlatZincInstanceGenerator.substitute_variables(self.fzn, variables).replace("first_fail", "dom_w_deg")
+        self.assertEqual(expected, substituted)
+
+        anonymous = 'var 1..2: x;\nvar 1..2: y;\nsolve :: int_search([x,y],input_order,indomain_min) satisfy;'
+        self.assertEqual('var 1..2: x;\nvar 1..2: y;\nsolve :: int_search([y,x],first_fail,indomain_min) satisfy;',
+                         FlatZincInstanceGenerator.substitute_variables(anonymous, ["y", "x"], "first_fail"))
+
+    def test_no_search_annotation(self):
+        fzn = 'var 1..2: x;\nsolve satisfy;'
+        self.assertEqual([], FlatZincInstanceGenerator.extract_variables(fzn))
+        self.assertEqual(fzn, FlatZincInstanceGenerator.ensure_input_order_annotation(fzn))
+        with self.assertRaises(Exception):
+            FlatZincInstanceGenerator.substitute_variables(fzn, ["x"])
+
+
+if __name__ == '__main__':
+    unittest.main()
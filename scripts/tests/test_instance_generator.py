@@ -4,10 +4,14 @@ import unittest
 import tempfile
 import random
 from pathlib import Path
+from unittest.mock import patch
 
+import pyarrow as pa
 import pyarrow.parquet as pq
 from instance_generator import FlatZincInstanceGenerator
+from minizinc_wrapper import MinizincWrapper
 from schemas import Schemas, Constants
+from synthetic import ModelSpec, SyntheticWorkload
 
 
 class TestFlatZincInstanceGenerator(unittest.TestCase):
@@ -101,6 +105,19 @@ class TestFlatZincInstanceGenerator(unittest.TestCase):
                 self.assertEqual(len(actual_vars), max_vars)
                 self.assertEqual(variables, actual_vars[0][1])
 
+    def test_permutation_ranks_match_generation(self):
+        variables = [str(i) for i in range(6)]
+        for max_perms, cutoff in [(10, False), (10, True), (7, False), (math.factorial(6), False)]:
+            with self.subTest(max_perms=max_perms, cutoff=cutoff):
+                self.generator.max_permutations = max_perms
+                self.generator.cutoff_excess_vars = cutoff
+                generated = self.generator.generate_permutations(variables)
+                ranks = self.generator.permutation_ranks(len(variables))
+                self.assertEqual([str(r) for r in ranks], [perm_id for perm_id, _ in generated])
+
+                listed = self.generator.generate_permutations_for_ranks(variables, list(ranks))
+                self.assertEqual(generated, listed)
+
     def test_search_annoation_substitution(self):
         test_cases = [
             ("""constraint int_lin_eq([1,-1,-1],[X_INTRODUCED_21_,X_INTRODUCED_20_,X_INTRODUCED_32_],0):: defines_var(X_INTRODUCED_32_);solve :: int_search(mark,first_fail,indomain,complete) minimize X_INTRODUCED_21_;""",
@@ -147,5 +164,112 @@ class TestFlatZincInstanceGenerator(unittest.TestCase):
         expected_row_count = self.generator.max_permutations
         self.assertEqual(table.num_rows, expected_row_count, "Expected Permutation count differs")
 
+
+class TestFlatZincInstanceGeneratorSynthetic(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.workload = SyntheticWorkload(Path(self.temp_dir.name) / "workload", [ModelSpec(4), ModelSpec(5)], instances_per_model=1, seed=0)
+        self.workload.run()
+        self.output_path = Path(self.temp_dir.name) / "instances"
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_rejects_backend_tagged_vectors(self):
+        vectors = pq.read_table(self.workload.feature_vector_file)
+        tagged = pa.concat_tables([vectors.append_column(Schemas.Parquet.backend_field, pa.array([backend] * vectors.num_rows))
+                                   for backend in ["cp", "gecode"]])
+        tagged_file = Path(self.temp_dir.name) / "tagged.parquet"
+        pq.write_table(tagged, tagged_file)
+        with self.assertRaises(ValueError):
+            FlatZincInstanceGenerator(tagged_file, self.output_path, max_perms=10)
+        FlatZincInstanceGenerator(self.workload.feature_vector_file, self.output_path, max_perms=10)
+
+    def test_append(self):
+        backend = MinizincWrapper.backend
+        MinizincWrapper.use_backend("stub")    # probing checks the models with MiniZinc
+
+        def run(max_perms: int) -> list[dict]:
+            FlatZincInstanceGenerator(self.workload.feature_vector_file, self.output_path, max_perms, cutoff_excess=True, append=True).run()
+            return pq.read_table(self.output_path, schema=Schemas.Parquet.instances).to_pylist()
+
+        try:
+            first = run(6)
+            self.assertEqual(list(range(12)), sorted(row[Constants.ID] for row in first))
+
+            # a rerun with more permutations adds only the missing ones and continues the ids
+            second = run(12)
+            self.assertEqual(list(range(24)), sorted(row[Constants.ID] for row in second))
+            for model, step in [("synthetic_4.mzn", 2), ("synthetic_5.mzn", 10)]:
+                ranks = sorted(int(row[Constants.PERMUTATION_ID]) for row in second if row[Constants.MODEL_NAME] == model)
+                self.assertEqual(list(range(0, 12 * step, step)), ranks)
+            old = {(row[Constants.MODEL_NAME], row[Constants.PERMUTATION_ID]): row[Constants.ID] for row in first}
+            self.assertTrue(all(old.get((row[Constants.MODEL_NAME], row[Constants.PERMUTATION_ID]), row[Constants.ID]) == row[Constants.ID]
+                                for row in second))
+            self.assertTrue(all(row[Constants.ID] >= 12 for row in second if (row[Constants.MODEL_NAME], row[Constants.PERMUTATION_ID]) not in old))
+
+            # nothing is missing any more
+            self.assertEqual(24, len(run(12)))
+        finally:
+            MinizincWrapper.backend = backend
+            MinizincWrapper.version.cache_clear()
+
+    def test_substitute_strategy_requires_annotation(self):
+        fzn = "var 1..3: x;\nvar 1..3: y;\nsolve :: int_search([x,y], :: ann) satisfy;"
+        self.assertIn("int_search([y,x],", FlatZincInstanceGenerator.substitute_variables(fzn, ["y", "x"]))
+        # the row would be labelled with a strategy the solver never ran
+        with self.assertRaises(Exception):
+            FlatZincInstanceGenerator.substitute_variables(fzn, ["y", "x"], "first_fail")
+
+
+    def test_probe_cache(self):
+        backend = MinizincWrapper.backend
+        MinizincWrapper.use_backend("stub")
+        generator = FlatZincInstanceGenerator(self.workload.feature_vector_file, self.output_path, max_perms=10)
+
+        try:
+            with patch.object(FlatZincInstanceGenerator, 'probe_model', wraps=FlatZincInstanceGenerator.probe_model) as probe_model:
+                generator.probe()
+                self.assertEqual(2, probe_model.call_count)
+                self.assertTrue(generator.probe_cache_file.exists())
+
+            # unchanged models are not validated again
+            with patch.object(FlatZincInstanceGenerator, 'probe_model', wraps=FlatZincInstanceGenerator.probe_model) as probe_model:
+                generator.probe()
+                self.assertEqual(0, probe_model.call_count)
+
+            # a changed model is
+            rows = pq.read_table(self.workload.feature_vector_file).to_pylist()
+            rows[0][Constants.FLAT_ZINC] = rows[0][Constants.FLAT_ZINC].replace("solve", "var 1..3: X_CHANGED_;\nsolve", 1)
+            with patch.object(FlatZincInstanceGenerator, 'probe_model', wraps=FlatZincInstanceGenerator.probe_model) as probe_model:
+                generator.probe(rows)
+                self.assertEqual([rows[0][Constants.MODEL_NAME]], [call.args[0] for call in probe_model.call_args_list])
+        finally:
+            MinizincWrapper.backend = backend
+            MinizincWrapper.version.cache_clear()
+
+    def test_sample_permutation_ranks(self):
+        rng = random.Random(42)
+        perm_count = math.factorial(12)
+
+        for strategy in ["uniform", "stratified"]:
+            with self.subTest(strategy=strategy):
+                ranks = FlatZincInstanceGenerator.sample_permutation_ranks(perm_count, 100, rng, strategy)
+                self.assertEqual(len(set(ranks)), 100)
+                self.assertTrue(all(0 <= r < perm_count for r in ranks))
+
+        # stratified draws exactly one rank per stratum
+        ranks = FlatZincInstanceGenerator.sample_permutation_ranks(perm_count, 10, rng, "stratified")
+        self.assertEqual([r // (perm_count // 10) for r in ranks], list(range(10)))
+        # spaces beyond the float range
+        perm_count = math.factorial(200)
+        ranks = FlatZincInstanceGenerator.sample_permutation_ranks(perm_count, 10, rng, "stratified")
+        self.assertEqual([r * 10 // perm_count for r in ranks], list(range(10)))
+
+        # excluded ranks are never drawn again and an exhausted space returns the remainder
+        ranks = FlatZincInstanceGenerator.sample_permutation_ranks(24, 50, rng, "uniform", set(range(20)))
+        self.assertEqual(ranks, [20, 21, 22, 23])
+
 if __name__ == '__main__':
     unittest.main()
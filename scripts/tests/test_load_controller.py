@@ -0,0 +1,61 @@
+import unittest
+
+from load_controller import LoadController
+
+
+class TestLoadController(unittest.TestCase):
+
+    def controller(self, memory_budget: int = None) -> LoadController:
+        return LoadController(num_workers=2, job_batch_size=4, max_in_flight=1000, max_flush_rows=500, memory_budget=memory_budget)
+
+    def test_starts_at_the_upper_bounds(self):
+        controller = self.controller()
+        self.assertEqual(1000, controller.in_flight)
+        self.assertEqual(500, controller.flush_rows)
+        self.assertEqual(500, controller.load_size)
+        self.assertTrue(controller.should_load(500))
+        self.assertFalse(controller.should_load(501))
+
+    def test_slow_jobs_keep_fewer_jobs_in_flight(self):
+        controller = self.controller()
+        controller.observe(jobs=4, seconds=4.0)     # 1s per job, 2 jobs per second
+        self.assertTrue(controller.adjust(force=True))
+        self.assertEqual(int(2 * LoadController.target_queue_seconds), controller.in_flight)
+        self.assertEqual(int(2 * LoadController.fold_seconds), controller.flush_rows)
+
+    def test_growth_is_limited_to_doubling(self):
+        controller = self.controller()
+        controller.in_flight, controller.flush_rows = 10, 10
+        controller.observe(jobs=1, seconds=0.0001)
+        controller.adjust(force=True)
+        self.assertEqual(20, controller.in_flight)
+        self.assertEqual(20, controller.flush_rows)
+
+    def test_memory_pressure_halves_down_to_the_minimum(self):
+        controller = self.controller(memory_budget=1)   # every process is above a budget of one byte
+        if LoadController.resident_memory() is None:
+            self.skipTest("resident memory is not available on this platform")
+        controller.adjust(force=True)
+        self.assertEqual(500, controller.in_flight)
+        self.assertEqual(250, controller.flush_rows)
+        for _ in range(20):
+            controller.adjust(force=True)
+        self.assertEqual(2 * 4, controller.in_flight)
+        self.assertEqual(4, controller.flush_rows)
+
+    def test_adjustments_are_rate_limited(self):
+        controller = self.controller()
+        self.assertFalse(controller.adjust())
+        self.assertTrue(controller.adjust(force=True))
+
+    def test_latency_is_smoothed(self):
+        controller = self.controller()
+        controller.observe(jobs=1, seconds=1.0)
+        controller.observe(jobs=1, seconds=2.0)
+        self.assertAlmostEqual(1.0 + LoadController.latency_smoothing, controller.latency)
+        controller.observe(jobs=0, seconds=5.0)
+        self.assertAlmostEqual(1.0 + LoadController.latency_smoothing, controller.latency)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
+from manifest import WorkloadManifest
+from schemas import Constants, Schemas
+from synthetic import ModelSpec, SyntheticWorkload
+
+
+class TestWorkloadManifest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.workload = SyntheticWorkload(Path(self.temp_dir.name) / "workload", [ModelSpec(4), ModelSpec(5)],
+                                          instances_per_model=10, seed=0)
+        self.workload.run()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_written_manifest(self):
+        manifest = WorkloadManifest.load(self.workload.instances_folder)
+        self.assertTrue(manifest.is_current())
+        self.assertEqual((0, 19), manifest.id_range())
+        self.assertEqual(20, manifest.jobs())
+        self.assertEqual([[[0, 9]], [[10, 19]]], [entry["ranges"] for entry in manifest.models.values()])
+        self.assertEqual(4, len(next(iter(manifest.models.values()))["variables"]))
+
+        # the footers hold everything but the variables
+        scanned = WorkloadManifest.scan(self.workload.instances_folder, manifest)
+        self.assertEqual(manifest.models, scanned.models)
+
+    def test_outdated_manifest(self):
+        manifest = WorkloadManifest.load(self.workload.instances_folder)
+        table = pa.Table.from_pylist([{Constants.ID: 20, Constants.PERMUTATION_ID: "0", Constants.INSTANCE_PERMUTATION: ["a"],
+                                       Constants.MODEL_NAME: "added.mzn"}], schema=Schemas.Parquet.instances)
+        pq.write_to_dataset(table, root_path=self.workload.instances_folder, partition_cols=[Constants.MODEL_NAME])
+        self.assertFalse(manifest.is_current())
+        scanned = WorkloadManifest.scan(self.workload.instances_folder, manifest)
+        self.assertTrue(scanned.is_current())
+        self.assertEqual({"ranges": [[20, 20]], "jobs": 1}, scanned.models["added.mzn"])
+
+    def test_source(self):
+        manifest = WorkloadManifest.load(self.workload.instances_folder)
+        self.assertIsNone(manifest.source(20, 30))
+        con = duckdb.connect()
+        rows = con.execute(f"SELECT {Constants.MODEL_NAME}, COUNT(*) FROM {manifest.source(12, 14)} GROUP BY ALL").fetchall()
+        self.assertEqual([(list(manifest.models)[1], 10)], rows)
+        self.assertEqual(20, con.execute(f"SELECT COUNT(*) FROM {manifest.source()}").fetchone()[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+import json
+import os
+import signal
+import sys
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest.mock import patch
+
+from minizinc_wrapper import CliBackend, MinizincWrapper, ResourceLimits, StubBackend, resource
+from schemas import Constants, Helpers
+
+
+class TestMinizincWrapper(unittest.TestCase):
+
+    fake_minizinc = """
+import sys, time
+mode = sys.argv[1]
+if mode == "echo":
+    print(sys.stdin.read().upper())
+elif mode == "spin":
+    while True:
+        pass
+elif mode == "sleep":
+    time.sleep(30)
+elif mode == "alloc":
+    data = bytearray(1 << 30)
+elif mode == "fail":
+    print("error", file=sys.stderr)
+    sys.exit(1)
+"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.executable = Path(self.temp_dir.name) / "minizinc"
+        self.executable.write_text(f"#!{sys.executable}\n{self.fake_minizinc}")
+        os.chmod(self.executable, 0o755)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_classify(self):
+        no_limits = ResourceLimits()
+        self.assertEqual(MinizincWrapper.STATUS_OK, MinizincWrapper.classify(0, "", no_limits))
+        self.assertEqual(MinizincWrapper.STATUS_ERROR, MinizincWrapper.classify(1, "", no_limits))
+        self.assertEqual(MinizincWrapper.STATUS_ERROR, MinizincWrapper.classify(-signal.SIGKILL, "", no_limits))
+
+        limits = ResourceLimits(cpu_seconds=1, memory_bytes=1024)
+        self.assertEqual(MinizincWrapper.STATUS_CPU_LIMIT, MinizincWrapper.classify(-signal.SIGXCPU, "", limits))
+        self.assertEqual(MinizincWrapper.STATUS_CPU_LIMIT, MinizincWrapper.classify(128 + signal.SIGXCPU, "", limits))
+        self.assertEqual(MinizincWrapper.STATUS_MEMORY_LIMIT,
+                         MinizincWrapper.classify(1, "terminate called after throwing an instance of 'std::bad_alloc'", limits))
+
+    @unittest.skipIf(resource is None, "resource limits are POSIX only")
+    def test_run_with_limits(self):
+        with patch.object(MinizincWrapper, 'minizinc_executable', new=self.executable):
+            result = MinizincWrapper.run("echo", stdin="abc")
+            self.assertEqual((0, ["ABC"], MinizincWrapper.STATUS_OK), tuple(result))
+
+            self.assertEqual(MinizincWrapper.STATUS_ERROR, MinizincWrapper.run("fail").status)
+            self.assertEqual(MinizincWrapper.STATUS_CPU_LIMIT, MinizincWrapper.run("spin", limits=ResourceLimits(cpu_seconds=1)).status)
+            self.assertEqual(MinizincWrapper.STATUS_WALL_TIMEOUT, MinizincWrapper.run("sleep", limits=ResourceLimits(wall_seconds=0.5)).status)
+            self.assertNotEqual(MinizincWrapper.STATUS_OK, MinizincWrapper.run("alloc", limits=ResourceLimits(memory_bytes=256 << 20)).status)
+            self.assertEqual(MinizincWrapper.STATUS_OK, MinizincWrapper.run("alloc").status)
+
+            # limits are applied by the shell, solvers can be spawned from several threads
+            with ThreadPoolExecutor(8) as pool:
+                results = list(pool.map(lambda _: MinizincWrapper.run("echo", stdin="abc", limits=ResourceLimits(cpu_seconds=5)), range(16)))
+            self.assertTrue(all(result.output == ["ABC"] for result in results))
+
+    def test_ulimit_prefix(self):
+        self.assertEqual("exec ", MinizincWrapper.ulimit_prefix(ResourceLimits(wall_seconds=1)))
+        self.assertEqual("ulimit -S -t 2 && ulimit -H -t 3 && ulimit -v 1024 && exec ",
+                         MinizincWrapper.ulimit_prefix(ResourceLimits(cpu_seconds=2, memory_bytes=1 << 20)))
+
+    @unittest.skipIf(resource is None, "resource limits are POSIX only")
+    def test_cli_backend_executable(self):
+        result = CliBackend(self.executable).run("echo", stdin="abc")
+        self.assertEqual(["ABC"], result.output)
+
+    def test_stub_backend(self):
+        stub = StubBackend()
+        fzn = "var 1..3: x;\nvar 1..3: y;\nconstraint int_lt(x, y);\nsolve satisfy;"
+        self.assertEqual(MinizincWrapper.STATUS_OK, stub.run("--model-check-only", stdin=fzn).status)
+
+        result = stub.run("--solver-statistics --json-stream --input-from-stdin", stdin=fzn)
+        self.assertEqual(MinizincWrapper.STATUS_OK, result.status)
+        lines = [line for line in result.output if json.loads(line)[Constants.OUTPUT_TYPE] == Constants.SOLVER_STATISTICS]
+        self.assertEqual(1, len(lines))
+        statistics = Helpers.json_to_solution_statistics_dict(lines[0])
+        self.assertEqual(2, statistics[Constants.VARIABLES])
+
+        # the same input always yields the same statistics
+        self.assertEqual(result, stub.run("--solver-statistics --json-stream --input-from-stdin", stdin=fzn))
+
+        slow = StubBackend(latency=1.0)
+        self.assertEqual(MinizincWrapper.STATUS_WALL_TIMEOUT,
+                         slow.run("--solver-statistics", stdin=fzn, limits=ResourceLimits(wall_seconds=0.01)).status)
+        with self.assertRaises(ValueError):
+            StubBackend(latency_distribution="uniform")
+
+    def test_stub_backend_cutoff(self):
+        stub = StubBackend(failures_median=1000)
+        fzn = "var 1..3: x;\nvar 1..3: y;\nconstraint int_lt(x, y);\nsolve satisfy;"
+        args = "--solver-statistics --json-stream --input-from-stdin"
+
+        def statistics(result):
+            return Helpers.json_to_solution_statistics_dict(result.output[-2])
+
+        unlimited = statistics(stub.run(args, stdin=fzn))
+        self.assertEqual(unlimited, statistics(stub.run(args + f" --fail {unlimited[Constants.FAILURES] + 1}", stdin=fzn)))
+
+        limited = stub.run(args + f" --fail {unlimited[Constants.FAILURES]}", stdin=fzn)
+        self.assertEqual(2, len(limited.output))    # no solution line
+        self.assertEqual(0, statistics(limited)[Constants.SOLUTIONS])
+        self.assertEqual(unlimited[Constants.FAILURES], statistics(limited)[Constants.FAILURES])
+
+        self.assertEqual(5, statistics(stub.run(args + " --node 5", stdin=fzn))[Constants.NODES])
+
+    def test_use_backend(self):
+        backend = MinizincWrapper.backend
+        try:
+            MinizincWrapper.use_backend("stub")
+            self.assertEqual("MiniZinc stub backend", MinizincWrapper.version())
+            with self.assertRaises(ValueError):
+                MinizincWrapper.use_backend("unknown")
+        finally:
+            MinizincWrapper.backend = backend
+            MinizincWrapper.version.cache_clear()
+
+
+if __name__ == '__main__':
+    unittest.main()
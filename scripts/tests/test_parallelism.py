@@ -0,0 +1,79 @@
+import threading
+import time
+import unittest
+
+from parallelism import CoreBudget, ThreadTuner
+
+
+class TestCoreBudget(unittest.TestCase):
+
+    def test_acquire_is_clamped(self):
+        budget = CoreBudget(4)
+        self.assertEqual(4, budget.acquire(16))
+        self.assertEqual(0, budget.available)
+        budget.release(4)
+        self.assertEqual(1, budget.acquire(0))
+
+    def test_concurrency_is_bounded_by_cores(self):
+        budget = CoreBudget(4)
+        running, peak, lock = [0], [0], threading.Lock()
+
+        def job(threads: int):
+            held = budget.acquire(threads)
+            with lock:
+                running[0] += held
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.01)
+            with lock:
+                running[0] -= held
+            budget.release(held)
+
+        workers = [threading.Thread(target=job, args=(n,)) for n in [2, 1, 4, 1, 2, 1, 1, 4]]
+        for t in workers:
+            t.start()
+        for t in workers:
+            t.join()
+        self.assertLessEqual(peak[0], 4)
+        self.assertEqual(4, budget.available)
+
+
+class TestThreadTuner(unittest.TestCase):
+
+    def test_candidates(self):
+        self.assertEqual([1], ThreadTuner(1).candidates())
+        self.assertEqual([1, 2, 4], ThreadTuner(6).candidates())
+        self.assertEqual([1, 2, 4, 8], ThreadTuner(64).candidates())
+
+    def test_choose(self):
+        # perfect speedup up to 4 threads: same throughput, single threaded search is kept
+        self.assertEqual(1, ThreadTuner.choose({1: 8.0, 2: 4.0, 4: 2.0}))
+        # superlinear speedup, e.g. parallel search escapes a bad subtree
+        self.assertEqual(4, ThreadTuner.choose({1: 8.0, 2: 3.0, 4: 1.0}))
+        # parallel search only costs
+        self.assertEqual(1, ThreadTuner.choose({1: 1.0, 2: 0.9, 4: 0.8}))
+
+    def test_tune(self):
+        tuner = ThreadTuner(4)
+        self.assertEqual(1, tuner.threads_for("m"))
+        tuner.tune("m", {1: 10.0, 2: 2.0})
+        self.assertEqual(2, tuner.threads_for("m"))
+
+    def test_choose_remaining(self):
+        # sublinear speedup: single threaded jobs have the higher throughput while every core is busy
+        timings = {1: 8.0, 2: 5.0, 4: 3.0}
+        self.assertEqual(1, ThreadTuner.choose(timings))
+        self.assertEqual(1, ThreadTuner.choose(timings, remaining=100, cores=8))
+        # with fewer jobs than cores the idle cores speed up the jobs left
+        self.assertEqual(4, ThreadTuner.choose(timings, remaining=2, cores=8))
+        self.assertEqual(2, ThreadTuner.choose(timings, remaining=4, cores=8))
+        # too little speedup to give up deterministic statistics
+        self.assertEqual(1, ThreadTuner.choose({1: 8.0, 2: 7.0}, remaining=1, cores=8))
+
+        tuner = ThreadTuner(8)
+        self.assertEqual(1, tuner.tune("m", timings))
+        tuner.remaining = 2
+        self.assertEqual(4, tuner.threads_for("m"))
+
+
+if __name__ == '__main__':
+    unittest.main()
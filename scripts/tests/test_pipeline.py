@@ -0,0 +1,61 @@
+import logging
+import tempfile
+import unittest
+from pathlib import Path
+
+import pyarrow.parquet as pq
+from minizinc_wrapper import MinizincWrapper
+from pipeline import Pipeline
+from schemas import Constants
+from summary import ResultSummary
+from synthetic import ModelSpec, SyntheticModel
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.folder = Path(self.temp_dir.name)
+        self.input_files = []
+        for num, variables in enumerate([4, 5, 6]):
+            model = SyntheticModel(ModelSpec(variables))
+            mzn = self.folder / "problems" / f"prob{num:03}" / model.name
+            mzn.parent.mkdir(parents=True)
+            mzn.write_text(model.flat_zinc)    # the stub backend compiles a FlatZinc model to itself
+            self.input_files.append((f"{num:03}", mzn))
+        self.backend = MinizincWrapper.backend
+        MinizincWrapper.use_backend("stub")
+
+    def tearDown(self):
+        MinizincWrapper.backend = self.backend
+        MinizincWrapper.version.cache_clear()
+        logging.shutdown()
+        self.temp_dir.cleanup()
+
+    def pipeline(self) -> Pipeline:
+        return Pipeline(self.input_files, self.folder / "feature_vectors.parquet", self.folder / "instances",
+                        self.folder / "results", self.folder / "logs", self.folder / "backups", max_perms=20)
+
+    def test_pipeline(self):
+        self.pipeline().run()
+        vectors = pq.read_table(self.folder / "feature_vectors.parquet")
+        self.assertEqual(3, vectors.num_rows)
+        instances = pq.read_table(self.folder / "instances").num_rows
+        results = pq.read_table(self.folder / "results", columns=[Constants.ID])[Constants.ID].to_pylist()
+        self.assertEqual(instances, len(results))
+        self.assertEqual(len(results), len(set(results)))
+        # the Testdriver summarized every result as it was written
+        summary = ResultSummary.read(self.folder / "results")
+        self.assertEqual(3, summary.num_rows)
+        self.assertEqual(len(results), sum(summary[Constants.COUNT].to_pylist()))
+
+        # a second run resumes every stage and solves nothing again
+        pipeline = self.pipeline()
+        self.assertEqual(0, pipeline.testdriver.job_count)
+        pipeline.run()
+        self.assertEqual(instances, pq.read_table(self.folder / "instances").num_rows)
+        self.assertEqual(len(results), pq.read_table(self.folder / "results").num_rows)
+
+
+if __name__ == "__main__":
+    unittest.main()
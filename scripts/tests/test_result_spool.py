@@ -0,0 +1,80 @@
+import random
+import tempfile
+import unittest
+from pathlib import Path
+
+import pyarrow as pa
+from result_spool import ResultSpool
+from schemas import Constants, Schemas
+from synthetic import ModelSpec, SyntheticModel
+
+
+class TestResultSpool(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.spool_folder = Path(self.temp_dir.name) / "_spool"
+        self.folded = {}
+        rng = random.Random(0)
+        self.results = SyntheticModel.results(SyntheticModel(ModelSpec(5)).instances(25, rng), rng)
+        rng.shuffle(self.results)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def fold(self, table: pa.Table, name: str):
+        self.folded[name] = table
+
+    def spool(self) -> ResultSpool:
+        return ResultSpool(self.spool_folder, Schemas.Parquet.instance_results, self.fold, segment_rows=10)
+
+    def test_segments_are_folded_sorted(self):
+        spool = self.spool()
+        spool.start()
+        for result in self.results:
+            spool.append(result)
+        spool.close()
+
+        self.assertEqual([10, 10, 5], [t.num_rows for _, t in sorted(self.folded.items())])
+        for table in self.folded.values():
+            ids = table.column(Constants.ID).to_pylist()
+            self.assertEqual(sorted(ids), ids)
+        all_ids = sorted(i for t in self.folded.values() for i in t.column(Constants.ID).to_pylist())
+        self.assertEqual(list(range(25)), all_ids)
+        self.assertEqual([], spool.segments())
+
+    def test_batches_fill_segments(self):
+        spool = self.spool()
+        spool.start()
+        spool.append_batch(pa.RecordBatch.from_pylist(self.results[:12], schema=Schemas.Parquet.instance_results))
+        spool.append_batch(pa.RecordBatch.from_pylist(self.results[12:], schema=Schemas.Parquet.instance_results))
+        spool.close()
+        # a batch is never split, the first one already fills a segment
+        self.assertEqual([12, 13], [t.num_rows for _, t in sorted(self.folded.items())])
+
+    def test_replay_recovers_torn_segment(self):
+        # a run that was killed: its segment is never closed and the last record is only half written
+        spool = self.spool()
+        spool.open_segment()
+        for result in self.results[:7]:
+            spool.append(result)
+        path = spool.path
+        data = path.read_bytes()
+        path.write_bytes(data[:-20])
+
+        recovered = self.spool().replay()
+        self.assertEqual(6, recovered)
+        self.assertEqual({path.stem}, set(self.folded))
+        self.assertEqual(sorted(r[Constants.ID] for r in self.results[:6]), self.folded[path.stem].column(Constants.ID).to_pylist())
+        self.assertFalse(path.exists())
+
+    def test_empty_segment_is_removed(self):
+        spool = self.spool()
+        spool.start()
+        spool.close()
+        self.assertEqual({}, self.folded)
+        self.assertEqual([], spool.segments())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import random
+import statistics
+import tempfile
+import unittest
+from pathlib import Path
+
+import duckdb
+import pyarrow as pa
+import pyarrow.parquet as pq
+from schemas import Constants, Schemas
+from summary import MetricSummary, QuantileSketch, ResultSummary
+from synthetic import ModelSpec, SyntheticModel, SyntheticWorkload
+
+
+class TestResultSummary(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.folder = Path(self.temp_dir.name)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_sketch(self):
+        rng = random.Random(0)
+        values = [0] * 100 + [rng.lognormvariate(5, 2) for _ in range(10_000)]
+        sketch = QuantileSketch()
+        for value in values:
+            sketch.add(value)
+        values.sort()
+        for q in [0.0, 0.5, 0.9, 0.99, 1.0]:
+            exact = values[int(q * (len(values) - 1))]
+            self.assertLessEqual(abs(sketch.quantile(q) - exact), QuantileSketch.relative_accuracy * exact)
+
+        # merging sketches of two halves gives the sketch of all values
+        first, second = QuantileSketch(), QuantileSketch()
+        for i, value in enumerate(values):
+            (first if i % 2 == 0 else second).add(value)
+        first.merge(second)
+        self.assertEqual(sketch.to_dict(), first.to_dict())
+        self.assertIsNone(QuantileSketch().quantile(0.5))
+
+    def test_metric_merge(self):
+        rng = random.Random(1)
+        values = [rng.randrange(1000) for _ in range(500)]
+        whole, first, second = MetricSummary(), MetricSummary(), MetricSummary()
+        for job_id, value in enumerate(values):
+            whole.add(value, job_id)
+            (first if job_id < 200 else second).add(value, job_id)
+        first.merge(second)
+        self.assertEqual(len(values), first.count)
+        self.assertAlmostEqual(statistics.mean(values), first.mean)
+        self.assertAlmostEqual(statistics.variance(values), first.variance())
+        self.assertEqual((min(values), max(values)), (first.min, first.max))
+        self.assertEqual((values.index(min(values)), values.index(max(values))), (first.argmin, first.argmax))
+        self.assertEqual(whole.sketch.to_dict(), first.sketch.to_dict())
+
+    def test_build_matches_updates(self):
+        workload = SyntheticWorkload(self.folder / "workload", [ModelSpec(4), ModelSpec(5)], instances_per_model=50, seed=0)
+        workload.run()
+        results_folder = self.folder / "results"
+        jobs = pq.read_table(workload.instances_folder).to_pylist()
+        table = pa.Table.from_pylist(SyntheticModel.results(jobs, random.Random(0)), schema=Schemas.Parquet.instance_results)
+        pq.write_to_dataset(table, root_path=results_folder, partition_cols=[Constants.MODEL_NAME])
+
+        updated = ResultSummary(results_folder)
+        updated.update(table.slice(0, 30))
+        updated.update(table.slice(30))
+        updated.save()
+        con = duckdb.connect()
+        built = ResultSummary.build(con, results_folder)
+        self.assertEqual(len(jobs), built.count())
+        for key, summaries in updated.summaries.items():
+            for metric, summary in summaries.items():
+                other = built.summaries[key][metric]
+                self.assertEqual((summary.count, summary.min, summary.max), (other.count, other.min, other.max))
+                self.assertAlmostEqual(summary.mean, other.mean)
+                self.assertAlmostEqual(summary.variance(), other.variance())
+                self.assertEqual(summary.sketch.to_dict(), other.sketch.to_dict())
+
+        # the saved summary covers the results, more results on disk make open() rebuild it
+        summary = ResultSummary.open(con, results_folder)
+        self.assertEqual(updated.to_table(), summary.to_table())
+        pq.write_to_dataset(table.slice(0, 10), root_path=results_folder, partition_cols=[Constants.MODEL_NAME])
+        self.assertEqual(len(jobs) + 10, ResultSummary.open(con, results_folder).count())
+        self.assertEqual(len(jobs) + 10, sum(ResultSummary.read(results_folder)[Constants.COUNT].to_pylist()))
+        # dataset readers do not see the summary
+        self.assertEqual(len(jobs) + 10, pq.read_table(results_folder).num_rows)
+        con.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
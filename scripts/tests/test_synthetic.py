@@ -0,0 +1,61 @@
+import random
+import tempfile
+import unittest
+from pathlib import Path
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from flatzinc_index import FlatZincIndex
+from instance_generator import FlatZincInstanceGenerator
+from schemas import Constants, Schemas
+from synthetic import ModelSpec, SyntheticModel, SyntheticWorkload
+
+
+class TestSyntheticModel(unittest.TestCase):
+
+    def test_flat_zinc(self):
+        model = SyntheticModel(ModelSpec(12))
+        self.assertEqual(model.variables, FlatZincInstanceGenerator.extract_variables(model.flat_zinc))
+        self.assertEqual("x", FlatZincIndex(model.flat_zinc).search_array_name())
+        self.assertIn("int_search(x,input_order,", FlatZincInstanceGenerator.ensure_input_order_annotation(model.flat_zinc))
+        self.assertEqual(12, model.flat_zinc.count("constraint "))
+
+    def test_anonymous_search_and_padding(self):
+        model = SyntheticModel(ModelSpec(4, constraints=9, anonymous_search=True, target_bytes=10_000))
+        index = FlatZincIndex(model.flat_zinc)
+        self.assertIsNone(index.search_array_name())
+        self.assertEqual(model.variables, index.variables())
+        self.assertGreaterEqual(len(model.flat_zinc), 10_000)
+        self.assertEqual(9 + model.padding, model.flat_zinc.count("constraint "))
+        # all declarations precede the first constraint
+        self.assertLess(model.flat_zinc.rindex("var 1.."), model.flat_zinc.index("constraint "))
+
+    def test_rows_match_schemas(self):
+        rng = random.Random(0)
+        model = SyntheticModel(ModelSpec(7, target_bytes=2_000))
+        vector = model.feature_vector()
+        self.assertEqual(7 + model.padding, vector[Constants.FLAT_INT_VARS])
+        pa.Table.from_pylist([vector], schema=Schemas.Parquet.feature_vector).validate(full=True)
+
+        instances = model.instances(20, rng, first_id=100)
+        self.assertEqual(list(range(100, 120)), [i[Constants.ID] for i in instances])
+        for instance in instances:
+            ordering = FlatZincInstanceGenerator.generate_nth_permutation(sorted(model.variables), int(instance[Constants.PERMUTATION_ID]))
+            self.assertEqual(ordering, instance[Constants.INSTANCE_PERMUTATION])
+        pa.Table.from_pylist(instances, schema=Schemas.Parquet.instances).validate(full=True)
+        pa.Table.from_pylist(SyntheticModel.results(instances, rng), schema=Schemas.Parquet.instance_results).validate(full=True)
+
+    def test_workload(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output = Path(temp_dir)
+            SyntheticWorkload(output, [ModelSpec(3), ModelSpec(6)], instances_per_model=10, seed=1).run()
+
+            self.assertEqual(2, len(list((output / "models").glob("*.fzn"))))
+            self.assertEqual(2, pq.read_table(output / "feature_vectors.parquet", schema=Schemas.Parquet.feature_vector).num_rows)
+            instances = pq.ParquetDataset(output / "instances", schema=Schemas.Parquet.instances).read().to_pylist()
+            self.assertEqual(6 + 10, len(instances))   # 3 variables only have 6 orderings
+            self.assertEqual(list(range(16)), sorted(i[Constants.ID] for i in instances))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,18 @@
 import logging
 import os
 import queue
+import random
 import unittest
 import tempfile
 from pathlib import Path
+from unittest.mock import patch
 
+import pyarrow as pa
 import pyarrow.parquet as pq
-from testdriver import Testdriver
-from schemas import Schemas
+from minizinc_wrapper import MinizincWrapper
+from synthetic import ModelSpec, SyntheticModel, SyntheticWorkload
+from testdriver import SolverConfiguration, Testdriver
+from schemas import Constants, Schemas
 
 
 class TestTestdriver(unittest.TestCase):
@@ -42,10 +47,159 @@ class TestTestdriver(unittest.TestCase):
 
         results = []
         while not td.result_queue.empty():
-            results.append(td.result_queue.get())
+            batch = td.result_queue.get()
+            results.extend(batch.results.to_pylist())
+            self.assertEqual([], batch.failed)
 
         self.assertEqual(len(results), 4)
 
+    def test_matrix_mode(self):
+        workload = Path(self.temp_dir.name) / "workload"
+        SyntheticWorkload(workload, [ModelSpec(4), ModelSpec(5)], instances_per_model=10, seed=0).run()
+        # vectors extracted for both solvers, chuffed gets FlatZinc of its own
+        vectors = pq.read_table(workload / "feature_vectors.parquet")
+        chuffed_zinc = [fzn.replace("solve", "var 1..3: X_CHUFFED_;\nsolve", 1) for fzn in vectors[Constants.FLAT_ZINC].to_pylist()]
+        chuffed = vectors.set_column(vectors.schema.get_field_index(Constants.FLAT_ZINC), vectors.schema.field(Constants.FLAT_ZINC), pa.array(chuffed_zinc))
+        tagged = pa.concat_tables([table.append_column(Schemas.Parquet.backend_field, pa.array([solver] * table.num_rows))
+                                   for table, solver in [(vectors, "gecode"), (chuffed, "chuffed")]])
+        pq.write_table(tagged, workload / "tagged.parquet")
+        backend = MinizincWrapper.backend
+        MinizincWrapper.use_backend("stub")
+
+        def solve(configurations: list[SolverConfiguration]) -> list[dict]:
+            td = Testdriver(feature_vector_parquet=workload / "tagged.parquet",
+                            workload_parquet_folder=workload / "instances",
+                            output_folder=self.output_parquet,
+                            backup_path=self.no_parquet,
+                            log_path=self.no_parquet,
+                            configurations=configurations)
+            td.load_next_job_batch(logger=TestTestdriver.NullLogger())
+            td.worker(td.job_queue, td.result_queue, td.solver_vectors, TestTestdriver.NullLogger(), 0,
+                      configurations=configurations)
+            rows = []
+            while not td.result_queue.empty():
+                batch = td.result_queue.get()
+                self.assertEqual([], batch.failed)
+                td.write_table(pa.Table.from_batches([batch.results]), f"part_{{i}}_{len(configurations)}_{len(rows)}.parquet")
+                rows.extend(batch.results.to_pylist())
+            return rows
+
+        try:
+            first_fail = SolverConfiguration.parse("first_fail@gecode")
+            rows = solve([first_fail])
+            self.assertEqual(20, len(rows))
+            self.assertEqual({"first_fail@gecode"}, {row[Constants.CONFIGURATION] for row in rows})
+
+            # a second configuration on the same output solves only what is missing
+            chuffed = SolverConfiguration.parse("@chuffed")
+            self.assertEqual(SolverConfiguration("@chuffed", "chuffed", "input_order"), chuffed)
+            with patch.object(Testdriver, 'run_solver', wraps=Testdriver.run_solver) as run_solver:
+                rows = solve([first_fail, chuffed])
+                self.assertTrue(all("X_CHUFFED_" in call.args[1] for call in run_solver.call_args_list))
+            self.assertEqual(20, len(rows))
+            self.assertEqual({"@chuffed"}, {row[Constants.CONFIGURATION] for row in rows})
+            self.assertEqual([], solve([first_fail, chuffed]))
+
+            # untagged vectors were compiled for the default solver only
+            with self.assertRaises(ValueError):
+                Testdriver(feature_vector_parquet=workload / "feature_vectors.parquet",
+                           workload_parquet_folder=workload / "instances",
+                           output_folder=self.output_parquet,
+                           backup_path=self.no_parquet,
+                           log_path=self.no_parquet,
+                           configurations=[chuffed])
+        finally:
+            MinizincWrapper.backend = backend
+            MinizincWrapper.version.cache_clear()
+
+    def test_result_per_job(self):
+        workload = Path(self.temp_dir.name) / "workload"
+        SyntheticWorkload(workload, [ModelSpec(4)], instances_per_model=20, seed=0).run()
+        backend = MinizincWrapper.backend
+        jobs = pq.read_table(workload / "instances").to_pylist()
+
+        def batches(claims: list[list[dict]]) -> list:
+            job_queue, result_queue = queue.Queue(), queue.Queue()
+            for claim in claims:
+                job_queue.put(claim)
+            Testdriver.worker(job_queue, result_queue, feature_vectors, TestTestdriver.NullLogger(), 0)
+            return [result_queue.get_nowait() for _ in range(result_queue.qsize())]
+
+        try:
+            MinizincWrapper.use_backend("stub")
+            feature_vectors = Testdriver.load_feature_vectors(workload / "feature_vectors.parquet")
+            # fast jobs come back as one batch per claim
+            self.assertEqual([8, 8, 4], [batch.results.num_rows for batch in batches([jobs[:8], jobs[8:16], jobs[16:]])])
+            # a claim larger than job_batch_size is split
+            with patch.object(Testdriver, 'job_batch_size', 6):
+                self.assertEqual([6, 6, 6, 2], [batch.jobs for batch in batches([jobs])])
+            # slow jobs do not hold back the solves of their claim that finished before
+            MinizincWrapper.use_backend("stub", latency=0.05)
+            with patch.object(Testdriver, 'result_flush_seconds', 0.0):
+                self.assertEqual([1] * 5, [batch.results.num_rows for batch in batches([jobs[:5]])])
+        finally:
+            MinizincWrapper.backend = backend
+            MinizincWrapper.version.cache_clear()
+
+    def test_non_contiguous_model(self):
+        workload = Path(self.temp_dir.name) / "workload"
+        SyntheticWorkload(workload, [ModelSpec(4), ModelSpec(5)], instances_per_model=10, seed=0).run()
+        instances = pq.read_table(workload / "instances").sort_by(Constants.ID).to_pylist()
+        first, second = instances[0][Constants.MODEL_NAME], instances[10][Constants.MODEL_NAME]
+        # appended instances of the first model get ids after those of the second
+        appended = [row | {Constants.ID: row[Constants.ID] + 20, Constants.PERMUTATION_ID: str(int(row[Constants.PERMUTATION_ID]) + 10)}
+                    for row in instances[:10]]
+        pq.write_to_dataset(pa.Table.from_pylist(appended, schema=Schemas.Parquet.instances), root_path=workload / "instances",
+                            partition_cols=[Constants.MODEL_NAME])
+        results = SyntheticModel.results(instances[10:], random.Random(0))
+        pq.write_to_dataset(pa.Table.from_pylist(results, schema=Schemas.Parquet.instance_results), root_path=self.output_parquet,
+                            partition_cols=[Constants.MODEL_NAME])
+
+        td = Testdriver(feature_vector_parquet=workload / "feature_vectors.parquet",
+                        workload_parquet_folder=workload / "instances",
+                        output_folder=self.output_parquet,
+                        backup_path=self.no_parquet,
+                        log_path=self.no_parquet)
+        self.assertEqual({first: 20, second: 0}, td.remaining_jobs())
+        self.assertEqual(20, td.job_count)
+
+    def test_matrix_mode_with_catalog(self):
+        workload = Path(self.temp_dir.name) / "workload"
+        SyntheticWorkload(workload, [ModelSpec(4), ModelSpec(5)], instances_per_model=10, seed=0).run()
+        instances = pq.read_table(workload / "instances").sort_by(Constants.ID).to_pylist()
+        first, second = instances[0][Constants.MODEL_NAME], instances[10][Constants.MODEL_NAME]
+        configuration = SolverConfiguration.parse("first_fail@gecode")
+        results = [row | {Constants.CONFIGURATION: configuration.name} for row in SyntheticModel.results(instances[10:], random.Random(0))]
+        pq.write_to_dataset(pa.Table.from_pylist(results, schema=Testdriver.results_schema_for(configuration=True)),
+                            root_path=self.output_parquet, partition_cols=[Constants.MODEL_NAME])
+
+        # the catalog describes the workload, the finished jobs come from the configurations of the results
+        td = Testdriver(feature_vector_parquet=workload / "feature_vectors.parquet",
+                        workload_parquet_folder=workload / "instances",
+                        output_folder=self.output_parquet,
+                        backup_path=self.no_parquet,
+                        log_path=self.no_parquet,
+                        configurations=[configuration],
+                        catalog_file=Path(self.temp_dir.name) / "catalog.duckdb")
+        self.assertEqual({first: 10, second: 0}, td.remaining_jobs())
+        self.assertEqual(10, td.job_count)
+
+    def test_rejects_backend_tagged_vectors(self):
+        workload = Path(self.temp_dir.name) / "workload"
+        SyntheticWorkload(workload, [ModelSpec(4)], instances_per_model=5, seed=0).run()
+        vectors = pq.read_table(workload / "feature_vectors.parquet")
+        tagged = pa.concat_tables([vectors.append_column(Schemas.Parquet.backend_field, pa.array([backend] * vectors.num_rows))
+                                   for backend in ["cp", "gecode"]])
+        pq.write_table(tagged, workload / "tagged.parquet")
+
+        # every model is in the file once per backend, the driver can not tell which FlatZinc to solve
+        with self.assertRaises(ValueError):
+            Testdriver(feature_vector_parquet=workload / "tagged.parquet",
+                       workload_parquet_folder=workload / "instances",
+                       output_folder=self.output_parquet,
+                       backup_path=self.no_parquet,
+                       log_path=self.no_parquet)
+
     def test_main(self):
         testdriver = Testdriver(feature_vector_parquet=self.feature_vector_parquet,
                                 workload_parquet_folder=self.workload_parquet,
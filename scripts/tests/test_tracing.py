@@ -0,0 +1,73 @@
+import json
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from tracing import Tracer
+
+
+class TestTracer(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.trace_file = Path(self.temp_dir.name) / "trace.json"
+
+    def tearDown(self):
+        Tracer.disable()
+        self.temp_dir.cleanup()
+
+    def test_disabled(self):
+        Tracer.disable()
+        with Tracer.span("job") as span:
+            span.set("status", "ok")
+        self.assertIs(Tracer.null_span, span)
+
+    def test_export(self):
+        Tracer.configure(self.trace_file)
+
+        def job():
+            with Tracer.span("job", "testdriver", id=1):
+                with Tracer.span("solve", "solver") as span:
+                    span.set("status", "ok")
+
+        t = threading.Thread(target=job, name="worker-1")
+        t.start()
+        t.join()
+        Tracer.export()
+
+        trace = json.loads(self.trace_file.read_text())
+        spans = {e["name"]: e for e in trace["traceEvents"] if e["ph"] == "X"}
+        self.assertEqual({"job", "solve"}, set(spans))
+        self.assertEqual({"status": "ok"}, spans["solve"]["args"])
+        self.assertEqual({"id": 1}, spans["job"]["args"])
+        # the nested span lies within its parent on the same thread
+        self.assertEqual(spans["job"]["tid"], spans["solve"]["tid"])
+        self.assertLessEqual(spans["job"]["ts"], spans["solve"]["ts"])
+        self.assertGreaterEqual(spans["job"]["ts"] + spans["job"]["dur"], spans["solve"]["ts"] + spans["solve"]["dur"])
+        names = [e["args"]["name"] for e in trace["traceEvents"] if e["ph"] == "M"]
+        self.assertIn("worker-1", names)
+
+    def test_sampling_keeps_traces_complete(self):
+        Tracer.configure(self.trace_file, sample_rate=0.5, seed=3)
+        for i in range(200):
+            with Tracer.span("job", id=i):
+                with Tracer.span("solve", id=i):
+                    pass
+
+        jobs = [e["args"]["id"] for e in Tracer.events if e["name"] == "job"]
+        solves = [e["args"]["id"] for e in Tracer.events if e["name"] == "solve"]
+        self.assertEqual(sorted(jobs), sorted(solves))
+        self.assertTrue(50 < len(jobs) < 150)
+
+    def test_error_is_recorded(self):
+        Tracer.configure(self.trace_file)
+        with self.assertRaises(KeyError):
+            with Tracer.span("job"):
+                raise KeyError()
+        self.assertEqual("KeyError", Tracer.events[0]["args"]["error"])
+        self.assertEqual(0, Tracer.local.depth)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,157 @@
+import atexit
+import json
+import os
+import random
+import threading
+import time
+from pathlib import Path
+
+"""
+Span that records nothing. Tracer.span hands out this single instance while tracing is off or a trace is not sampled,
+so an instrumented call costs one function call and a flag check.
+"""
+class NullSpan:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def set(self, key: str, value):
+        pass
+
+
+"""
+Stands in for the spans of a trace that is not sampled. It only tracks the nesting depth,
+so the spans nested inside do not start traces of their own.
+"""
+class SkippedSpan(NullSpan):
+
+    def __enter__(self):
+        Tracer.local.depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        Tracer.local.depth -= 1
+        return False
+
+
+class Span:
+
+    def __init__(self, name: str, category: str, args: dict):
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        Tracer.local.depth += 1
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.perf_counter_ns()
+        Tracer.local.depth -= 1
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        Tracer.record({
+            "name": self.name,
+            "cat": self.category,
+            "ph": "X",
+            "ts": (self.start - Tracer.origin) / 1000,
+            "dur": (end - self.start) / 1000,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": self.args,
+        })
+        return False
+
+    def set(self, key: str, value):
+        """Attaches a value that is only known at the end of the span, e.g. an exit status."""
+        self.args[key] = value
+
+
+"""
+Collects per stage spans of a run and exports them in the Chrome trace event format,
+which chrome://tracing and ui.perfetto.dev open as a timeline per thread.
+Sampling decides once per outermost span (e.g. one job), nested spans follow that decision so traces stay complete.
+"""
+class Tracer:
+
+    enabled = False
+    sample_rate = 1.0
+    max_events = 1_000_000      # bounds memory on long runs, later spans are counted as dropped
+    output_file: Path | None = None
+
+    null_span = NullSpan()
+    skipped_span = SkippedSpan()
+    events: list[dict] = []
+    thread_names: dict[int, str] = {}
+    dropped = 0
+    origin = time.perf_counter_ns()
+    rng = random.Random()
+    local = threading.local()
+
+    @staticmethod
+    def configure(output_file: Path, sample_rate: float = 1.0, seed: int = None):
+        """Enables tracing. The trace is written to output_file when the process exits, or by export()."""
+        if not 0 < sample_rate <= 1:
+            raise ValueError("Sample rate must be in (0, 1]")
+        Tracer.enabled = True
+        Tracer.output_file = output_file
+        Tracer.sample_rate = sample_rate
+        Tracer.rng = random.Random(seed)
+        Tracer.events = []
+        Tracer.thread_names = {}
+        Tracer.dropped = 0
+        Tracer.origin = time.perf_counter_ns()
+
+    @staticmethod
+    def disable():
+        Tracer.enabled = False
+
+    @staticmethod
+    def span(name: str, category: str = "pipeline", **args) -> NullSpan | Span:
+        if not Tracer.enabled:
+            return Tracer.null_span
+
+        local = Tracer.local
+        if not hasattr(local, "depth"):
+            local.depth = 0     # first span of this thread
+            Tracer.thread_names[threading.get_ident()] = threading.current_thread().name
+        if local.depth == 0:
+            local.sampled = Tracer.sample_rate >= 1 or Tracer.rng.random() < Tracer.sample_rate
+        if not local.sampled:
+            return Tracer.skipped_span
+        return Span(name, category, args)
+
+    @staticmethod
+    def record(event: dict):
+        if len(Tracer.events) < Tracer.max_events:
+            Tracer.events.append(event)     # list.append is atomic, worker threads need no lock
+        else:
+            Tracer.dropped += 1
+
+    @staticmethod
+    def chrome_trace() -> dict:
+        metadata = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+                    for tid, name in Tracer.thread_names.items()]
+        return {
+            "traceEvents": metadata + Tracer.events,
+            "displayTimeUnit": "ms",
+            "otherData": {"sampleRate": Tracer.sample_rate, "droppedEvents": Tracer.dropped},
+        }
+
+    @staticmethod
+    def export(output_file: Path = None):
+        output_file = output_file if output_file is not None else Tracer.output_file
+        if output_file is None or not Tracer.enabled:
+            return
+        tmp_file = Path(f"{output_file}.tmp")
+        with open(tmp_file, "w") as f:
+            json.dump(Tracer.chrome_trace(), f)
+        os.replace(tmp_file, output_file)
+        print(f"INF: Wrote {len(Tracer.events)} trace events to {output_file} ({Tracer.dropped} dropped).")
+
+
+atexit.register(Tracer.export)   # a no-op unless tracing was configured